@@ -46,9 +46,10 @@ def fix(steps: list, result_type: str, controls):
     # if any of x y z are None, warn the user:      
     if any(val is None for val in (point0.x, point0.y, point0.z)):
         print(f"warning - the first point in the design should have all x y z values defined\n   - it is currently ({point0}) ... any x/y/z currently `None` will be set to 0 - fix this issue before printing")
-        point0.x = point0.x or 0
-        point0.y = point0.y or 0
-        point0.z = point0.z or 0
+        # the point is replaced in a copy of the list of steps since it may be immutable (FrozenPoint)
+        new_point0 = point0.with_(x=point0.x or 0, y=point0.y or 0, z=point0.z or 0)
+        steps = [new_point0 if step is point0 else step for step in steps]
+        point0 = new_point0
     
     if result_type == 'plot' and controls.color_type == 'manual':
         if point0.color is None:
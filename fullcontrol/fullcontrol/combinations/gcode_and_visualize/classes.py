@@ -2,7 +2,8 @@
 
 import fullcontrol.gcode as gc
 import fullcontrol.visualize as vis
-from fullcontrol.base import BaseModelPlus
+from fullcontrol.base import BaseModelPlus, check_fields
+from pydantic import __version__
 
 
 # inherit attributes to generate both gcode and visualization data
@@ -71,6 +72,37 @@ class Point(gc.Point, vis.Point):
     pass
 
 
+class FrozenPoint(Point):
+    '''
+    An immutable, hashable Point. Attributes can't be changed after it is created - use with_() to get a new
+    FrozenPoint with some attributes changed, e.g. point.with_(z=0.4).
+
+    FrozenPoints can be used anywhere Points are. Since they can't be edited, fullcontrol's geometry functions and
+    copy.deepcopy() share them instead of copying them, so a design can re-use the same FrozenPoint many times without
+    the time and memory of copies. A FrozenPoint's color list must not be edited either.
+    '''
+    if int(__version__.split('.')[0]) >= 2:
+        model_config = {**Point.model_config, 'frozen': True}
+    else:
+        class Config:
+            extra = 'allow'
+            allow_mutation = False
+
+    def __hash__(self):
+        return hash((self.x, self.y, self.z, tuple(self.color) if self.color != None else None))
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def with_(self, **changes) -> 'FrozenPoint':
+        'return a FrozenPoint with the given attributes changed (this FrozenPoint is returned if nothing changes)'
+        check_fields(vars(self).keys(), changes, type(self).__name__)
+        changes = {key: float(value) if key in ('x', 'y', 'z') and value != None else value for key, value in changes.items() if value != self[key]}
+        if not changes:
+            return self
+        return self.model_copy(update=changes) if int(__version__.split('.')[0]) >= 2 else self.copy(update=changes)
+
+
 class Extruder(gc.Extruder, vis.Extruder):
     '''
     Represents an extruder in a 3D printer.
@@ -9,9 +9,12 @@ from fullcontrol.common import fix
 from fullcontrol.common import check, flatten, linspace, export_design, import_design, points_only, relative_point, first_point, last_point
 from fullcontrol.geometry import *
 from fullcontrol.visualize.bounding_box import BoundingBox
+from fullcontrol.profiling import Profiler, MemoryTracker, track_phase
+from fullcontrol.gcode.index import GcodeIndex
+from fullcontrol.gcode.limits import check_limits
 
 
-def transform(steps: list, result_type: str, controls: Union[GcodeControls, PlotControls] = None, show_tips: bool = True):
+def transform(steps: list, result_type: str, controls: Union[GcodeControls, PlotControls] = None, show_tips: bool = True, profiler: Profiler = None):
     '''
     Transform a fullcontrol design (a list of class instances) into the specified result_type.
     
@@ -19,6 +22,11 @@ def transform(steps: list, result_type: str, controls: Union[GcodeControls, Plot
         - steps (list): A list of function class instances representing the fullcontrol design.
         - result_type (str): The desired result type. Valid options are "gcode" or "plot".
         - controls (Union[GcodeControls, PlotControls], optional): Controls to customize the generation of gcode or plot. Defaults to None.
+          Set controls.profile=True to print a table of the time and memory of each phase and each type of step.
+        - show_tips (bool, optional): Whether to print tips about the controls. Defaults to True.
+        - profiler (Profiler, optional): If supplied, the time and memory of each phase and each type of step are recorded in it, so the
+          results can be retrieved with profiler.results() (controls are not changed). Call profiler.stop() afterwards to stop tracing memory.
+          Set controls.memory_report=True to trace memory in each phase and print a report, and/or controls.memory_budget (MB) to limit memory for large designs (results are also saved in controls.memory_results).
     
     Returns:
         - The transformed result based on the specified result_type.
@@ -31,17 +39,55 @@ def transform(steps: list, result_type: str, controls: Union[GcodeControls, Plot
     '''
 
     
-    if result_type == 'gcode':
-        from fullcontrol.gcode.steps2gcode import gcode
-        if controls is None: controls = GcodeControls()
-        steps = fix(steps, result_type, controls)
-        return gcode(steps, controls, show_tips)
-
-    elif result_type == 'plot':
-        from fullcontrol.visualize.steps2visualization import visualize
-        if controls is None: controls = PlotControls()
-        steps = fix(steps, result_type, controls)
-        return visualize(steps, controls, show_tips)
-    
-    else:
-        raise ValueError(f"result_type '{result_type}' not recognized. Please use 'gcode' or 'plot' of fclab.transform()")
+    supplied_profiler, memory = profiler, None
+    try:
+        if result_type == 'gcode':
+            from fullcontrol.gcode.steps2gcode import gcode
+            if controls is None: controls = GcodeControls()
+            profiler, memory = trackers(controls, profiler)
+            with track_phase('fix', profiler, memory):
+                steps = fix(steps, result_type, controls)
+            result = gcode(steps, controls, show_tips, profiler, memory)
+
+        elif result_type == 'plot':
+            from fullcontrol.visualize.steps2visualization import visualize
+            if controls is None: controls = PlotControls()
+            profiler, memory = trackers(controls, profiler)
+            with track_phase('fix', profiler, memory):
+                steps = fix(steps, result_type, controls)
+            result = visualize(steps, controls, show_tips, profiler, memory)
+        
+        else:
+            raise ValueError(f"result_type '{result_type}' not recognized. Please use 'gcode' or 'plot' of fclab.transform()")
+    finally:
+        # stop tracing memory even if the transform fails, so tracemalloc doesn't keep slowing everything down
+        if memory != None:
+            memory.stop()
+        if profiler != None and profiler is not supplied_profiler:
+            profiler.stop()
+
+    if profiler != None and controls.profile:
+        print(f'fc.transform profile (result_type={result_type}):\n{profiler.table()}')
+    if memory != None:
+        if memory.budget_mb != None:
+            for name, (peak, net, process) in memory.records.items():
+                if process != None and process > memory.budget_mb:
+                    memory.notes.append(f"the process first exceeded the memory budget by the end of phase '{name}' ({process:.1f} MB)")
+                    break
+        controls.memory_results = memory.results()
+        if controls.memory_report:
+            print(f'fc.transform memory report (result_type={result_type}):\n{memory.table()}')
+        else:
+            for note in memory.notes:
+                print(f'warning: {note}')
+    return result
+
+
+def trackers(controls: Union[GcodeControls, PlotControls], profiler: Profiler = None) -> tuple:
+    'return a Profiler (the supplied one, if any) and a MemoryTracker for fc.transform(), or None for each one not requested'
+    if profiler == None and controls.profile:
+        profiler = Profiler()
+    # memory allocations are only traced for a report, since tracing slows execution. a budget alone only needs the
+    # memory used by the process
+    memory = MemoryTracker(controls.memory_budget, trace=controls.memory_report) if controls.memory_report or controls.memory_budget != None else None
+    return profiler, memory
@@ -17,6 +17,14 @@ default_initial_settings = {
     "dia_feed": 1.75,
     "travel_format": "G0",  # options: "G0" / "G1_E0"
     "primer": "front_lines_then_y",
+    # machine limits checked by fullcontrol.gcode.limits (None = not checked). build volume (mm) from the origin
+    "build_volume_origin": None,  # 'corner' (0 to build_volume_x/y) or 'centre' (+/- build_volume_x/y/2). x/y are not checked if None
+    "build_volume_x": None,
+    "build_volume_y": None,
+    "build_volume_z": None,
+    "max_speed": None,  # mm/min - for all print and travel moves
+    "max_speed_z": None,  # mm/min - for the z component of moves
+    "max_volumetric_flow": None,  # mm3/s
     "printer_command_list": {
         "home": "G28 ; home axes",
         "retract": "G10 ; retract",
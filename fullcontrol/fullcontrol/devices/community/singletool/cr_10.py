@@ -7,7 +7,7 @@ def set_up(user_overrides: dict):
 
     # copy the ender_3 initialization data except change one line in the starting procedure
     import fullcontrol.devices.community.singletool.ender_3
-    initialization_data = fullcontrol.devices.community.singletool.ender_3.set_up(user_overrides)
+    initialization_data = fullcontrol.devices.community.singletool.ender_3.set_up({'build_volume_origin': 'corner', 'build_volume_x': 300, 'build_volume_y': 300, 'build_volume_z': 400, **user_overrides})
     initialization_data['starting_procedure_steps'][1] = ManualGcode(text=';MAXX:300\n;MAXY:300\n;MAXZ:400\n')
 
     return initialization_data
@@ -7,7 +7,7 @@ def set_up(user_overrides: dict):
     '''
 
     # overrides for this specific printer relative those defined in base_settings.py
-    printer_overrides = {'primer': 'no_primer', "nozzle_probe_temp": 170}
+    printer_overrides = {'primer': 'no_primer', "nozzle_probe_temp": 170, 'build_volume_origin': 'corner', 'build_volume_x': 180, 'build_volume_y': 180, 'build_volume_z': 180}
     # update default initialization settings with printer-specific overrides and user-defined overrides
     initialization_data = {**base_settings.default_initial_settings, **printer_overrides}
     initialization_data = {**initialization_data, **user_overrides}
@@ -1,6 +1,5 @@
 from fullcontrol.common import Point
 from itertools import chain
-from copy import deepcopy
 from typing import Union
 
 
@@ -27,11 +26,13 @@ def points_only(steps: list, track_xyz: bool = True) -> list:
             new_steps.append(step)
     if track_xyz:
         for i in range(len(new_steps)-1):
-            # fill in any None attributes for the next point with the most recent previous value:
-            next_point = deepcopy(new_steps[i])
-            # update values that are not None
-            next_point.update_from(new_steps[i+1])
-            new_steps[i+1] = next_point
+            # fill in any None attributes for the next point with the most recent previous value. with_() returns
+            # a copy, or the same point for FrozenPoints that don't change, which are shared rather than copied
+            previous, following = new_steps[i], new_steps[i+1]
+            if type(following) is type(previous):
+                new_steps[i+1] = following.with_(**{key: value for key, value in vars(previous).items() if value is not None and following[key] is None})
+            else:
+                new_steps[i+1] = previous.with_(**{key: value for key, value in vars(following).items() if value is not None and key in vars(previous)})
         # delete initial elements prior to all of x y and z have values != None:
         loop = True
         while loop:
@@ -73,9 +74,7 @@ def relative_point(reference: Union[Point, list], x_offset: float, y_offset: flo
         raise Exception(f'The reference object must be a Point or a list containing at least one point')
     if None in [pt.x, pt.y, pt.z]:
         raise Exception(f'The reference point must have all of x, y, z attributes defined (x={pt.x}, y={pt.y}, z={pt.z})')
-    new_pt = deepcopy(pt)
-    new_pt.x, new_pt.y, new_pt.z = pt.x + x_offset, pt.y + y_offset, pt.z + z_offset
-    return new_pt
+    return pt.with_(x=pt.x + x_offset, y=pt.y + y_offset, z=pt.z + z_offset)
 
 
 def flatten(steps: list) -> list:
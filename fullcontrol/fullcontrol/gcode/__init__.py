@@ -7,6 +7,8 @@ from fullcontrol.gcode.printer import Printer
 from fullcontrol.gcode.auxilliary_components import Fan, Hotend, Buildplate
 from fullcontrol.gcode.extrusion_classes import ExtrusionGeometry, StationaryExtrusion, Extruder
 from fullcontrol.gcode.annotations import GcodeComment
+from fullcontrol.gcode.index import GcodeIndex
 
 # import functions
 from fullcontrol.gcode.steps2gcode import gcode
+from fullcontrol.gcode.limits import check_limits
@@ -1,5 +1,5 @@
 
-from typing import Optional
+from typing import Optional, Union
 from pydantic import BaseModel
 
 
@@ -12,11 +12,29 @@ class GcodeControls(BaseModel):
         initialization_data (Optional[dict]): Values passed for initialization_data overwrite the default initialization_data of the printer. Defaults to an empty dictionary.
         save_as (Optional[str]): The file name to save the gcode as. Defaults to None resulting in no file being saved.
         include_date (Optional[bool]): Whether to include the date in the filename. Defaults to True.
+        stream_to_file (Optional[bool]): Whether to write gcode to the save_as file as it is generated, without holding the whole gcode in memory. fc.transform() then returns the filename instead of the gcode. Requires save_as. Defaults to False.
+        profile (Optional[bool]): Whether to record the time, call count and python memory (net and peak, traced with tracemalloc, which slows execution) of each phase of fc.transform() and each type of step, and print a table of results. To retrieve the results, pass a Profiler to fc.transform(). Defaults to False.
+        memory_report (Optional[bool]): Whether to track the peak and net python memory allocations (with tracemalloc, which slows execution) of each phase of fc.transform() and print a report. Defaults to False.
+        memory_budget (Optional[float]): Memory budget (MB) for fc.transform(). If set, the memory used by the process is checked (without tracing allocations, unless memory_report is True) and if the gcode would exceed the budget: with save_as set, it is streamed to file as for stream_to_file (and fc.transform() returns the filename); without save_as, the gcode is still returned as a string in memory, and is only joined in chunks to reduce the peak memory of joining. Defaults to None.
+        index (Optional[Union[str, int]]): If set (and save_as is set), a sidecar index is saved with the gcode file (as <filename>.index.json) for random access to layers or lines with fullcontrol.gcode.index.GcodeIndex. 'layers' for an entry per layer, or an integer for an entry every 'index' lines. Each entry records byte offset, line, step, z range, cumulative E and estimated time. Defaults to None.
+        check_limits (Optional[bool]): Whether to check that the design is within the printer's build volume and speed/volumetric flow limits (build_volume_x/y/z, max_speed, max_speed_z and max_volumetric_flow in the printer's initialization_data) and print a warning with the step indices of any violations. Defaults to True.
+        limit_results (Optional[dict]): Violations of printer limits (see fullcontrol.gcode.limits.check_limits), set by fc.transform() if check_limits is True.
+        thumbnails (Optional[list]): (width, height) in pixels of thumbnails of the design to render and embed in the start of the gcode as base64 PNG comment blocks, for printer screens and host software, e.g. [(16, 16), (220, 124)]. Defaults to None (no thumbnails).
+        memory_results (Optional[dict]): Results of memory tracking, set by fc.transform() if memory_report is True or memory_budget is set.
     """
     printer_name: Optional[str] = None
     initialization_data: Optional[dict] = {} # values passed for initialization_data overwrite the default initialization_data of the printer
     save_as: Optional[str] = None
     include_date: Optional[bool] = True
+    stream_to_file: Optional[bool] = False
+    profile: Optional[bool] = False
+    memory_report: Optional[bool] = False
+    memory_budget: Optional[float] = None  # MB
+    memory_results: Optional[dict] = None  # set by fc.transform() if memory_report is True or memory_budget is set
+    index: Optional[Union[str, int]] = None  # 'layers' or number of lines per index entry
+    check_limits: Optional[bool] = True
+    limit_results: Optional[dict] = None  # set by fc.transform() if check_limits is True
+    thumbnails: Optional[list] = None  # [(width, height), ...] in pixels
 
     def initialize(self):
         if self.printer_name is None:
@@ -5,6 +5,7 @@ from copy import deepcopy
 from fullcontrol.gcode import Extruder, ManualGcode, Buildplate, Hotend, Fan
 import fullcontrol.devices.community.singletool.base_settings as base_settings
 from importlib import import_module, resources
+from functools import lru_cache
 
 
 def load_json(library, file_name):
@@ -33,16 +34,24 @@ def replace_gcode_variables(printer_name: str, gcode_type: str, data: dict):
         data[gcode_type] = new_start_end_gcode
 
 
-def import_printer(printer_name: str, user_overrides: dict):
+@lru_cache(maxsize=None)
+def printer_settings(printer_name: str) -> dict:
+    '''return the default settings of a printer in the cura or community library. the result is cached so each printer 
+    profile is only resolved once per process (e.g. when many designs are transformed in a batch) - do not edit it'''
     library_name = 'cura' if printer_name[:5] == 'Cura/' else 'community_minimal'
     printer_name = printer_name[5:] if library_name == 'cura' else printer_name[10:]
     library = load_json(library_name, os.path.join('library.json'))
-    data = import_module(f'fullcontrol.devices.{library_name}.settings.{library[printer_name]}').default_initial_settings
+    # copied so that the library module is not edited (the speed conversion below would otherwise be repeated each time)
+    data = dict(import_module(f'fullcontrol.devices.{library_name}.settings.{library[printer_name]}').default_initial_settings)
     if library_name == 'cura':
         data['print_speed'] = int(data['print_speed']*60)
         data['travel_speed'] = int(data['travel_speed']*60)
-    data = {**base_settings.default_initial_settings, **data}
-    data = {**data, **user_overrides}
+    return {**base_settings.default_initial_settings, **data}
+
+
+def import_printer(printer_name: str, user_overrides: dict):
+    data = {**deepcopy(printer_settings(printer_name)), **user_overrides}
+    printer_name = printer_name[5:] if printer_name[:5] == 'Cura/' else printer_name[10:]
     original_start_gcode = deepcopy(data['start_gcode'])
     replace_gcode_variables(printer_name, 'start_gcode', data)
     replace_gcode_variables(printer_name, 'end_gcode', data)
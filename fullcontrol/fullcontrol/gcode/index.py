@@ -0,0 +1,162 @@
+import json
+import os
+from bisect import bisect_right
+from typing import Union
+
+# a sidecar index is saved next to a gcode file (as <gcode filename>.index.json) to allow random access to layers or
+# ranges of lines without scanning the file from the start. the index has one entry per layer (or per 'interval' lines)
+# and is saved as columns to keep it compact. each entry records the state at the start of the entry (i.e. at the end
+# of the previous line), which is what is needed to resume a print from there:
+#   line: index of the first line of the entry (lines are counted from 0)
+#   offset: byte offset of the first line of the entry
+#   step: index of the step (in the list of steps after fc.fix() and the addition of start/end procedures and the
+#         primer) that generated the first line of the entry, or None for gcode not generated by fullcontrol
+#   layer: layer number of the entry
+#   x, y, z: position at the start of the entry
+#   e: cumulative extrusion (in E units) at the start of the entry
+#   time: estimated print time (seconds) at the start of the entry, based on distance and feedrate only
+#   z_min, z_max: range of z of extruding moves in the entry (None if there are no extruding moves)
+INDEX_COLUMNS = ['line', 'offset', 'step', 'layer', 'x', 'y', 'z', 'e', 'time', 'z_min', 'z_max']
+
+
+def index_filename(gcode_filename: str) -> str:
+    return gcode_filename + '.index.json'
+
+
+def save_index(gcode_filename: str, columns: dict, mode: Union[str, int], total_lines: int, total_bytes: int):
+    'save a sidecar index for a gcode file'
+    index = {'version': 1, 'mode': mode, 'gcode_lines': total_lines, 'gcode_bytes': total_bytes, 'columns': columns}
+    with open(index_filename(gcode_filename), 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+
+
+class IndexBuilder:
+    '''
+    Builds a sidecar index while lines of gcode are generated by fullcontrol.gcode.steps2gcode.gcode_lines().
+
+    snapshot(state) is called after each step that generates gcode, and add(line, snapshot) is called for each line
+    that is released (lines are released one step late, since some steps edit the previous line). mode is 'layers' for
+    an entry at the start of each layer, or an integer for an entry every 'mode' lines. A new layer starts at the
+    first extruding move at least half an extrusion height above the start of the current layer.
+    '''
+
+    def __init__(self, mode: Union[str, int]):
+        if mode != 'layers' and not (isinstance(mode, int) and mode > 0):
+            raise Exception(f"GcodeControls.index must be 'layers' or a positive integer (number of lines per index entry), not {mode!r}")
+        self.mode = mode
+        self.columns = {name: [] for name in INDEX_COLUMNS}
+        self.line, self.offset, self.time = 0, 0, 0.0
+        self.position = (None, None, None)
+        self.previous = (None, None, None, 0.0, 0.0)  # (x, y, z, e, time) at the end of the last line
+        self.layer, self.layer_z = -1, None
+
+    def snapshot(self, state) -> tuple:
+        'return (step index, x, y, z, e, time, extruding, layer height) after the current step'
+        point = state.point
+        position = (point.x, point.y, point.z)
+        distance = sum((a - b)**2 for a, b in zip(position, self.position) if a != None and b != None)**0.5
+        extruding = state.extruder.on == True and distance > 0
+        speed = state.printer.print_speed if state.extruder.on else state.printer.travel_speed
+        if distance > 0 and speed:
+            self.time += 60*distance/speed
+        self.position = position
+        e = state.extruder.total_volume*state.extruder.volume_to_e if state.extruder.volume_to_e != None else 0.0
+        return (state.i, *position, e, self.time, extruding, state.extrusion_geometry.height)
+
+    def add(self, line: str, snapshot: tuple):
+        'record a released line of gcode (which may contain several lines)'
+        step, x, y, z, e, time, extruding, height = snapshot
+        columns = self.columns
+        new_layer = extruding and z != None and (self.layer_z == None or z >= self.layer_z + 0.5*(height or 0.2))
+        if new_layer:
+            self.layer, self.layer_z = self.layer + 1, z
+        if self.mode == 'layers':
+            new_entry = new_layer
+        else:
+            new_entry = len(columns['line']) == 0 or self.line >= columns['line'][-1] + self.mode
+        if new_entry:
+            for name, value in zip(INDEX_COLUMNS, (self.line, self.offset, step, max(self.layer, 0), *self.previous, None, None)):
+                columns[name].append(value)
+        if extruding and z != None and columns['line']:
+            columns['z_min'][-1] = z if columns['z_min'][-1] == None else min(columns['z_min'][-1], z)
+            columns['z_max'][-1] = z if columns['z_max'][-1] == None else max(columns['z_max'][-1], z)
+        self.previous = (x, y, z, e, time)
+        self.line += line.count('\n') + 1
+        self.offset += (len(line) if line.isascii() else len(line.encode())) + 1
+
+    def save(self, gcode_filename: str):
+        # the last line of a file is not followed by a newline
+        save_index(gcode_filename, self.columns, self.mode, self.line, max(self.offset - 1, 0))
+
+
+class GcodeIndex:
+    '''
+    Random access to a gcode file using its sidecar index (see GcodeControls.index). The index is checked against the
+    size of the gcode file, in case the file has been edited since it was indexed.
+
+    Example:
+        index = GcodeIndex('my_design.gcode')
+        gcode = index.read_layers(900)  # gcode of layer 900
+        lines = index.read_lines(100000, 100050)
+        state = index.entry(index.layer_entry(900))  # position, e and time at the start of layer 900 (to resume a print)
+    '''
+
+    def __init__(self, gcode_filename: str):
+        self.filename = gcode_filename
+        with open(index_filename(gcode_filename)) as f:
+            index = json.load(f)
+        if os.path.getsize(gcode_filename) != index['gcode_bytes']:
+            raise Exception(f'the index of {gcode_filename} does not match the file (the file size has changed since it was indexed)')
+        self.mode = index['mode']
+        self.lines, self.bytes = index['gcode_lines'], index['gcode_bytes']
+        self.columns = index['columns']
+
+    def __len__(self):
+        return len(self.columns['line'])
+
+    def entry(self, n: int) -> dict:
+        'return entry n of the index as a dictionary'
+        return {name: values[n] for name, values in self.columns.items()}
+
+    def line_entry(self, line: int) -> int:
+        'return the number of the last entry starting at or before line'
+        return max(bisect_right(self.columns['line'], line) - 1, 0)
+
+    def layer_entry(self, layer: int) -> int:
+        'return the number of the entry at the start of layer'
+        if self.mode != 'layers':
+            raise Exception("the gcode was indexed by lines, not layers - use GcodeControls.index='layers' to read layers")
+        if not 0 <= layer < len(self):
+            raise Exception(f'layer {layer} not found - the gcode has {len(self)} layers')
+        return layer
+
+    def read_bytes(self, start: int, end: int = None) -> str:
+        'return the gcode between two byte offsets (end=None for the end of the file)'
+        with open(self.filename, 'rb') as f:
+            f.seek(start)
+            return f.read((end if end != None else self.bytes) - start).decode()
+
+    def entry_offsets(self, first: int, last: int) -> tuple:
+        'return the byte offsets of the start of entry first and the end of entry last'
+        offsets = self.columns['offset']
+        return offsets[first], offsets[last + 1] - 1 if last + 1 < len(self) else None
+
+    def read_layers(self, first: int, last: int = None) -> str:
+        'return the gcode of layers first to last (inclusive, last=None for only the first layer)'
+        last = first if last == None else last
+        return self.read_bytes(*self.entry_offsets(self.layer_entry(first), self.layer_entry(last)))
+
+    def read_lines(self, start: int, stop: int) -> list:
+        'return lines start to stop (excluding stop), reading from the nearest index entry before start'
+        entry = bisect_right(self.columns['line'], start) - 1
+        # lines before the first entry (e.g. start gcode before the first layer) are read from the start of the file
+        offset, first_line = (self.columns['offset'][entry], self.columns['line'][entry]) if entry >= 0 else (0, 0)
+        lines = []
+        with open(self.filename, 'rb') as f:
+            f.seek(offset)
+            for line_number, line in enumerate(f, first_line):
+                if line_number >= stop:
+                    break
+                if line_number >= start:
+                    lines.append(line.decode().rstrip('\n'))
+        return lines
@@ -0,0 +1,179 @@
+import numpy as np
+from math import pi
+from fullcontrol.common import Point, Printer, Extruder, ExtrusionGeometry, StationaryExtrusion
+from fullcontrol.gcode.controls import GcodeControls
+
+# speeds and flows are only reported if they exceed their limit by more than this fraction, so values calculated to be
+# exactly at a limit (e.g. by lab.fullcontrol.limit_flow) aren't reported because of floating-point error
+LIMIT_TOLERANCE = 1e-9
+
+
+def design_arrays(steps: list, initialization_data: dict) -> dict:
+    '''
+    Collect the points of a design, and the speed and extrusion settings in force for each point, into numpy arrays.
+
+    Coordinates of all Points are gathered with list comprehensions (None becomes nan) and only the other steps are
+    processed one at a time, each recording the point from which its change takes effect. Partially-defined Points are
+    then forward-filled, and settings are expanded to one value per point, with numpy.
+
+    Args:
+        steps (list): A 1D list of steps.
+        initialization_data (dict): Initialization data of the printer (speeds and extrusion geometry at the start).
+
+    Returns:
+        dict: 'step' (index in steps of each point), 'xyz' (n, 3), 'on', 'speed' (mm/min of the move to each point),
+        'print_speed' (print speed in force at each point, even if the extruder is off), 'area' (mm2 of the extrudate of the move to each point),
+        'width' (mm, extrusion width of the move to each point) and 'stationary' ((step, volume, speed) of each StationaryExtrusion).
+    '''
+    is_point = np.array([isinstance(step, Point) for step in steps], dtype=bool)
+    point_steps = np.flatnonzero(is_point)
+    points = [steps[index] for index in point_steps.tolist()]
+    xyz = np.empty((len(points), 3))
+    xyz[:, 0] = np.array([point.x for point in points], dtype=float)
+    xyz[:, 1] = np.array([point.y for point in points], dtype=float)
+    xyz[:, 2] = np.array([point.z for point in points], dtype=float)
+
+    printer = Printer(print_speed=initialization_data['print_speed'], travel_speed=initialization_data['travel_speed'])
+    geometry = ExtrusionGeometry(area_model=initialization_data['area_model'], width=initialization_data['extrusion_width'],
+                                 height=initialization_data['extrusion_height'])
+    geometry.update_area()
+    on = True  # primers finish with the extruder on
+    # settings changes: (step index, on, print speed, travel speed, area, width)
+    changes = [(-1, on, printer.print_speed, printer.travel_speed, geometry.area, geometry.width)]
+    stationary = []
+    for index in np.flatnonzero(~is_point).tolist():
+        step = steps[index]
+        if isinstance(step, (Extruder, Printer, ExtrusionGeometry)):
+            if isinstance(step, Extruder):
+                on = step.on if step.on != None else on
+            elif isinstance(step, Printer):
+                printer.update_from(step)
+            else:
+                geometry.update_from(step)
+                try:
+                    geometry.update_area()
+                except:
+                    pass  # in case not all parameters set yet
+            changes.append((index, on, printer.print_speed, printer.travel_speed, geometry.area, geometry.width))
+        elif isinstance(step, StationaryExtrusion):
+            stationary.append((index, step.volume, step.speed))
+
+    # forward-fill undefined coordinates with the previous defined value
+    defined = ~np.isnan(xyz)
+    last_defined = np.where(defined, np.arange(len(xyz))[:, None], 0)
+    np.maximum.accumulate(last_defined, axis=0, out=last_defined)
+    xyz = np.take_along_axis(xyz, last_defined, axis=0)
+
+    # the last change before each point applies to it
+    start, change_on, print_speed, travel_speed, area, width = (np.array(column, dtype=float) for column in zip(*changes))
+    applied = np.searchsorted(start, point_steps, side='right') - 1
+    on = change_on[applied].astype(bool)
+    return {'step': point_steps, 'xyz': xyz, 'on': on,
+            'speed': np.where(on, print_speed[applied], travel_speed[applied]), 'print_speed': print_speed[applied], 'area': area[applied],
+            'width': width[applied], 'stationary': np.array(stationary, dtype=float).reshape(-1, 3)}
+
+
+def limit_violations(arrays: dict, initialization_data: dict) -> dict:
+    '''
+    Check the arrays of a design (from design_arrays) against the machine limits in initialization_data. Limits that
+    are not set (None) are not checked.
+
+    - 'build_volume': points outside 0 <= z <= build_volume_z and, depending on build_volume_origin, outside
+      0 <= x/y <= build_volume_x/y ('corner') or -build_volume_x/y/2 <= x/y <= build_volume_x/y/2 ('centre'). x/y are
+      not checked if build_volume_origin is None (unknown, e.g. for Cura profiles)
+    - 'max_speed': moves with a feedrate above max_speed (mm/min)
+    - 'max_speed_z': moves with a z component of feedrate above max_speed_z (mm/min)
+    - 'max_volumetric_flow': extruding moves or StationaryExtrusions with a volumetric flow above max_volumetric_flow (mm3/s)
+
+    Speeds and flows must exceed their limit by more than the relative tolerance LIMIT_TOLERANCE to be reported.
+
+    Returns:
+        dict: {check: {'steps': array of step indices, 'values': array of the value that exceeded the limit, 'limit': limit}}
+        for each check with violations.
+    '''
+    violations = {}
+
+    def add(check: str, steps: np.ndarray, values: np.ndarray, limit: float, exceeded: np.ndarray):
+        exceeded = np.flatnonzero(exceeded)
+        if len(exceeded) > 0:
+            violations[check] = {'steps': steps[exceeded], 'values': values(exceeded) if callable(values) else values[exceeded], 'limit': limit}
+
+    steps, xyz = arrays['step'], arrays['xyz']
+    volume = [initialization_data.get(f'build_volume_{axis}') for axis in 'xyz']
+    origin = initialization_data.get('build_volume_origin')
+    if origin not in (None, 'corner', 'centre'):
+        raise ValueError(f"build_volume_origin must be 'corner', 'centre' or None, not {origin!r}")
+    if origin == None:
+        volume[:2] = None, None
+    if any(limit != None for limit in volume):
+        upper = np.array([np.inf if limit == None else limit for limit in volume], dtype=float)
+        lower = np.zeros(3)
+        if origin == 'centre':
+            lower[:2], upper[:2] = -upper[:2]/2, upper[:2]/2
+        lower[np.isinf(upper)] = -np.inf
+        outside = ((xyz < lower) | (xyz > upper)).any(axis=1)
+        # the value reported is the distance outside the build volume (only calculated for points outside it)
+        distance = lambda rows: np.nan_to_num(np.maximum(lower - xyz[rows], xyz[rows] - upper), nan=-np.inf).max(axis=1)
+        add('build_volume', steps, distance, tuple(volume), outside)
+
+    # moves are from each point to the next
+    move_steps, speed = steps[1:], arrays['speed'][1:]
+    max_speed = initialization_data.get('max_speed')
+    if max_speed != None:
+        add('max_speed', move_steps, speed, max_speed, speed > max_speed*(1 + LIMIT_TOLERANCE))
+    max_speed_z = initialization_data.get('max_speed_z')
+    if max_speed_z != None and len(xyz) > 1:
+        delta = np.nan_to_num(np.diff(xyz, axis=0))
+        length = np.linalg.norm(delta, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            speed_z = np.where(length > 0, speed*np.abs(delta[:, 2])/length, 0)
+        add('max_speed_z', move_steps, speed_z, max_speed_z, speed_z > max_speed_z*(1 + LIMIT_TOLERANCE))
+    max_flow = initialization_data.get('max_volumetric_flow')
+    if max_flow != None:
+        flow = np.where(arrays['on'][1:], speed/60*arrays['area'][1:], 0)
+        # StationaryExtrusion speed is the feedrate of E, which is mm of feedstock or mm3 depending on e_units
+        stationary = arrays['stationary']
+        e_to_volume = 1 if initialization_data['e_units'] == 'mm3' else pi*(initialization_data['dia_feed']/2)**2
+        stationary_flow = np.where(stationary[:, 1] > 0, stationary[:, 2]/60*e_to_volume, 0)
+        add('max_volumetric_flow', np.concatenate([move_steps, stationary[:, 0].astype(np.int64)]),
+            np.concatenate([flow, stationary_flow]), max_flow, np.concatenate([flow, stationary_flow]) > max_flow*(1 + LIMIT_TOLERANCE))
+    return violations
+
+
+def violations_report(violations: dict, examples: int = 5) -> str:
+    'return a warning describing each type of violation, with the step indices of the first few examples'
+    units = {'build_volume': 'mm outside', 'max_speed': 'mm/min', 'max_speed_z': 'mm/min', 'max_volumetric_flow': 'mm3/s'}
+    lines = []
+    for check, violation in violations.items():
+        steps = ', '.join(str(step) for step in violation['steps'][:examples].tolist())
+        more = ' ...' if len(violation['steps']) > examples else ''
+        lines.append(f"warning - {len(violation['steps'])} steps exceed the printer limit {check}={violation['limit']}"
+                     f" by up to {violation['values'].max():.6g} {units[check]}\n   - steps: {steps}{more}")
+    return '\n'.join(lines)
+
+
+def check_limits(steps: list, gcode_controls: GcodeControls = None, initialization_data: dict = None, show: bool = True) -> dict:
+    '''
+    Check that the points of a design are within the build volume of the printer and that speeds and volumetric flow
+    are within the limits of the printer. Limits are read from the printer's initialization data (build_volume_x/y/z
+    and build_volume_origin, max_speed, max_speed_z and max_volumetric_flow), which can be set or overridden with
+    GcodeControls.initialization_data. fc.transform() runs this check unless GcodeControls.check_limits is False.
+
+    Args:
+        steps (list): A 1D list of steps (design only, without the printer's starting procedure or primer).
+        gcode_controls (GcodeControls, optional): Controls identifying the printer and initialization_data overrides.
+        initialization_data (dict, optional): Initialization data of the printer, if already resolved from gcode_controls.
+        show (bool, optional): Whether to print a warning for violations. Defaults to True.
+
+    Returns:
+        dict: {check: {'steps', 'values', 'limit'}} for each limit exceeded (see limit_violations()).
+    '''
+    if initialization_data == None:
+        from fullcontrol.gcode.state import printer_initialization_data
+        if gcode_controls == None: gcode_controls = GcodeControls()
+        gcode_controls.initialize()
+        initialization_data = printer_initialization_data(gcode_controls)
+    violations = limit_violations(design_arrays(steps, initialization_data), initialization_data)
+    if show and violations:
+        print(violations_report(violations))
+    return violations
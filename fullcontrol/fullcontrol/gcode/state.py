@@ -10,6 +10,14 @@ from fullcontrol.common import first_point
 from fullcontrol.gcode.import_printer import import_printer
 
 
+def printer_initialization_data(gcode_controls: GcodeControls) -> dict:
+    'return the default initialization_data of the named printer, updated with initialization_data over-rides passed by designer in gcode_controls'
+    if gcode_controls.printer_name[:5] == 'Cura/' or gcode_controls.printer_name[:10] == 'Community/':
+        # note if using 'no_primer' there is a risk that no initial Point is defined before the first G1 command meaning length calculation for the line is impossible and an error will occur
+        return import_printer(gcode_controls.printer_name, gcode_controls.initialization_data)
+    return import_module(f'fullcontrol.devices.community.singletool.{gcode_controls.printer_name}').set_up(gcode_controls.initialization_data)
+
+
 class State(BaseModel):
     '''
     This class tracks the state of instances of interest adjusted in the list 
@@ -25,6 +33,7 @@ class State(BaseModel):
         point (Optional[Point]): The current point.
         i (Optional[int]): The current index.
         gcode (Optional[list]): The list of Gcode.
+        initialization_data (Optional[dict]): The initialization data of the printer, including over-rides from GcodeControls.
 
     Methods:
         __init__: Initializes the State object.
@@ -38,6 +47,7 @@ class State(BaseModel):
     point: Optional[Point] = Point()
     i: Optional[int] = 0
     gcode: Optional[list] = []
+    initialization_data: Optional[dict] = None
 
     def __init__(self, steps: list, gcode_controls: GcodeControls):
         """
@@ -52,12 +62,7 @@ class State(BaseModel):
         """
         super().__init__()
         # initialize state based on the named-printer default initialization_data and initialization_data over-rides passed by designer in gcode_controls
-
-        if gcode_controls.printer_name[:5] == 'Cura/' or gcode_controls.printer_name[:10] == 'Community/':
-            initialization_data = import_printer(gcode_controls.printer_name, gcode_controls.initialization_data)
-            # note if using 'no_primer' there is a risk that no initial Point is defined before the first G1 command meaning length calculation for the line is impossible and an error will occur
-        else:
-            initialization_data = import_module(f'fullcontrol.devices.community.singletool.{gcode_controls.printer_name}').set_up(gcode_controls.initialization_data)
+        self.initialization_data = initialization_data = printer_initialization_data(gcode_controls)
 
         self.extruder = Extruder(
             units=initialization_data['e_units'],
@@ -7,35 +7,184 @@ from fullcontrol.gcode.state import State
 from fullcontrol.gcode.controls import GcodeControls
 from datetime import datetime
 from fullcontrol.gcode.tips import tips
+from fullcontrol.gcode.index import IndexBuilder
+from fullcontrol.gcode.limits import check_limits
+from fullcontrol.gcode.thumbnail import thumbnail_gcode
+from fullcontrol.profiling import Profiler, MemoryTracker, track_phase
+from itertools import islice, chain
+from sys import getsizeof
 
 
-def gcode(steps: list, gcode_controls: GcodeControls, show_tips: bool):
+def gcode_lines(steps: list, gcode_controls: GcodeControls, show_tips: bool, profiler: Profiler = None, memory: MemoryTracker = None, index: IndexBuilder = None, progress: dict = None):
     '''
-    Generate a gcode string from a list of steps.
+    Generate lines of gcode one at a time from a list of steps, so gcode can be written or processed without
+    holding the whole gcode string in memory.
 
     Args:
         steps (list): A list of step objects.
-        gcode_controls (GcodeControls, optional): An instance of GcodeControls class. Defaults to GcodeControls().
+        gcode_controls (GcodeControls): An instance of GcodeControls class.
+        show_tips (bool): Whether to print tips about the gcode controls.
+        profiler (Profiler, optional): If supplied, the time and memory of initialization (including the primer) and of each step are recorded.
+        memory (MemoryTracker, optional): If supplied, the memory used by initialization (including the primer) is recorded.
+        index (IndexBuilder, optional): If supplied, each line is added to the index as it is released.
+        progress (dict, optional): If supplied, progress['state'] is set to the State used to generate the gcode, so the
+            number of steps processed so far (state.i of len(state.steps)) can be checked between lines.
 
-    Returns:
-        str: The generated gcode string.
+    Yields:
+        str: Each line of gcode (without a newline character).
     '''
     gcode_controls.initialize()
     if show_tips: tips(gcode_controls)
 
-    state = State(steps, gcode_controls)
+    with track_phase('primer', profiler, memory):
+        state = State(steps, gcode_controls)
+    if progress != None:
+        progress['state'] = state
+    if gcode_controls.check_limits:
+        with track_phase('check limits', profiler, memory):
+            gcode_controls.limit_results = check_limits(steps, initialization_data=state.initialization_data)
+    if gcode_controls.thumbnails:
+        # thumbnails are at the start of the gcode, where firmware and host software look for them
+        with track_phase('thumbnails', profiler, memory):
+            thumbnail_lines = thumbnail_gcode(steps, gcode_controls.thumbnails, state.initialization_data)
+        if index != None:
+            index.add(thumbnail_lines, index.snapshot(state))
+        yield thumbnail_lines
+    snapshots = []  # index snapshots of the state after each line in state.gcode was generated
     # need a while loop because some classes may change the length of state.steps
     while state.i < len(state.steps):
         # call the gcode function of each class instance in 'steps'
-        gcode_line = state.steps[state.i].gcode(state)
+        step = state.steps[state.i]
+        gcode_line = step.gcode(state) if profiler == None else profiler.step(step, step.gcode, state)
         if gcode_line != None:
             state.gcode.append(gcode_line)
+            if index != None:
+                snapshots.append(index.snapshot(state))
+            # a line is only released once the next line exists, since some steps add text to the end of the previous line
+            if len(state.gcode) > 1:
+                line = state.gcode.pop(0)
+                if index != None:
+                    index.add(line, snapshots.pop(0))
+                yield line
         state.i += 1
-    gc = '\n'.join(state.gcode)
+    for line in state.gcode:
+        if index != None:
+            index.add(line, snapshots.pop(0))
+        yield line
+
+
+def join_in_chunks(lines, chunk_size: int = 10000) -> str:
+    '''
+    Join lines of gcode with newline characters, one chunk of lines at a time. This avoids holding every line in memory
+    as a separate string (which takes several times more memory than the joined gcode for short lines).
+
+    Args:
+        lines (iterable): Lines of gcode.
+        chunk_size (int, optional): Number of lines joined at a time. Defaults to 10000.
+
+    Returns:
+        str: The joined gcode.
+    '''
+    chunks = []
+    while chunk := list(islice(lines, chunk_size)):
+        chunks.append('\n'.join(chunk))
+    return '\n'.join(chunks)
+
+
+def write_in_chunks(lines, filename: str, chunk_size: int = 10000):
+    '''
+    Write lines of gcode to a file as they are generated, one chunk of lines at a time, without holding the whole gcode
+    in memory.
+
+    Args:
+        lines (iterable): Lines of gcode.
+        filename (str): The file to write.
+        chunk_size (int, optional): Number of lines written at a time. Defaults to 10000.
+    '''
+    with open(filename, 'w') as f:
+        separator = ''
+        while chunk := list(islice(lines, chunk_size)):
+            f.write(separator + '\n'.join(chunk))
+            separator = '\n'
+
+
+def gcode(steps: list, gcode_controls: GcodeControls, show_tips: bool, profiler: Profiler = None, memory: MemoryTracker = None):
+    '''
+    Generate a gcode string from a list of steps.
 
+    If gcode_controls.stream_to_file is True, gcode is written to the gcode_controls.save_as file as it is generated
+    and the filename is returned instead of the gcode string. If a MemoryTracker with a memory budget is supplied, the
+    memory needed to hold the gcode is estimated from the first lines generated, and if the budget would be exceeded:
+    with gcode_controls.save_as set, the gcode is streamed to file in the same way (and the filename is returned);
+    without it, the gcode string is still returned in memory but is joined in chunks to reduce the peak memory of
+    joining.
+
+    Args:
+        steps (list): A list of step objects.
+        gcode_controls (GcodeControls, optional): An instance of GcodeControls class. Defaults to GcodeControls().
+        profiler (Profiler, optional): If supplied, the generation, join and write phases and each step are recorded.
+        memory (MemoryTracker, optional): If supplied, the memory used in each phase is recorded and any memory budget is applied.
+
+    Returns:
+        str: The generated gcode string (or the filename if the gcode was streamed to file).
+    '''
+    filename = None
     if gcode_controls.save_as != None:
         filename = gcode_controls.save_as
         filename += datetime.now().strftime("__%d-%m-%Y__%H-%M-%S.gcode") if gcode_controls.include_date == True else '.gcode'
-        open(filename, 'w').write(gc)
+    if gcode_controls.stream_to_file and filename == None:
+        raise ValueError('GcodeControls.stream_to_file requires GcodeControls.save_as to be set')
+
+    # the index is only saved alongside a gcode file, since it records byte offsets in the file
+    index = IndexBuilder(gcode_controls.index) if gcode_controls.index != None and filename != None else None
+    progress = {}
+    lines = gcode_lines(steps, gcode_controls, show_tips, profiler, memory, index, progress)
+    if gcode_controls.stream_to_file:
+        with track_phase('generation and write (streamed)', profiler, memory):
+            write_in_chunks(lines, filename)
+        if index != None:
+            index.save(filename)
+        return filename
+    if profiler == None and memory == None:
+        gc = '\n'.join(lines)
+    else:
+        if memory != None and memory.budget_mb != None:
+            # estimate the memory needed for all lines (each a separate string in a list) and the joined gcode, from
+            # the size of the first lines and the number of lines generated per step so far
+            with track_phase('generation (first lines)', profiler, memory):
+                first_lines = list(islice(lines, 1000))
+            bytes_per_line = sum(getsizeof(line) + 8 + len(line) + 1 for line in first_lines)/max(len(first_lines), 1)
+            state = progress.get('state')
+            if state != None and state.i < len(state.steps):
+                remaining_lines = len(first_lines)/max(state.i, 1)*(len(state.steps) - state.i)
+            else:
+                remaining_lines = 0  # all lines have been generated
+            estimate_mb = bytes_per_line*(len(first_lines) + remaining_lines)/1e6
+            lines = chain(first_lines, lines)
+            if memory.would_exceed(estimate_mb) and filename != None:
+                memory.notes.append(f'gcode ({estimate_mb:.1f} MB estimated) would exceed the memory budget - it was streamed to {filename} and the filename was returned instead of the gcode')
+                with track_phase('generation and write (streamed)', profiler, memory):
+                    write_in_chunks(lines, filename)
+                if index != None:
+                    index.save(filename)
+                return filename
+            if memory.would_exceed(estimate_mb):
+                memory.notes.append(f'gcode ({estimate_mb:.1f} MB estimated) would exceed the memory budget - it was joined in chunks to reduce peak memory, but is still held in memory. set GcodeControls.save_as to stream gcode directly to file')
+                with track_phase('generation and join (chunked)', profiler, memory):
+                    gc = join_in_chunks(lines)
+                lines = None
+        if lines != None:
+            # lines are generated before joining so that the two phases are recorded separately
+            with track_phase('generation', profiler, memory):
+                lines = list(lines)
+            with track_phase('join', profiler, memory):
+                gc = '\n'.join(lines)
+            del lines
+
+    if filename != None:
+        with track_phase('write', profiler, memory):
+            open(filename, 'w').write(gc)
+        if index != None:
+            index.save(filename)
 
     return gc
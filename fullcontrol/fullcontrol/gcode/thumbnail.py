@@ -0,0 +1,201 @@
+import base64
+import struct
+import zlib
+import numpy as np
+from fullcontrol.gcode.limits import design_arrays
+
+# thumbnails of a design are rendered with numpy only (no plotly, browser or GUI). extruding moves are projected into
+# the image and sampled at intervals of no more than a pixel, and each sample is drawn as a disc with the extrusion
+# width. the closest sample is kept for each pixel (a z-buffer) with numpy.maximum.at of a key combining quantised depth
+# and sample index. rendered images are encoded as PNG and embedded in gcode as base64 comment blocks
+# ('; thumbnail begin WxH length' ... '; thumbnail end'), which printer firmware and host software read from the start
+# of the file
+
+THUMBNAIL_LINE_LENGTH = 78  # characters of base64 per comment line
+MAX_SAMPLES = 20000000  # samples are spaced further apart for very large designs to limit memory use
+
+
+def view_vectors(azimuth: float, elevation: float) -> tuple:
+    '''return unit vectors (right, up, towards the viewer) for a view from azimuth (degrees anticlockwise from the
+    front, i.e. from -y) and elevation (degrees above horizontal)'''
+    azimuth, elevation = np.radians(azimuth), np.radians(elevation)
+    right = np.array([np.cos(azimuth), np.sin(azimuth), 0])
+    up = np.array([-np.sin(azimuth)*np.sin(elevation), np.cos(azimuth)*np.sin(elevation), np.cos(elevation)])
+    towards = np.array([np.sin(azimuth)*np.cos(elevation), -np.cos(azimuth)*np.cos(elevation), np.sin(elevation)])
+    return right, up, towards
+
+
+def z_gradient_colors(xyz: np.ndarray, points: np.ndarray = None) -> np.ndarray:
+    'colours [r, g, b] (0-1) of points (all points if None) as for PlotControls(color_type="z_gradient")'
+    z = np.nan_to_num(xyz[:, 2])
+    z_min, z_range = (z.min(), np.ptp(z)) if len(z) > 0 else (0, 0)
+    z = z if points is None else z[points]
+    colors = np.zeros((len(z), 3))
+    colors[:, 1] = (z - z_min)/z_range if z_range > 0 else 0
+    colors[:, 2] = 1
+    return colors
+
+
+def render(xyz: np.ndarray, on: np.ndarray, width: np.ndarray = None, colors: np.ndarray = None, size: tuple = (220, 124),
+           azimuth: float = 30, elevation: float = 35, margin: float = 0.05, background: tuple = (0, 0, 0, 0)) -> np.ndarray:
+    '''
+    Render the extruding moves of a design into an RGBA image.
+
+    Args:
+        xyz (np.ndarray): (n, 3) coordinates of the points of the design.
+        on (np.ndarray): Whether the move to each point is extruding (moves from one point to the next are drawn).
+        width (np.ndarray, optional): Extrusion width (mm) of the move to each point. Defaults to None (one pixel).
+        colors (np.ndarray, optional): (n, 3) colour [r, g, b] (0-1) of the move to each point. Defaults to None
+            (z gradient, as for plots).
+        size (tuple, optional): (width, height) of the image in pixels. Defaults to (220, 124).
+        azimuth (float, optional): Azimuth of the view (degrees anticlockwise from the front). Defaults to 30.
+        elevation (float, optional): Elevation of the view (degrees above horizontal, 90 for a top view). Defaults to 35.
+        margin (float, optional): Margin around the design as a fraction of the image size. Defaults to 0.05.
+        background (tuple, optional): RGBA background (0-255). Defaults to (0, 0, 0, 0) (transparent).
+
+    Returns:
+        np.ndarray: (height, width, 4) uint8 image.
+    '''
+    image_width, image_height = size
+    image = np.empty((image_height*image_width, 4), dtype=np.uint8)
+    image[:] = background
+    xyz = np.asarray(xyz, dtype=float)
+    # per-point values are calculated for whole arrays (rather than indexing drawn moves) since most moves are drawn
+    right, up, towards = view_vectors(azimuth, elevation)
+    x, y, depth = xyz @ right, xyz @ up, xyz @ towards
+    undefined = np.isnan(xyz)
+    defined = ~(undefined[:, 0] | undefined[:, 1] | undefined[:, 2])
+    # the move to point k is drawn if it is extruding and both of its points are defined
+    drawn = np.asarray(on, dtype=bool) & defined
+    drawn[1:] &= defined[:-1]
+    drawn[0] = False
+    path_start = np.zeros(len(xyz), dtype=bool)
+    path_start[:-1] = drawn[1:] & ~drawn[:-1]
+    used = drawn | path_start
+    if not used.any():
+        return image.reshape(image_height, image_width, 4)
+
+    # fit the extruded part of the design into the image
+    lows, highs = [], []
+    for values in (x, y):
+        used_values = values[used]
+        lows.append(used_values.min())
+        highs.append(used_values.max())
+    spans, usable = np.subtract(highs, lows), np.array([image_width, image_height])*(1 - 2*margin)
+    scale = min([usable[i]/spans[i] for i in range(2) if spans[i] > 0], default=1)
+    x = (x - (lows[0] + highs[0])/2)*scale + image_width/2
+    y = image_height/2 - (y - (lows[1] + highs[1])/2)*scale
+    width = np.full(len(xyz), 1/scale) if width is None else np.asarray(width, dtype=float)
+
+    # samples are described by the point at the end of a move (for colour and width) and the fraction of the way along
+    # the move. each point at the end of a drawn move is a sample, unless it is in the same pixel as the previous point
+    # of the path (common for dense designs). long moves are also sampled at intervals no longer than the disc radius
+    # (and at most one pixel), and the start of each path is a sample
+    pixel = np.floor(x).astype(np.int64)*image_height + np.floor(y).astype(np.int64)
+    repeated = np.zeros(len(xyz), dtype=bool)
+    repeated[1:] = drawn[1:] & drawn[:-1] & (pixel[1:] == pixel[:-1]) & (width[1:] == width[:-1])
+    ends = np.flatnonzero(drawn & ~repeated)
+    squared_length = np.zeros(len(xyz))
+    squared_length[1:] = np.diff(x)**2 + np.diff(y)**2
+    long = np.flatnonzero(drawn & (squared_length > 0.25))  # longer than the minimum sample spacing (half a pixel)
+    spacing = np.minimum(np.maximum(np.nan_to_num(width[long])*scale/2, 0.5), 1.0)
+    extra = np.ceil(np.sqrt(squared_length[long])/spacing).astype(np.int64) - 1
+    if extra.sum() > MAX_SAMPLES:
+        extra = np.floor(extra*MAX_SAMPLES/extra.sum()).astype(np.int64)
+    long_ends = np.repeat(long, extra)
+    fraction = (np.arange(len(long_ends)) - np.repeat(np.cumsum(extra) - extra, extra) + 1)/np.repeat(extra + 1, extra)
+    starts = np.flatnonzero(path_start)
+    sample_end = np.concatenate([ends, long_ends, starts + 1])
+    fraction = np.concatenate([np.ones(len(ends)), fraction, np.zeros(len(starts))])
+    sample_x = x[sample_end - 1] + fraction*(x[sample_end] - x[sample_end - 1])
+    sample_y = y[sample_end - 1] + fraction*(y[sample_end] - y[sample_end - 1])
+    sample_depth = depth[sample_end - 1] + fraction*(depth[sample_end] - depth[sample_end - 1])
+    sample_radius = np.maximum(np.nan_to_num(width[sample_end])*scale/2, 0.5)
+
+    # z-buffer: the closest sample at each pixel is the maximum of (depth towards the viewer quantised to 16 bits,
+    # sample index). samples are grouped by radius (to the nearest half pixel) and the closest sample centre at each
+    # pixel is found for each group, then spread over a disc by taking the maximum of the shifted buffer for every
+    # pixel offset within the radius
+    depth_min, depth_range = sample_depth.min(), np.ptp(sample_depth) or 1
+    keys = (((sample_depth - depth_min)/depth_range*65535).astype(np.int64) << 40) | np.arange(len(sample_depth))
+    closest = np.full((image_height, image_width), -1, dtype=np.int64)
+    half_pixels = np.round(sample_radius*2).astype(np.int64)
+    for half in np.flatnonzero(np.bincount(half_pixels)).tolist():
+        group = np.flatnonzero(half_pixels == half)
+        r = int(half/2)
+        # centres are in a buffer padded by the radius, so discs of samples just outside the image are drawn
+        centres = np.full((image_height + 2*r, image_width + 2*r), -1, dtype=np.int64)
+        px, py = np.floor(sample_x[group]).astype(np.int64) + r, np.floor(sample_y[group]).astype(np.int64) + r
+        inside = (px >= 0) & (px < image_width + 2*r) & (py >= 0) & (py < image_height + 2*r)
+        np.maximum.at(centres.ravel(), (py*(image_width + 2*r) + px)[inside], keys[group][inside])
+        for dx in range(-r, r + 1):
+            for dy in range(-r, r + 1):
+                if dx*dx + dy*dy <= (half/2)**2 + 1e-9:
+                    np.maximum(closest, centres[r - dy:r - dy + image_height, r - dx:r - dx + image_width], out=closest)
+
+    # shade by depth so overlapping parts of the design can be distinguished
+    closest = closest.ravel()
+    filled = np.flatnonzero(closest >= 0)
+    sample = closest[filled] & ((1 << 40) - 1)
+    shade = 0.55 + 0.45*(sample_depth[sample] - depth_min)/depth_range
+    point = sample_end[sample]
+    colors = z_gradient_colors(xyz, point) if colors is None else np.asarray(colors, dtype=float)[point]
+    image[filled, :3] = np.clip(colors*shade[:, None]*255, 0, 255).astype(np.uint8)
+    image[filled, 3] = 255
+    return image.reshape(image_height, image_width, 4)
+
+
+def png(image: np.ndarray) -> bytes:
+    'encode an (height, width, 4) uint8 RGBA image as PNG'
+    height, width = image.shape[:2]
+    rows = np.concatenate([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width*4)], axis=1)  # filter type 0
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)) \
+        + chunk(b'IDAT', zlib.compress(rows.tobytes(), 9)) + chunk(b'IEND', b'')
+
+
+def thumbnail_comment(png_data: bytes, width: int, height: int) -> str:
+    'return a PNG image as a base64 thumbnail comment block for a gcode header'
+    encoded = base64.b64encode(png_data).decode()
+    lines = [f'; thumbnail begin {width}x{height} {len(encoded)}']
+    lines += [f'; {encoded[i:i + THUMBNAIL_LINE_LENGTH]}' for i in range(0, len(encoded), THUMBNAIL_LINE_LENGTH)]
+    return '\n'.join([';'] + lines + ['; thumbnail end', ';'])
+
+
+def design_colors(steps: list, arrays: dict) -> np.ndarray:
+    'colours of points set with Point.color (as for PlotControls(color_type="manual")), with a z gradient elsewhere'
+    colors = [getattr(steps[index], 'color', None) for index in arrays['step'].tolist()]
+    if all(color == None for color in colors):
+        return None
+    gradient = z_gradient_colors(arrays['xyz'])
+    colors = np.array([color if color != None else [np.nan]*3 for color in colors], dtype=float)
+    # a colour applies until the next colour is set
+    last_set = np.where(~np.isnan(colors[:, 0]), np.arange(len(colors)), -1)
+    np.maximum.accumulate(last_set, out=last_set)
+    return np.where((last_set >= 0)[:, None], colors[np.maximum(last_set, 0)], gradient)
+
+
+def thumbnails(steps: list, sizes: list, initialization_data: dict, **render_options) -> list:
+    '''
+    Render thumbnails of a design at several sizes.
+
+    Args:
+        steps (list): A 1D list of steps.
+        sizes (list): (width, height) in pixels of each thumbnail, e.g. [(16, 16), (220, 124)].
+        initialization_data (dict): Initialization data of the printer (extrusion geometry at the start).
+        **render_options: Options passed to render() (azimuth, elevation, margin, background).
+
+    Returns:
+        list: (width, height, PNG data) for each thumbnail.
+    '''
+    arrays = design_arrays(steps, initialization_data)
+    colors = design_colors(steps, arrays)
+    return [(width, height, png(render(arrays['xyz'], arrays['on'], arrays['width'], colors, (width, height), **render_options)))
+            for width, height in sizes]
+
+
+def thumbnail_gcode(steps: list, sizes: list, initialization_data: dict, **render_options) -> str:
+    'return thumbnail comment blocks for a gcode header, with thumbnails of the design at each size'
+    return '\n'.join(thumbnail_comment(data, width, height) for width, height, data in thumbnails(steps, sizes, initialization_data, **render_options))
@@ -23,3 +23,4 @@ from fullcontrol.geometry.shapes import rectangleXY, circleXY, circleXY_3pt, ell
 from fullcontrol.geometry.waves import squarewaveXY, squarewaveXYpolar, trianglewaveXYpolar, sinewaveXYpolar
 from fullcontrol.geometry.segmentation import segmented_line, segmented_path
 from fullcontrol.geometry.travel_to import travel_to
+from fullcontrol.geometry.memo import memoize, memo_cache_clear, memo_cache_info
@@ -0,0 +1,147 @@
+import numpy as np
+from collections import OrderedDict
+from copy import deepcopy
+from functools import wraps
+from inspect import signature
+from fullcontrol.geometry import Point
+
+# memoisation of geometry functions. results are stored as read-only numpy arrays of xyz coordinates (nan for None)
+# and new Points are created from them for each call, so designs can edit the returned Points freely. for functions
+# in translation_args, the result is generated about a centre at the origin and translated to the actual centre on
+# demand, so e.g. the same arcXY at every cell of a lattice is only generated once. the cache is shared by all
+# memoised functions and least-recently-used results are dropped when it holds more than memo_max_points points
+
+# argument that each geometry function's result is translated with (the result must be made of new Points whose
+# coordinates are the argument's coordinates plus an offset that doesn't depend on them)
+translation_args = {
+    'arcXY': 'centre', 'variable_arcXY': 'centre', 'elliptical_arcXY': 'centre', 'circleXY': 'centre',
+    'ellipseXY': 'centre', 'polygonXY': 'centre', 'spiralXY': 'centre', 'helixZ': 'centre',
+}
+
+memo_cache = OrderedDict()
+memo_max_points = 1_000_000
+memo_stats = {'hits': 0, 'misses': 0, 'uncached': 0, 'points': 0}
+
+
+def normalise(value):
+    'return a hashable version of an argument, so equivalent arguments give the same cache key'
+    if isinstance(value, Point):
+        return (type(value).__name__,) + tuple(sorted((key, normalise(item)) for key, item in vars(value).items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(normalise(item) for item in value)
+    if isinstance(value, np.ndarray):
+        return (value.dtype.str, value.shape, value.tobytes())
+    hash(value)  # raises TypeError for unhashable arguments, which are not cached
+    return value
+
+
+def points_array(points: list) -> np.ndarray:
+    'return a read-only array of xyz coordinates of a list of plain Points (only x, y, z set), or None if it isn\'t one'
+    if not isinstance(points, list):
+        return None
+    for point in points:
+        if type(point) is not Point or any(value is not None for key, value in vars(point).items() if key not in ('x', 'y', 'z')):
+            return None
+    xyz = np.array([[point.x, point.y, point.z] for point in points], dtype=float).reshape(-1, 3)
+    xyz.flags.writeable = False
+    return xyz
+
+
+def array_points(xyz: np.ndarray) -> list:
+    'create new Points from an array of xyz coordinates (nan for None)'
+    return [Point(x=None if x != x else x, y=None if y != y else y, z=None if z != z else z) for x, y, z in xyz.tolist()]
+
+
+def store(key, value, points: int):
+    'add a result to the cache, dropping least-recently-used results to stay within memo_max_points'
+    if points > memo_max_points:
+        return
+    while memo_cache and memo_stats['points'] + points > memo_max_points:
+        memo_stats['points'] -= memo_cache.popitem(last=False)[1][1]
+    memo_cache[key] = (value, points)
+    memo_stats['points'] += points
+
+
+def memo_cache_clear():
+    'empty the cache of memoised geometry and reset its statistics'
+    memo_cache.clear()
+    memo_stats.update(hits=0, misses=0, uncached=0, points=0)
+
+
+def memo_cache_info() -> dict:
+    'return the cache statistics: hits, misses, uncached calls (unhashable arguments), results and points stored'
+    return dict(memo_stats, results=len(memo_cache), max_points=memo_max_points)
+
+
+def memoize(function, translate: str = None):
+    '''
+    Return a memoised version of a geometry function (e.g. fc.memoize(fc.arcXY)). Calls with equivalent arguments
+    (whether given by position, keyword or default) return new Points from a cached result instead of generating the
+    geometry again.
+
+    Args:
+        function: The geometry function. It should return a list of Points for given arguments.
+        translate (str, optional): Name of a Point argument the result is translated with, so calls that only differ
+            in this argument share a cached result (e.g. 'centre'). Defaults to the argument in translation_args for
+            fullcontrol's geometry functions, or None.
+
+    Returns:
+        The memoised function. It has an extra method array(*args, **kwargs) that returns the result as a read-only
+        numpy array of xyz coordinates (nan for None) without creating Points.
+    '''
+    parameters = signature(function)
+    translate = translate or translation_args.get(function.__name__)
+
+    def cached_array(args, kwargs):
+        'return (xyz array of the result, offset to add to it) or (result, None) for results that are not plain Points'
+        try:
+            bound = parameters.bind(*args, **kwargs)
+        except TypeError:
+            return None, None
+        bound.apply_defaults()
+        arguments, offset = dict(bound.arguments), np.zeros(3)
+        origin = arguments.get(translate) if translate else None
+        if isinstance(origin, Point):
+            offset = np.array([origin.x, origin.y, origin.z], dtype=float)
+            offset[np.isnan(offset)] = 0  # None is left as None (nan) in the result
+            arguments[translate] = Point(x=None if origin.x is None else 0, y=None if origin.y is None else 0, z=None if origin.z is None else 0)
+        try:
+            key = (function.__module__, function.__qualname__, normalise(tuple(arguments.items())))
+        except TypeError:
+            return None, None
+        if key in memo_cache:
+            memo_stats['hits'] += 1
+            memo_cache.move_to_end(key)
+            return memo_cache[key][0], offset
+        memo_stats['misses'] += 1
+        result = function(**arguments)
+        xyz = points_array(result)
+        if xyz is None:
+            if origin is not None:
+                raise Exception(f'memoize() can only translate results that are lists of Points, but {function.__name__}() returned {type(result).__name__}')
+            store(key, ('steps', result), len(result) if isinstance(result, list) else 1)
+        else:
+            store(key, xyz, len(xyz))
+        return (xyz if xyz is not None else ('steps', result)), offset
+
+    @wraps(function)
+    def memoized(*args, **kwargs):
+        value, offset = cached_array(args, kwargs)
+        if value is None:
+            memo_stats['uncached'] += 1
+            return function(*args, **kwargs)
+        if isinstance(value, tuple):
+            return deepcopy(value[1])
+        return array_points(value + offset if offset.any() else value)
+
+    def array(*args, **kwargs) -> np.ndarray:
+        value, offset = cached_array(args, kwargs)
+        if value is None or isinstance(value, tuple):
+            raise Exception(f'{function.__name__}() with these arguments does not return a list of plain Points, so it has no array')
+        if offset.any():
+            value = value + offset
+            value.flags.writeable = False
+        return value
+
+    memoized.array = array
+    return memoized
@@ -1,6 +1,5 @@
 
 from fullcontrol.geometry import Point, Vector
-from copy import deepcopy
 from typing import Union
 
 
@@ -60,14 +59,9 @@ def move_geometry(geometry: Union[Point, list], vector: Vector) -> Union[Point,
         Returns:
             Point: A new Point object with the updated coordinates.
         '''
-        point_new = deepcopy(point)  # deepcopy so that color attribute is copied
-        if point_new.x is not None and vector.x is not None:
-            point_new.x += vector.x
-        if point_new.y is not None and vector.y is not None:
-            point_new.y += vector.y
-        if point_new.z is not None and vector.z is not None:
-            point_new.z += vector.z
-        return point_new
+        # with_() copies the color attribute (FrozenPoints are shared rather than copied if they don't move)
+        return point.with_(**{axis: getattr(point, axis) + getattr(vector, axis) for axis in ('x', 'y', 'z')
+                              if getattr(point, axis) is not None and getattr(vector, axis) is not None})
 
     if isinstance(geometry, Point):
         return move_point(geometry, vector)
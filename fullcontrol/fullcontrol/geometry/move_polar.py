@@ -1,7 +1,6 @@
 
 from fullcontrol.geometry import Point, point_to_polar, polar_to_point
 from fullcontrol.check import check_points
-from copy import deepcopy
 from typing import Union
 
 
@@ -74,16 +73,14 @@ def move_geometry_polar(geometry: Union[Point, list], centre: Point, radius: flo
         '''
         polar_data = point_to_polar(point, centre)
         point_new_xy = polar_to_point(centre, polar_data.radius+radius, polar_data.angle+angle)
-        point_new = deepcopy(point)  # deepcopy so that color and z attributes are copied
-        point_new.x, point_new.y = point_new_xy.x, point_new_xy.y
-        return point_new
+        return point.with_(x=point_new_xy.x, y=point_new_xy.y)  # with_() copies color and z attributes
 
-    if type(geometry).__name__ == "Point":
+    if isinstance(geometry, Point):
         return move_point_about_point(geometry, centre, radius, angle)
     else:
         geometry_new = []
         for i in range(len(geometry)):
-            if type(geometry[i]).__name__ == 'Point':
+            if isinstance(geometry[i], Point):
                 geometry_new.append(move_point_about_point(geometry[i], centre, radius, angle))
             else:
                 geometry_new.append(geometry[i])
@@ -115,7 +112,7 @@ def copy_geometry_polar(geometry: Union[Point, list], centre: Point, radius: flo
     for i in range(quantity):
         radius_now = radius * i
         angle_now = angle * i
-        if type(geometry).__name__ == "Point":
+        if isinstance(geometry, Point):
             steps_new.append(move_geometry_polar(geometry, centre, radius_now, angle_now))
         else:
             steps_new.extend(move_geometry_polar(geometry, centre, radius_now, angle_now))
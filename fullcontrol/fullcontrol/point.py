@@ -1,5 +1,7 @@
 from typing import Optional
+from copy import deepcopy
 from fullcontrol.common import BaseModelPlus
+from fullcontrol.base import check_fields
 
 
 class Point(BaseModelPlus):
@@ -7,3 +9,14 @@ class Point(BaseModelPlus):
     x: Optional[float] = None
     y: Optional[float] = None
     z: Optional[float] = None
+
+    def with_(self, **changes) -> 'Point':
+        '''
+        Return a copy of this Point with the given attributes changed, e.g. point.with_(z=0.4). The original Point is
+        not edited. Attributes that are not changed (e.g. color) are copied.
+        '''
+        check_fields(vars(self).keys(), changes, type(self).__name__)
+        point = deepcopy(self)
+        for key, value in changes.items():
+            point[key] = value
+        return point
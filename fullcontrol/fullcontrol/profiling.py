@@ -0,0 +1,246 @@
+from time import perf_counter
+from contextlib import contextmanager, ExitStack, nullcontext
+import tracemalloc
+import os
+
+
+# python memory is traced with tracemalloc, which only has one peak for the whole process. every traced phase (of a
+# Profiler or a MemoryTracker) resets the peak when it starts, so the highest traced memory so far in each open phase is
+# kept in open_peaks (innermost last) and passed to the enclosing phase when the phase ends
+open_peaks = []
+
+
+@contextmanager
+def traced_memory(record: list):
+    'context manager to trace python memory during a block. record is set to [traced bytes at start, peak, at end]'
+    current, peak = tracemalloc.get_traced_memory()
+    if open_peaks:
+        open_peaks[-1] = max(open_peaks[-1], peak)
+    tracemalloc.reset_peak()
+    open_peaks.append(current)
+    start = current
+    try:
+        yield record
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, open_peaks.pop())
+        if open_peaks:
+            open_peaks[-1] = max(open_peaks[-1], peak)
+        record[:] = [start, peak, current]
+
+
+class Profiler:
+    '''
+    Records cumulative time, call count and python memory for each phase of fc.transform() (fix, primer, generation,
+    join, write, plot, etc.) and for each type of step (Point, Extruder, ManualGcode, etc.).
+
+    Memory is traced with tracemalloc (started when the Profiler is created and stopped by stop(), unless it was
+    already tracing), which slows execution - times include this overhead, but show where time is spent. For each phase
+    the net memory allocated (and not freed) and the peak memory above the memory at the start of the phase are
+    recorded. Steps are too quick to trace individually, so memory is traced for one in every
+    'memory_sample_interval' steps of each type: the net memory is estimated from these samples, and the peak is the
+    highest sampled peak. Set trace_memory=False to record times only.
+
+    Phases can be nested (e.g. the primer is generated within the gcode generation phase). The time of a phase includes
+    the phases within it, and its 'self' time excludes them. Percentages are of the total time of the outermost phases.
+    '''
+
+    def __init__(self, memory_sample_interval: int = 1000, trace_memory: bool = True):
+        self.memory_sample_interval = memory_sample_interval
+        self.records = {}  # name: [calls, time, net bytes, peak bytes, calls with memory measured]
+        self.nested = {}  # name: [time in phases within this phase, nesting depth]
+        self.stack = []  # time in phases within each open phase so far
+        self.tracing = trace_memory
+        self.started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    def add(self, name: str, time: float, memory: list = None, calls: int = 1):
+        'add the time and traced memory ([start, peak, end] bytes, or None if not traced) of a call to the record for name'
+        record = self.records.setdefault(name, [0, 0.0, 0, 0, 0])
+        record[0] += calls
+        record[1] += time
+        if memory != None:
+            start, peak, end = memory
+            record[2] += end - start
+            record[3] = max(record[3], peak - start)
+            record[4] += calls
+
+    @contextmanager
+    def phase(self, name: str):
+        'context manager to record a phase of the pipeline'
+        # records are created when a phase starts, so phases are listed in the order they started
+        self.records.setdefault(f'phase: {name}', [0, 0.0, 0, 0, 0])
+        nested = self.nested.setdefault(f'phase: {name}', [0.0, len(self.stack)])
+        memory = []
+        self.stack.append(0.0)
+        start = perf_counter()
+        try:
+            with traced_memory(memory) if self.tracing else nullcontext():
+                yield
+        finally:
+            time = perf_counter() - start
+            nested[0] += self.stack.pop()
+            if self.stack:
+                self.stack[-1] += time
+            self.add(f'phase: {name}', time, memory if self.tracing else None)
+
+    def step(self, step, function, *args):
+        'call function(*args) for a step, recording it against the type of the step, and return the result'
+        name = f'step: {type(step).__name__}'
+        record = self.records.get(name)
+        if record == None:
+            record = self.records[name] = [0, 0.0, 0, 0, 0]
+        if self.tracing and record[0] % self.memory_sample_interval == 0:
+            memory = []
+            with traced_memory(memory):
+                start = perf_counter()
+                result = function(*args)
+                time = perf_counter() - start
+            self.add(name, time, memory)
+            return result
+        start = perf_counter()
+        result = function(*args)
+        record[1] += perf_counter() - start
+        record[0] += 1
+        return result
+
+    def stop(self):
+        'stop tracing memory (if it was started by this profiler)'
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def net_mb(self, name: str) -> float:
+        'return the (estimated) net memory allocated for name (MB), or None if memory was not traced'
+        calls, time, net, peak, measured_calls = self.records[name]
+        return net*calls/measured_calls/1e6 if measured_calls > 0 else None
+
+    def peak_mb(self, name: str) -> float:
+        'return the highest peak memory (MB) of a call for name above the memory at the start of the call, or None if memory was not traced'
+        return self.records[name][3]/1e6 if self.records[name][4] > 0 else None
+
+    def self_time(self, name: str) -> float:
+        'return the time for name excluding phases within it (step types have no phases within them)'
+        return self.records[name][1] - self.nested.get(name, [0.0])[0]
+
+    def results(self) -> dict:
+        'return a dictionary of results for each phase and step type: {name: {"calls", "time", "self_time", "net_mb", "peak_mb"}}'
+        return {name: {'calls': record[0], 'time': record[1], 'self_time': self.self_time(name), 'net_mb': self.net_mb(name), 'peak_mb': self.peak_mb(name)}
+                for name, record in self.records.items()}
+
+    def table(self) -> str:
+        ''' return a table of results. phases are listed in the order they started (nested phases are indented), then
+        step types from slowest to fastest. time % is self time as a percentage of the total time of the outermost
+        phases, so the phases add up to 100%
+        '''
+        nan = float('nan')
+        phases = [name for name in self.records if name.startswith('phase: ')]
+        steps = sorted((name for name in self.records if not name.startswith('phase: ')), key=lambda name: -self.records[name][1])
+        total = sum(self.records[name][1] for name in phases if self.nested[name][1] == 0)
+        lines = [f"{'':<40}{'calls':>10}{'time (s)':>12}{'self (s)':>12}{'time %':>9}{'net (MB)':>11}{'peak (MB)':>11}"]
+        for name in phases + steps:
+            calls, time = self.records[name][:2]
+            self_time = self.self_time(name)
+            net, peak = self.net_mb(name), self.peak_mb(name)
+            label = '  '*self.nested[name][1] + name if name in self.nested else name
+            lines.append(f"{label:<40}{calls:>10}{time:>12.4f}{self_time:>12.4f}{100*self_time/total if total > 0 else 0:>9.1f}"
+                         f"{net if net != None else nan:>11.3f}{peak if peak != None else nan:>11.3f}")
+        return '\n'.join(lines)
+
+
+class MemoryTracker:
+    '''
+    Tracks memory for each phase of fc.transform(). The total memory used by the process (resident set size) is
+    recorded at the end of each phase where it is available (linux). If trace is True, python memory allocations are
+    also traced (with tracemalloc, which slows execution considerably) to record the peak memory during each phase and
+    the net memory retained at the end of it. Nested phases are supported (the peak of a phase includes the peaks of
+    phases within it).
+
+    If budget_mb is set, would_exceed() can be used to check whether allocating a further amount of memory is expected
+    to take the process over the budget, so that processing can switch to a lower-memory (chunked) approach. This uses
+    the memory used by the process, so it does not need tracing. Notes about such decisions are added to the report.
+    '''
+
+    def __init__(self, budget_mb: float = None, trace: bool = True):
+        self.budget_mb = budget_mb
+        self.records = {}  # name: [peak MB, net MB, process MB at end of phase] (peak and net are None if not tracing)
+        self.notes = []
+        self.started_tracing = trace and not tracemalloc.is_tracing()
+        self.tracing = trace
+        if self.started_tracing:
+            tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name: str):
+        'context manager to record the memory of a phase of the pipeline'
+        if not self.tracing:
+            try:
+                yield
+            finally:
+                self.records[name] = [None, None, self.process_mb()]
+            return
+        memory = []
+        try:
+            with traced_memory(memory):
+                yield
+        finally:
+            start, peak, current = memory
+            self.records[name] = [peak/1e6, (current - start)/1e6, self.process_mb()]
+
+    def process_mb(self) -> float:
+        'return the memory currently used by the process (resident set size, MB), or None if not available'
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/1e6
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def current_mb(self) -> float:
+        'return the memory currently used by the process, or allocated by python since tracing started if that is not available (MB), or None'
+        process = self.process_mb()
+        if process == None and self.tracing:
+            return tracemalloc.get_traced_memory()[0]/1e6
+        return process
+
+    def would_exceed(self, extra_mb: float) -> bool:
+        'return True if a budget is set and allocating a further extra_mb of memory is expected to exceed it'
+        if self.budget_mb == None:
+            return False
+        current = self.current_mb()
+        if current == None:
+            note = 'the memory budget was not applied because the memory used by the process is not available on this platform'
+            if note not in self.notes:
+                self.notes.append(note)
+            return False
+        return current + extra_mb > self.budget_mb
+
+    def stop(self):
+        'stop tracing memory (if it was started by this tracker)'
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def results(self) -> dict:
+        'return a dictionary of results for each phase: {name: {"peak_mb", "net_mb", "process_mb"}} and any notes'
+        return {'phases': {name: {'peak_mb': peak, 'net_mb': net, 'process_mb': process} for name, (peak, net, process) in self.records.items()}, 'notes': self.notes}
+
+    def table(self) -> str:
+        'return a table of results for each phase, followed by any notes'
+        nan = float('nan')
+        lines = [f"{'':<40}{'peak (MB)':>12}{'net (MB)':>12}{'process (MB)':>14}"]
+        for name, (peak, net, process) in self.records.items():
+            lines.append(f"{'phase: ' + name:<40}{peak if peak != None else nan:>12.2f}{net if net != None else nan:>12.2f}{process if process != None else nan:>14.1f}")
+        if self.budget_mb != None:
+            lines.append(f"memory budget: {self.budget_mb} MB")
+        lines.extend(f"note: {note}" for note in self.notes)
+        return '\n'.join(lines)
+
+
+def track_phase(name: str, *trackers):
+    'return a context manager to record a phase with each of the supplied trackers (Profiler or MemoryTracker) that is not None'
+    stack = ExitStack()
+    for tracker in trackers:
+        if tracker != None:
+            stack.enter_context(tracker.phase(name))
+    return stack
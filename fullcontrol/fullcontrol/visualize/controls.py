@@ -21,6 +21,10 @@ class PlotControls(BaseModel):
         raw_data (Optional[bool]): Whether to show raw data in the plot. Default is False.
         printer_name (Optional[str]): The name of the printer. Default is 'generic'.
         initialization_data (Optional[dict]): Information about initial printing conditions. Default is an empty dictionary. Values passed for initialization_data overwrite the default initialization_data of the printer.
+        profile (Optional[bool]): Whether to record the time, call count and python memory (net and peak, traced with tracemalloc, which slows execution) of each phase of fc.transform() and each type of step, and print a table of results. To retrieve the results, pass a Profiler to fc.transform(). Defaults to False.
+        memory_report (Optional[bool]): Whether to track the peak and net python memory allocations (with tracemalloc, which slows execution) of each phase of fc.transform() and print a report. Defaults to False.
+        memory_budget (Optional[float]): Memory budget (MB) for fc.transform(). If set, the memory used by the process is checked (without tracing allocations, unless memory_report is True) and any phase that exceeded the budget is noted. Defaults to None.
+        memory_results (Optional[dict]): Results of memory tracking, set by fc.transform() if memory_report is True or memory_budget is set.
     """
     color_type: Optional[str] = 'z_gradient'
     line_width: Optional[float] = None
@@ -36,6 +40,10 @@ class PlotControls(BaseModel):
     printer_name: Optional[str] = 'generic'
     # initialization_data is information about initial printing conditions, which may be changed by the fullcontrol 'design', whereas the above attributes are never changed by the 'design'
     initialization_data: Optional[dict] = {}  # values passed for initialization_data overwrite the default initialization_data of the printer
+    profile: Optional[bool] = False
+    memory_report: Optional[bool] = False
+    memory_budget: Optional[float] = None  # MB
+    memory_results: Optional[dict] = None  # set by fc.transform() if memory_report is True or memory_budget is set
 
     def initialize(self):
         if not self.raw_data: # the follows defaults are only required if plotting the path, not for raw data export
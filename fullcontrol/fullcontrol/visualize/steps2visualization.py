@@ -3,15 +3,18 @@ from fullcontrol.visualize.state import State
 from fullcontrol.visualize.plot_data import PlotData
 from fullcontrol.visualize.controls import PlotControls
 from fullcontrol.visualize.tips import tips
+from fullcontrol.profiling import Profiler, MemoryTracker, track_phase
 
 
-def visualize(steps: list, plot_controls: PlotControls, show_tips: bool):
+def visualize(steps: list, plot_controls: PlotControls, show_tips: bool, profiler: Profiler = None, memory: MemoryTracker = None):
     '''
     Visualize the list of steps.
 
     Parameters:
     - steps (list): The list of steps to visualize.
     - plot_controls (PlotControls, optional): The style of the plot can be adjusted by passing a PlotControls instance.
+    - profiler (Profiler, optional): If supplied, each phase of the visualization and each step are recorded.
+    - memory (MemoryTracker, optional): If supplied, the memory used in each phase of the visualization is recorded.
 
     Returns:
     - plot_data (PlotData): The plot data if `plot_controls.raw_data` is True, otherwise None.
@@ -19,14 +22,22 @@ def visualize(steps: list, plot_controls: PlotControls, show_tips: bool):
     plot_controls.initialize()
     if show_tips: tips(plot_controls)
 
-    state = State(steps, plot_controls)
-    plot_data = PlotData(steps, state)
-    for step in steps:
-        step.visualize(state, plot_data, plot_controls)
-    plot_data.cleanup()
+    with track_phase('initialization', profiler, memory):
+        state = State(steps, plot_controls)
+        plot_data = PlotData(steps, state)
+    with track_phase('generation', profiler, memory):
+        if profiler == None:
+            for step in steps:
+                step.visualize(state, plot_data, plot_controls)
+        else:
+            for step in steps:
+                profiler.step(step, step.visualize, state, plot_data, plot_controls)
+    with track_phase('cleanup', profiler, memory):
+        plot_data.cleanup()
 
     if plot_controls.raw_data == True:
         return plot_data
     else:
         from fullcontrol.visualize.plotly import plot
-        plot(plot_data, plot_controls)
+        with track_phase('plot', profiler, memory):
+            plot(plot_data, plot_controls)
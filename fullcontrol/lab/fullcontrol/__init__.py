@@ -8,3 +8,10 @@ from lab.fullcontrol.transform import transform
 from lab.fullcontrol.geometry_model.controls import ModelControls
 from lab.fullcontrol.controlcode_formats.controls import CodeControls
 from lab.fullcontrol.laser.laser import Laser
+from lab.fullcontrol.gcode_reader import read_gcode, parse_gcode, GcodeData
+from lab.fullcontrol.streaming import stream, stream_async, GcodeSender, VirtualPrinter
+from lab.fullcontrol.nesting import nest, plate_layout
+from lab.fullcontrol.path_order import order_paths
+from lab.fullcontrol.flow import limit_flow
+from lab.fullcontrol.controlcode_formats.compressed import write_bgcode, read_bgcode, write_meatpack, write_gzip
+from lab.fullcontrol.tool_change import ToolChange, schedule_tools
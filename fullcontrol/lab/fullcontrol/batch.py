@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+FullControl batch runner for printer farms and parameter sweeps
+
+Many designs (and many variants of each design) are transformed to gcode in a single pool of worker processes. Each
+worker imports fullcontrol once and keeps a cache of printer profiles, so the only cost per job is creating the design
+and generating its gcode.
+
+The manifest is a json file (or a dictionary for run_batch) with a list of jobs. Each job names a design function,
+which is called with the job's parameters and returns a list of fullcontrol steps:
+    {
+        "output_folder": "farm_output",
+        "jobs": [
+            {"name": "vase", "design": "designs.py:vase", "printer": "Cura/Creality Ender-3 / Ender-3 v2",
+             "parameters": {"height": 50}, "sweep": {"radius": [10, 20, 30], "twist": [0, 90]},
+             "controls": {"initialization_data": {"nozzle_temp": 215}}}
+        ]
+    }
+- design: "path/to/file.py:function" (relative to the manifest) or "package.module:function"
+- printer: printer_name for GcodeControls (default 'generic')
+- parameters: keyword arguments for the design function (optional)
+- sweep: lists of values for keyword arguments - a job is created for every combination (optional)
+- controls: other GcodeControls attributes (optional)
+
+Each job's gcode is written to the output folder as <name>.gcode (with sweep values in the name), and stats for all
+jobs (times, gcode size, output messages, and the traceback of any failure) are written to batch_stats.json.
+
+Example:
+    python -m lab.fullcontrol.batch manifest.json --workers 8
+"""
+
+import argparse
+import contextlib
+import importlib
+import importlib.util
+import io
+import itertools
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+designs = {}  # cache of design functions in this process: {design: function}
+
+
+def load_design(design: str, folder: str = '.'):
+    'return the design function for "path/to/file.py:function" (relative to folder) or "package.module:function"'
+    key = (design, folder)
+    if key not in designs:
+        location, function_name = design.rsplit(':', 1)
+        if location.endswith('.py'):
+            path = os.path.join(folder, location)
+            spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(path))[0], path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        else:
+            module = importlib.import_module(location)
+        designs[key] = getattr(module, function_name)
+    return designs[key]
+
+
+def expand_jobs(manifest: dict) -> list:
+    'return a list of jobs, with a separate job for each combination of sweep values. each job has a unique name'
+    jobs = []
+    for number, entry in enumerate(manifest['jobs']):
+        sweep = entry.get('sweep', {})
+        for values in itertools.product(*sweep.values()):
+            variant = dict(zip(sweep, values))
+            name = entry.get('name', f'job{number}')
+            if variant:
+                name += '__' + '_'.join(f'{key}-{value}' for key, value in variant.items())
+            jobs.append({'name': re.sub(r'[^\w\-.]', '_', name), 'design': entry['design'], 'printer': entry.get('printer', 'generic'),
+                         'parameters': {**entry.get('parameters', {}), **variant}, 'controls': entry.get('controls', {})})
+    names = [job['name'] for job in jobs]
+    if len(set(names)) != len(names):
+        raise Exception('job names in the batch manifest are not unique - set a different "name" for each job')
+    return jobs
+
+
+def warm_up(printers: list):
+    'import fullcontrol and load printer profiles into the cache of this process'
+    import fullcontrol
+    from fullcontrol.gcode.import_printer import printer_settings
+    for printer in printers:
+        if printer[:5] == 'Cura/' or printer[:10] == 'Community/':
+            printer_settings(printer)
+        else:
+            importlib.import_module(f'fullcontrol.devices.community.singletool.{printer}')
+
+
+def run_job(job: dict, output_folder: str, manifest_folder: str = '.') -> dict:
+    '''create the design for a job, transform it to gcode and write the gcode file. return stats for the job (failures
+    are recorded in the stats rather than raised, so one failed job does not stop the batch)'''
+    import fullcontrol as fc
+    stats = {'name': job['name'], 'printer': job['printer'], 'parameters': job['parameters'], 'status': 'ok', 'pid': os.getpid()}
+    output = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            steps = load_design(job['design'], manifest_folder)(**job['parameters'])
+            stats['design_time'] = time.perf_counter() - start
+            controls = fc.GcodeControls(**{**job['controls'], 'printer_name': job['printer']})
+            gcode = fc.transform(steps, 'gcode', controls, show_tips=False)
+            stats['gcode_time'] = time.perf_counter() - start - stats['design_time']
+            filename = os.path.join(output_folder, f"{job['name']}.gcode")
+            with open(filename, 'w') as f:
+                f.write(gcode)
+        stats.update(steps=len(steps), gcode_lines=gcode.count('\n') + 1, gcode_bytes=len(gcode), file=filename)
+    except Exception:
+        stats.update(status='failed', error=traceback.format_exc())
+    stats['time'] = time.perf_counter() - start
+    stats['output'] = output.getvalue()
+    return stats
+
+
+def run_batch(manifest, output_folder: str = None, workers: int = None, progress: bool = True) -> list:
+    '''
+    Run all jobs in a manifest (a dictionary, or the filename of a json manifest) in a pool of worker processes.
+
+    Args:
+        manifest (Union[dict, str]): The manifest or its filename. See the module docstring for the format.
+        output_folder (str, optional): Folder for gcode files and batch_stats.json. Defaults to the manifest's
+            "output_folder" or 'batch_output'.
+        workers (int, optional): Number of worker processes. Defaults to the number of cpus.
+        progress (bool, optional): Whether to print progress. Defaults to True.
+
+    Returns:
+        list: Stats for each job (see run_job).
+    '''
+    manifest_folder = '.'
+    if isinstance(manifest, str):
+        manifest_folder = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as f:
+            manifest = json.load(f)
+    output_folder = output_folder or manifest.get('output_folder', 'batch_output')
+    os.makedirs(output_folder, exist_ok=True)
+    jobs = expand_jobs(manifest)
+    workers = workers or os.cpu_count()
+    printers = sorted(set(job['printer'] for job in jobs))
+
+    start = time.perf_counter()
+    # profiles are also loaded before the pool starts so that forked workers share them
+    warm_up(printers)
+    # jobs are sent to workers in chunks to reduce inter-process overhead for large sweeps of small designs
+    chunksize = max(1, len(jobs) // (workers*8))
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up, initargs=(printers,)) as pool:
+        for stats in pool.map(run_job, jobs, itertools.repeat(output_folder), itertools.repeat(manifest_folder), chunksize=chunksize):
+            results.append(stats)
+            if progress and (len(results) % max(1, len(jobs)//20) == 0 or stats['status'] != 'ok'):
+                print(f"{len(results)}/{len(jobs)} jobs complete ({time.perf_counter() - start:.1f} s)" + (f" - {stats['name']} failed" if stats['status'] != 'ok' else ''))
+
+    failures = [stats for stats in results if stats['status'] != 'ok']
+    summary = {'jobs': len(jobs), 'failed': len(failures), 'workers': workers, 'time': time.perf_counter() - start}
+    with open(os.path.join(output_folder, 'batch_stats.json'), 'w') as f:
+        json.dump({'summary': summary, 'jobs': results}, f, indent=1)
+    if progress:
+        print(f"{summary['jobs']} jobs ({summary['failed']} failed) in {summary['time']:.1f} s with {workers} workers - stats saved to {os.path.join(output_folder, 'batch_stats.json')}")
+        for stats in failures:
+            print(f"\n{stats['name']} failed:\n{stats['error']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FullControl batch runner')
+    parser.add_argument('manifest', help='json manifest of jobs')
+    parser.add_argument('--output-folder', help='folder for gcode files and batch_stats.json (overrides the manifest)')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default: number of cpus)')
+    parser.add_argument('--quiet', action='store_true', help='do not print progress')
+    args = parser.parse_args()
+    results = run_batch(args.manifest, args.output_folder, args.workers, not args.quiet)
+    if any(stats['status'] != 'ok' for stats in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
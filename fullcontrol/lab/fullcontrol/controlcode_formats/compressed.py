@@ -0,0 +1,360 @@
+import gzip
+import struct
+import zlib
+from math import pi
+from typing import Iterable, Iterator
+import numpy as np
+from lab.fullcontrol.controlcode_formats.steps2controlcode import GcodeStats
+
+# compressed gcode formats, written by streaming lines of gcode (e.g. from fullcontrol.gcode.steps2gcode.gcode_lines)
+# in chunks, so memory use does not depend on the size of the design:
+# - gzip: plain gcode in a .gcode.gz file, accepted by some host software
+# - meatpack: the packed stream understood by marlin/prusa firmware with meatpack support. common characters are
+#   packed two per byte (4 bits each) and other characters are sent in full after the byte that contains them
+# - bgcode: prusa binary gcode. a file header is followed by metadata blocks then blocks of gcode (meatpack encoded
+#   and heatshrink or deflate compressed), each with a block header, parameters and a crc32 checksum
+
+CHUNK_SIZE = 65536  # characters of gcode per chunk (the maximum uncompressed size of a bgcode gcode block)
+
+
+def gcode_chunks(lines: Iterable[str], chunk_size: int = CHUNK_SIZE) -> Iterator[list]:
+    'yield lists of lines of gcode with about chunk_size characters in total. lines containing several lines are split'
+    chunk, size = [], 0
+    for line in lines:
+        for sub_line in line.split('\n'):
+            chunk.append(sub_line)
+            size += len(sub_line) + 1
+        if size >= chunk_size:
+            yield chunk
+            chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+
+def write_gzip(lines: Iterable[str], filename: str, compresslevel: int = 6):
+    'write lines of gcode to a gzip-compressed file (e.g. my_design.gcode.gz)'
+    with gzip.open(filename, 'wb', compresslevel=compresslevel) as file:
+        for chunk in gcode_chunks(lines, 1000000):
+            file.write(('\n'.join(chunk) + '\n').encode())
+
+
+# meatpack
+
+MEATPACK_SIGNAL = b'\xff\xff'  # two signal bytes are followed by a command byte
+MEATPACK_ENABLE_PACKING, MEATPACK_DISABLE_PACKING = 251, 250
+MEATPACK_ENABLE_NO_SPACES, MEATPACK_DISABLE_NO_SPACES = 247, 246
+MEATPACK_FULL = 0b1111  # 4-bit code for a character sent in full after the packed byte
+MEATPACK_NEWLINE = 12
+MEATPACK_PAD = '\0'  # placed after a newline in the first half of a byte. firmware ignores the second half in that case
+
+
+def meatpack_codes(no_spaces: bool = True) -> np.ndarray:
+    'return the 4-bit meatpack code for each byte value. in no-spaces mode, E replaces space as a packed character'
+    codes = np.full(256, MEATPACK_FULL, dtype=np.uint8)
+    for code, character in enumerate('0123456789.' + ('E' if no_spaces else ' ') + '\nGX'):
+        codes[ord(character)] = code
+    codes[ord(MEATPACK_PAD)] = 0
+    return codes
+
+
+def meatpack_command(command: int) -> bytes:
+    return MEATPACK_SIGNAL + bytes([command])
+
+
+def meatpack_text(lines: list, comments: bool = True, no_spaces: bool = True) -> str:
+    '''prepare lines of gcode for packing: whitespace and blank lines are removed, comments are optionally removed and
+    spaces are removed from the code (not comments) in no-spaces mode. each line is padded to an even length so it
+    starts in the first half of a packed byte
+    '''
+    prepared = []
+    for line in lines:
+        code, semicolon, comment = line.partition(';')
+        code = code.replace(' ', '') if no_spaces else code.strip()
+        line = code + semicolon + comment.rstrip() if comments else code
+        if line:
+            prepared.append(line + '\n' if len(line) % 2 else line + '\n' + MEATPACK_PAD)
+    return ''.join(prepared)
+
+
+def meatpack_pack(text: str, no_spaces: bool = True) -> bytes:
+    'pack text prepared with meatpack_text (even length) into meatpack bytes, vectorised with numpy'
+    data = np.frombuffer(text.encode(), dtype=np.uint8)
+    codes = meatpack_codes(no_spaces)[data]
+    first, second = codes[0::2], codes[1::2]
+    first_full, second_full = first == MEATPACK_FULL, second == MEATPACK_FULL
+    sizes = 1 + first_full.astype(np.int64) + second_full
+    starts = np.cumsum(sizes) - sizes
+    packed = np.empty(int(sizes.sum()), dtype=np.uint8)
+    packed[starts] = first | (second << 4)
+    packed[starts[first_full] + 1] = data[0::2][first_full]
+    packed[starts[second_full] + 1 + first_full[second_full]] = data[1::2][second_full]
+    return packed.tobytes()
+
+
+def meatpack_encode(lines: list, comments: bool = True, no_spaces: bool = True) -> bytes:
+    'return a self-contained meatpack stream (packing enabled at the start and disabled at the end) for lines of gcode'
+    start = meatpack_command(MEATPACK_ENABLE_PACKING)
+    if no_spaces:
+        start += meatpack_command(MEATPACK_ENABLE_NO_SPACES)
+    return start + meatpack_pack(meatpack_text(lines, comments, no_spaces), no_spaces) + meatpack_command(MEATPACK_DISABLE_PACKING)
+
+
+def meatpack_decode(data: bytes) -> str:
+    'decode a meatpack stream to text, as the firmware does'
+    characters = [chr(ord('0') + i) for i in range(10)] + ['.', ' ', '\n', 'G', 'X']
+    active, no_spaces, signals, full, text = False, False, 0, [], []
+    i = 0
+    while i < len(data):
+        byte = data[i]
+        i += 1
+        if byte == 0xFF and (signals or i < len(data) and data[i] == 0xFF):
+            signals += 1
+            if signals == 2:
+                command = data[i]
+                i += 1
+                signals = 0
+                active = {MEATPACK_ENABLE_PACKING: True, MEATPACK_DISABLE_PACKING: False}.get(command, active)
+                no_spaces = {MEATPACK_ENABLE_NO_SPACES: True, MEATPACK_DISABLE_NO_SPACES: False}.get(command, no_spaces)
+            continue
+        if not active:
+            text.append(chr(byte))
+            continue
+        pair = [byte & 0xF, byte >> 4]
+        if pair[0] == MEATPACK_NEWLINE:
+            pair = pair[:1]
+        for code in pair:
+            if code == MEATPACK_FULL:
+                text.append(chr(data[i]))
+                i += 1
+            else:
+                text.append('E' if code == 11 and no_spaces else characters[code])
+    return ''.join(text)
+
+
+def write_meatpack(lines: Iterable[str], filename: str, comments: bool = False, no_spaces: bool = True):
+    'write lines of gcode to a meatpack-encoded file, to be sent as raw bytes to firmware with meatpack support'
+    with open(filename, 'wb') as file:
+        file.write(meatpack_command(MEATPACK_ENABLE_PACKING))
+        if no_spaces:
+            file.write(meatpack_command(MEATPACK_ENABLE_NO_SPACES))
+        for chunk in gcode_chunks(lines, 1000000):
+            file.write(meatpack_pack(meatpack_text(chunk, comments, no_spaces), no_spaces))
+        file.write(meatpack_command(MEATPACK_DISABLE_PACKING))
+
+
+# heatshrink (lzss with a 2**window_sz2 byte window and matches of up to 2**lookahead_sz2 bytes). a bit stream of
+# literals (1 + 8 bits) and back-references (0 + window_sz2 bits for distance-1 + lookahead_sz2 bits for length-1)
+
+def heatshrink_compress(data: bytes, window_sz2: int = 12, lookahead_sz2: int = 4) -> bytes:
+    'heatshrink-compress data, with the heatshrink2 package if it is installed (much faster) or in python'
+    try:
+        import heatshrink2
+        return heatshrink2.compress(data, window_sz2=window_sz2, lookahead_sz2=lookahead_sz2)
+    except ImportError:
+        pass
+    window, lookahead, reference_bits = 1 << window_sz2, 1 << lookahead_sz2, 1 + window_sz2 + lookahead_sz2
+    latest, bits, n_bits, compressed = {}, 0, 0, bytearray()
+    i, n = 0, len(data)
+    while i < n:
+        key = data[i:i + 3]
+        previous = latest.get(key)
+        latest[key] = i
+        length = 0
+        if previous != None and i - previous <= window and len(key) == 3:
+            length, longest = 3, min(lookahead, n - i)
+            while length < longest and data[previous + length] == data[i + length]:
+                length += 1
+        if length:
+            bits = (bits << reference_bits) | ((i - previous - 1) << lookahead_sz2) | (length - 1)
+            n_bits += reference_bits
+            for j in range(i + 1, i + length):
+                latest[data[j:j + 3]] = j
+            i += length
+        else:
+            bits = (bits << 9) | 0x100 | data[i]
+            n_bits += 9
+            i += 1
+        while n_bits >= 8:
+            n_bits -= 8
+            compressed.append(bits >> n_bits)
+            bits &= (1 << n_bits) - 1
+    if n_bits:
+        compressed.append(bits << (8 - n_bits))
+    return bytes(compressed)
+
+
+def heatshrink_decompress(data: bytes, window_sz2: int = 12, lookahead_sz2: int = 4) -> bytes:
+    'decompress heatshrink-compressed data'
+    decompressed, bits, n_bits, i = bytearray(), 0, 0, 0
+
+    def read(count: int):
+        nonlocal bits, n_bits, i
+        while n_bits < count:
+            if i == len(data):
+                return None
+            bits, n_bits, i = (bits << 8) | data[i], n_bits + 8, i + 1
+        n_bits -= count
+        value = bits >> n_bits
+        bits &= (1 << n_bits) - 1
+        return value
+
+    while True:
+        tag = read(1)
+        if tag == None:
+            break
+        if tag:
+            literal = read(8)
+            if literal == None:
+                break
+            decompressed.append(literal)
+        else:
+            index, count = read(window_sz2), read(lookahead_sz2)
+            if index == None or count == None:
+                break
+            for _ in range(count + 1):
+                decompressed.append(decompressed[-index - 1])
+    return bytes(decompressed)
+
+
+# prusa binary gcode
+
+BGCODE_MAGIC, BGCODE_VERSION, BGCODE_CHECKSUM_CRC32 = b'GCDE', 1, 1
+BGCODE_BLOCKS = {'file_metadata': 0, 'gcode': 1, 'slicer_metadata': 2, 'printer_metadata': 3, 'print_metadata': 4, 'thumbnail': 5}
+BGCODE_COMPRESSION = {'none': 0, 'deflate': 1, 'heatshrink_11_4': 2, 'heatshrink_12_4': 3}
+BGCODE_ENCODING = {'none': 0, 'meatpack': 1, 'meatpack_comments': 2}
+BGCODE_METADATA_INI = 0
+BGCODE_THUMBNAIL_PNG = 0
+PRINT_METADATA_WIDTH = 12  # print metadata values are zero-padded to this width so they can be rewritten in place
+# prusa model codes (as checked by firmware before printing) for fullcontrol printers that can print bgcode
+BGCODE_PRINTER_MODELS = {'prusa_mk4': 'MK4', 'prusa_mini': 'MINI'}
+
+
+def bgcode_printer_metadata(printer_name: str) -> dict:
+    'return bgcode printer metadata for a fullcontrol printer name, with the prusa model code if it is a known prusa printer'
+    return {'printer_model': BGCODE_PRINTER_MODELS[printer_name]} if printer_name in BGCODE_PRINTER_MODELS else {}
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    if compression == 'none':
+        return data
+    if compression == 'deflate':
+        return zlib.compress(data)
+    window_sz2, lookahead_sz2 = (int(size) for size in compression.split('_')[1:])
+    return heatshrink_compress(data, window_sz2, lookahead_sz2)
+
+
+def decompress(data: bytes, compression: str) -> bytes:
+    if compression == 'none':
+        return data
+    if compression == 'deflate':
+        return zlib.decompress(data)
+    window_sz2, lookahead_sz2 = (int(size) for size in compression.split('_')[1:])
+    return heatshrink_decompress(data, window_sz2, lookahead_sz2)
+
+
+def bgcode_block(block_type: str, data: bytes, parameters: bytes, compression: str = 'none') -> bytes:
+    'return a bgcode block: header, parameters, (compressed) data and crc32 checksum of all three'
+    compressed = compress(data, compression)
+    header = struct.pack('<HHI', BGCODE_BLOCKS[block_type], BGCODE_COMPRESSION[compression], len(data))
+    if compression != 'none':
+        header += struct.pack('<I', len(compressed))
+    block = header + parameters + compressed
+    return block + struct.pack('<I', zlib.crc32(block))
+
+
+def metadata_block(block_type: str, metadata: dict, compression: str = 'none') -> bytes:
+    ini = ''.join(f'{key}={value}\n' for key, value in metadata.items()).encode()
+    return bgcode_block(block_type, ini, struct.pack('<H', BGCODE_METADATA_INI), compression)
+
+
+def print_metadata(stats: GcodeStats, dia_feed: float, density: float) -> dict:
+    'print time and filament use for the print metadata block, zero-padded to a fixed width'
+    filament_cm3 = stats.filament_mm*pi*(dia_feed/2)**2/1000
+    minutes, seconds = divmod(int(round(stats.seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    width = PRINT_METADATA_WIDTH
+    return {'filament used [mm]': f'{stats.filament_mm:0{width}.2f}',
+            'filament used [cm3]': f'{filament_cm3:0{width}.2f}',
+            'filament used [g]': f'{filament_cm3*density:0{width}.2f}',
+            'estimated printing time (normal mode)': f'{hours:0{width - 8}d}h {minutes:02d}m {seconds:02d}s'}
+
+
+def write_bgcode(lines: Iterable[str], filename: str, compression: str = 'heatshrink_12_4', encoding: str = 'meatpack_comments',
+                 printer_metadata: dict = None, slicer_metadata: dict = None, thumbnails: list = None, dia_feed: float = 1.75,
+                 density: float = 1.24):
+    '''
+    Write lines of gcode to a prusa binary gcode (.bgcode) file. Gcode is streamed into blocks of up to 65536 characters,
+    while print time and filament use (density in g/cm3) are calculated for the print metadata block, which is written
+    with placeholder values first and updated in place when the gcode is complete.
+
+    Args:
+        lines (Iterable[str]): Lines of gcode.
+        filename (str): The .bgcode file to write.
+        compression (str, optional): Compression of gcode blocks: 'none', 'deflate', 'heatshrink_11_4' or
+            'heatshrink_12_4' (used by prusa firmware). Defaults to 'heatshrink_12_4'.
+        encoding (str, optional): Encoding of gcode blocks: 'none', 'meatpack' (comments removed) or 'meatpack_comments'.
+            Defaults to 'meatpack_comments'.
+        printer_metadata (dict, optional): Printer metadata (e.g. {'printer_model': 'MK4'}). Defaults to None.
+        slicer_metadata (dict, optional): Slicer metadata (e.g. settings used). Defaults to None.
+        thumbnails (list, optional): (width, height, PNG data) of thumbnails (see fullcontrol.gcode.thumbnail.thumbnails).
+            Defaults to None.
+    '''
+    if compression not in BGCODE_COMPRESSION:
+        raise ValueError(f"bgcode compression must be one of {list(BGCODE_COMPRESSION)}")
+    if encoding not in BGCODE_ENCODING:
+        raise ValueError(f"bgcode encoding must be one of {list(BGCODE_ENCODING)}")
+    stats = GcodeStats()
+    metadata_compression = 'none' if compression == 'none' else 'deflate'
+    with open(filename, 'wb') as file:
+        file.write(BGCODE_MAGIC + struct.pack('<IH', BGCODE_VERSION, BGCODE_CHECKSUM_CRC32))
+        file.write(metadata_block('file_metadata', {'Producer': 'FullControl'}))
+        file.write(metadata_block('printer_metadata', printer_metadata or {}))
+        for width, height, png_data in thumbnails or []:
+            file.write(bgcode_block('thumbnail', png_data, struct.pack('<HHH', BGCODE_THUMBNAIL_PNG, width, height)))
+        print_metadata_position = file.tell()
+        file.write(metadata_block('print_metadata', print_metadata(stats, dia_feed, density)))
+        file.write(metadata_block('slicer_metadata', slicer_metadata or {}, metadata_compression))
+        parameters = struct.pack('<H', BGCODE_ENCODING[encoding])
+        for chunk in gcode_chunks(lines):
+            for line in chunk:
+                stats.update(line)
+            if encoding == 'none':
+                data = ('\n'.join(chunk) + '\n').encode()
+            else:
+                data = meatpack_encode(chunk, comments=encoding == 'meatpack_comments')
+            file.write(bgcode_block('gcode', data, parameters, compression))
+        file.seek(print_metadata_position)
+        file.write(metadata_block('print_metadata', print_metadata(stats, dia_feed, density)))
+
+
+def read_bgcode(filename: str) -> dict:
+    '''read a prusa binary gcode file, checking block checksums. return a dict of the metadata for each metadata block
+    type, the gcode (meatpack-encoded gcode is returned as decoded, without spaces) and 'thumbnails': a list of
+    (width, height, image data)
+    '''
+    blocks, gcode, thumbnails = {}, [], []
+    with open(filename, 'rb') as file:
+        magic, version, checksum_type = struct.unpack('<4sIH', file.read(10))
+        if magic != BGCODE_MAGIC:
+            raise Exception(f"'{filename}' is not a binary gcode file")
+        while header := file.read(8):
+            block_type, compression, size = struct.unpack('<HHI', header)
+            block_type = list(BGCODE_BLOCKS)[block_type]
+            compression = list(BGCODE_COMPRESSION)[compression]
+            if compression != 'none':
+                header += file.read(4)
+            compressed_size = struct.unpack('<I', header[8:])[0] if compression != 'none' else size
+            parameters = file.read(6 if block_type == 'thumbnail' else 2)
+            data = file.read(compressed_size)
+            if checksum_type == BGCODE_CHECKSUM_CRC32 and struct.unpack('<I', file.read(4))[0] != zlib.crc32(header + parameters + data):
+                raise Exception(f"checksum error in {block_type} block of '{filename}'")
+            data = decompress(data, compression)
+            if block_type == 'gcode':
+                encoding = list(BGCODE_ENCODING)[struct.unpack('<H', parameters)[0]]
+                gcode.append(data.decode() if encoding == 'none' else meatpack_decode(data))
+            elif block_type == 'thumbnail':
+                thumbnails.append((*struct.unpack('<HH', parameters[2:]), data))
+            else:
+                blocks[block_type] = dict(line.split('=', 1) for line in data.decode().splitlines() if '=' in line)
+    blocks['gcode'], blocks['thumbnails'] = ''.join(gcode), thumbnails
+    return blocks
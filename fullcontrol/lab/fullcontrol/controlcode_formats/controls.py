@@ -5,6 +5,6 @@ from fullcontrol import GcodeControls
 
 class CodeControls(BaseModel):
     ''' Controls to adjust the language/format of a generated set of instructions (i.e. machine control code)'''
-    code_format: Optional[str] = None
+    code_format: Optional[str] = None  # '3mf' (bambulab), 'bgcode' (prusa binary gcode), 'meatpack' or 'gzip'
     controls: Optional[GcodeControls] = None
     filename: Optional[str] = 'my_design'
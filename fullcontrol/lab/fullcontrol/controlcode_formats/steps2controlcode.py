@@ -1,91 +1,194 @@
-import os
-import shutil
+import re
+import hashlib
 import zipfile
+from math import pi
+from typing import Union, Iterable
 from importlib import resources
 from lab.fullcontrol.controlcode_formats.controls import CodeControls
 from fullcontrol import GcodeControls
 
 
-def gcode_to_bambu_3mf(gcode: str, new_3mf_file: str):
-    '''Convert gcode to bambu 3mf'''
+class GcodeStats:
+    '''track print time and filament use while lines of gcode are streamed. only the information needed for 3mf
+    metadata is parsed: G0/G1 moves, F, relative/absolute positioning and extrusion (G90/G91/M82/M83) and G92 E
+    '''
+
+    def __init__(self):
+        self.position = {'X': 0.0, 'Y': 0.0, 'Z': 0.0, 'E': 0.0}
+        self.feedrate = 1000.0  # mm/min
+        self.relative_xyz = False
+        self.relative_e = False
+        self.seconds = 0.0
+        self.filament_mm = 0.0
+
+    def update(self, line: str):
+        'update statistics for one line of gcode'
+        if '\n' in line:  # some steps generate several lines of gcode at once
+            for sub_line in line.split('\n'):
+                self.update(sub_line)
+            return
+        code = line.split(';', 1)[0]
+        if code[:3] in ('G0 ', 'G1 '):
+            d_squared, d_e = 0.0, 0.0
+            for word in code.split()[1:]:
+                axis = word[0]
+                if axis not in 'XYZEF':
+                    continue
+                value = float(word[1:])
+                if axis == 'F':
+                    self.feedrate = value
+                elif axis == 'E':
+                    d_e = value if self.relative_e else value - self.position['E']
+                    self.position['E'] = self.position['E'] + value if self.relative_e else value
+                elif axis in 'XYZ':
+                    d = value if self.relative_xyz else value - self.position[axis]
+                    self.position[axis] += d
+                    d_squared += d*d
+            distance = d_squared**0.5 if d_squared > 0 else abs(d_e)
+            self.seconds += 60*distance/self.feedrate
+            if d_e > 0:
+                self.filament_mm += d_e
+        elif code.startswith('G91'):
+            self.relative_xyz = True
+        elif code.startswith('G90'):
+            self.relative_xyz = False
+        elif code.startswith('M83'):
+            self.relative_e = True
+        elif code.startswith('M82'):
+            self.relative_e = False
+        elif code.startswith('G92'):
+            for word in code.split()[1:]:
+                if word[0] in self.position:
+                    self.position[word[0]] = float(word[1:])
+
+
+def update_slice_info(slice_info: str, stats: GcodeStats, dia_feed: float, density: float) -> str:
+    'update print time, weight and filament use in the content of Metadata/slice_info.config'
+    filament_m = stats.filament_mm/1000
+    filament_g = stats.filament_mm*pi*(dia_feed/2)**2*density/1000
+    slice_info = re.sub(r'(key="prediction" value=")[^"]*(")', rf'\g<1>{int(round(stats.seconds))}\g<2>', slice_info)
+    slice_info = re.sub(r'(key="weight" value=")[^"]*(")', rf'\g<1>{filament_g:.2f}\g<2>', slice_info)
+    slice_info = re.sub(r'(used_m=")[^"]*(")', rf'\g<1>{filament_m:.2f}\g<2>', slice_info)
+    slice_info = re.sub(r'(used_g=")[^"]*(")', rf'\g<1>{filament_g:.2f}\g<2>', slice_info)
+    return slice_info
+
+
+def gcode_to_bambu_3mf(gcode: Union[str, Iterable[str]], new_3mf_file: str, dia_feed: float = 1.75, density: float = 1.24, template=None):
+    '''Convert gcode to bambu 3mf. gcode can be a string or an iterable of lines (e.g. from fullcontrol.gcode.steps2gcode.gcode_lines).
+    entries of the template 3mf are copied directly into the new 3mf and the gcode is streamed into Metadata/plate_1.gcode
+    while its md5 checksum, print time and filament use (density in g/cm3) are calculated for the 3mf metadata.
+    '''
     try: import google.colab; colab = True
     except ImportError: colab = False
 
-
     # Paths
-    new_3mf_file = new_3mf_file[:-5] if new_3mf_file.endswith('.3mf') else new_3mf_file
-    local_3mf = "/content/FC_bambulab_template.3mf" if colab else "FC_bambulab_template.3mf"
-    extract_dir = "/content/extracted_3mf" if colab else "extracted_3mf"
+    new_3mf_file = new_3mf_file[:-4] if new_3mf_file.endswith('.3mf') else new_3mf_file
     new_3mf_file = f"/content/{new_3mf_file}.3mf" if colab else f"{new_3mf_file}.3mf"
+    if template == None:
+        template = resources.files('lab.fullcontrol.controlcode_formats') / 'FC_bambulab_template.3mf'
+    lines = gcode.split('\n') if isinstance(gcode, str) else gcode
+
+    plate_gcode_file, placeholder = 'Metadata/plate_1.gcode', '; [FULLCONTROL GCODE HERE]'
+    md5_file, slice_info_file = 'Metadata/plate_1.gcode.md5', 'Metadata/slice_info.config'
+    md5, stats = hashlib.md5(), GcodeStats()
+    with template.open('rb') if hasattr(template, 'open') else open(template, 'rb') as template_file, \
+            zipfile.ZipFile(template_file, 'r') as template_zip, \
+            zipfile.ZipFile(new_3mf_file, 'w', zipfile.ZIP_DEFLATED) as new_zip:
+        for info in template_zip.infolist():
+            if info.filename in (md5_file, slice_info_file):
+                continue  # written after the gcode, when the md5 and metadata are known
+            if info.filename != plate_gcode_file:
+                new_zip.writestr(info, template_zip.read(info), compress_type=zipfile.ZIP_DEFLATED)
+                continue
+            prefix, _, suffix = template_zip.read(info).decode('utf-8').partition(placeholder)
+            with new_zip.open(plate_gcode_file, 'w') as plate_gcode:
+                def write(text: str):
+                    data = text.encode('utf-8')
+                    md5.update(data)
+                    plate_gcode.write(data)
+                write(prefix)
+                chunk, chunk_size = [], 0
+                for i, line in enumerate(lines):
+                    stats.update(line)
+                    chunk.append(line if i == 0 else '\n' + line)
+                    chunk_size += len(line)
+                    if chunk_size > 1000000:
+                        write(''.join(chunk))
+                        chunk, chunk_size = [], 0
+                write(''.join(chunk))
+                write(suffix)
+        new_zip.writestr(md5_file, md5.hexdigest().upper())
+        if slice_info_file in template_zip.namelist():
+            slice_info = template_zip.read(slice_info_file).decode('utf-8')
+            new_zip.writestr(slice_info_file, update_slice_info(slice_info, stats, dia_feed, density))
+
+    # Download the new .3mf
+    if colab:
+        from google.colab import files
+        files.download(new_3mf_file)
 
 
-    # Step 0: Get the .3mf file from the installed Python package using importlib.resources
-    with resources.files('lab.fullcontrol.controlcode_formats') / 'FC_bambulab_template.3mf' as package_3mf_path:
-        # Copy the .3mf file to the local content directory
-        if not os.path.exists(local_3mf):
-            shutil.copy(package_3mf_path, local_3mf)
-
-    # Step 1: Delete existing extracted folder and new .3mf if they exist
-    if os.path.exists(extract_dir):
-        shutil.rmtree(extract_dir)
-    if os.path.exists(new_3mf_file):
-        os.remove(new_3mf_file)
-
-    # Step 2: Extract .3mf
-    os.makedirs(extract_dir, exist_ok=True)
-    with zipfile.ZipFile(local_3mf, 'r') as zip_ref:
-        zip_ref.extractall(extract_dir)
-
-    plate_gcode_file = os.path.join(extract_dir, "Metadata", "plate_1.gcode")
-    placeholder = "; [FULLCONTROL GCODE HERE]"
-    with open(plate_gcode_file, "r", encoding="utf-8") as f:
-        content = f.read()
-    new_content = content.replace(placeholder, gcode)
-    with open(plate_gcode_file, "w", encoding="utf-8") as f:
-        f.write(new_content)
-
-    # Step 4: Repackage contents of FC_bambulab_template into a new .3mf
-    fc_template_dir = os.path.join(extract_dir)
-    with zipfile.ZipFile(new_3mf_file, 'w', zipfile.ZIP_DEFLATED) as new_zip:
-        for foldername, subfolders, filenames in os.walk(fc_template_dir):
-            for filename in filenames:
-                file_path = os.path.join(foldername, filename)
-                # Flatten the structure by ignoring FC_bambulab_template
-                arcname = os.path.relpath(file_path, fc_template_dir)
-                new_zip.write(file_path, arcname)
-
-    # Step 5: Download the new .3mf
-    if colab: 
+def compressed_gcode(lines: Iterable[str], model_controls: CodeControls, thumbnails: list = None):
+    '''write lines of gcode to a compressed file in the format set by CodeControls.code_format. thumbnails (for bgcode)
+    are (width, height, PNG data)'''
+    from lab.fullcontrol.controlcode_formats.compressed import write_bgcode, write_meatpack, write_gzip, bgcode_printer_metadata
+    try: import google.colab; colab = True
+    except ImportError: colab = False
+
+    extension = {'bgcode': '.bgcode', 'meatpack': '.meatpack', 'gzip': '.gcode.gz'}[model_controls.code_format]
+    filename = model_controls.filename[:-len(extension)] if model_controls.filename.endswith(extension) else model_controls.filename
+    filename = f"/content/{filename}{extension}" if colab else f"{filename}{extension}"
+    if model_controls.code_format == 'bgcode':
+        initialization_data = model_controls.controls.initialization_data
+        write_bgcode(lines, filename, printer_metadata=bgcode_printer_metadata(model_controls.controls.printer_name),
+                     thumbnails=thumbnails, dia_feed=initialization_data.get('dia_feed', 1.75))
+    elif model_controls.code_format == 'meatpack':
+        write_meatpack(lines, filename)
+    else:
+        write_gzip(lines, filename)
+
+    if colab:
         from google.colab import files
-        files.download(new_3mf_file)
+        files.download(filename)
 
-    # Step 6: Cleanup
-    if os.path.exists(extract_dir):
-        shutil.rmtree(extract_dir)
-    if os.path.exists(local_3mf):
-        os.remove(local_3mf)
 
 def controlcode(steps: list, model_controls: CodeControls, show_tips: bool):
 
-    if model_controls.code_format != '3mf':
-        raise ValueError("only '3mf' is currently supported for CodeControls.code_format")
-    
+    code_formats = ('3mf', 'bgcode', 'meatpack', 'gzip')
+    if model_controls.code_format not in code_formats:
+        raise ValueError(f"CodeControls.code_format must be one of {code_formats}")
+    if not isinstance(model_controls.controls, GcodeControls):
+        raise ValueError("CodeControls.controls must be a fc.GcodeControls instance at present")
+    if model_controls.controls.save_as != None:
+        raise ValueError("for fc.transform to 'control_code', don't use GcodeControl.save_as, use CodeControls.filename instead")
+
     if model_controls.code_format == '3mf':
-        if not isinstance(model_controls.controls, GcodeControls):
-            raise ValueError("CodeControls.controls must be a fc.GcodeControls instance at present")
         if model_controls.controls.printer_name != 'bambulab_x1':
             raise ValueError("only 'bambulab_x1' is currently supported for CodeControls.controls.printer_name")
-        if model_controls.controls.save_as != None:
-            raise ValueError("for fc.transform to 'control_code', and specifically 3mf, don't use GcodeControl.save_as, use CodeControls.filename instead")
-        from fullcontrol.gcode.steps2gcode import gcode
+        from fullcontrol.gcode.steps2gcode import gcode_lines
         from fullcontrol.common import fix
         steps = fix(steps, 'gcode', model_controls.controls)
-        gcode_str = gcode(steps, model_controls.controls, show_tips)
+        lines = gcode_lines(steps, model_controls.controls, show_tips)
 
-        gcode_str = gcode_str.split('\n')
-        gcode_str = gcode_str[:15] + gcode_str[16:20] + gcode_str[22:]
+        # skip lines for aux fan, purge and rise in the bambulab starting procedure
+        lines = (sub_line for line in lines for sub_line in line.split('\n'))
+        lines = (line for i, line in enumerate(lines) if i not in (15, 20, 21))
         print('during 3mf generation, gcode lines for aux fan, purge and rise were deleted from the bamulab starting procedure')
-        gcode_str = '\n'.join(gcode_str)
-
-        gcode_to_bambu_3mf(gcode_str, model_controls.filename)
 
+        dia_feed = model_controls.controls.initialization_data.get('dia_feed', 1.75)
+        gcode_to_bambu_3mf(lines, model_controls.filename, dia_feed=dia_feed)
+    else:
+        from fullcontrol.gcode.steps2gcode import gcode_lines
+        from fullcontrol.common import fix
+        controls, thumbnails = model_controls.controls, None
+        steps = fix(steps, 'gcode', controls)
+        if model_controls.code_format == 'bgcode' and controls.thumbnails:
+            # bgcode has thumbnail blocks rather than thumbnail comments in the gcode
+            from copy import deepcopy
+            from fullcontrol.gcode.state import printer_initialization_data
+            from fullcontrol.gcode.thumbnail import thumbnails as render_thumbnails
+            controls.initialize()
+            thumbnails = render_thumbnails(steps, controls.thumbnails, printer_initialization_data(controls))
+            controls = deepcopy(controls)
+            controls.thumbnails = None
+        compressed_gcode(gcode_lines(steps, controls, show_tips), model_controls, thumbnails)
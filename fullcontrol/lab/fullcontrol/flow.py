@@ -0,0 +1,120 @@
+import numpy as np
+from fullcontrol import Point, Printer, GcodeControls, flatten
+from fullcontrol.gcode.limits import design_arrays, LIMIT_TOLERANCE
+import fullcontrol.devices.community.singletool.base_settings as base_settings
+
+# volumetric flow (mm3/s) of each extruding segment is print speed (mm/min) / 60 * extrusion area (mm2). flow is
+# clamped to max_flow, then limited by max_flow_acceleration: with flow changing at a constant rate a, flow**2 changes
+# linearly with the volume extruded (d(Q**2)/dV = 2a), just as speed**2 changes linearly with distance for constant
+# acceleration. so each limit is a running minimum of Q**2 -/+ 2a*V, calculated forwards (for increasing flow) and
+# backwards (for decreasing flow) along each continuous extruding path with numpy
+
+
+def running_minimum(values: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    'running minimum of values, restarting for each group (groups are consecutive and increasing integers)'
+    spread = np.nanmax(values) - np.nanmin(values) + 1 if len(values) > 0 else 1
+    return np.minimum.accumulate(values - groups*spread) + groups*spread
+
+
+def flow_limited_speeds(arrays: dict, max_flow: float = None, max_flow_acceleration: float = None) -> np.ndarray:
+    '''
+    Return the print speed (mm/min) for the move to each point in a design (from design_arrays) so that volumetric
+    flow does not exceed max_flow (mm3/s) and does not change faster than max_flow_acceleration (mm3/s2) within a
+    continuous extruding path. Moves that are not extruding keep their print speed.
+    '''
+    xyz, on, area, print_speed = arrays['xyz'], arrays['on'], arrays['area'], arrays['print_speed']
+    speed = print_speed.copy()
+    if len(xyz) < 2:
+        return speed
+    # segment k is the move from point k to point k+1
+    length = np.linalg.norm(np.nan_to_num(np.diff(xyz, axis=0)), axis=1)
+    extruding = on[1:] & (area[1:] > 0) & (length > 0)
+    flow = np.where(extruding, print_speed[1:]/60*area[1:], np.nan)
+    limit = np.minimum(flow, max_flow) if max_flow != None else flow.copy()
+
+    if max_flow_acceleration != None:
+        segments = np.flatnonzero(extruding)
+        # continuous paths are runs of consecutive extruding segments
+        path = np.cumsum(np.concatenate([[1], np.diff(segments) != 1]))
+        volume = length[segments]*area[segments + 1]
+        path_start = np.flatnonzero(np.concatenate([[True], path[1:] != path[:-1]]))
+        volume_before = np.cumsum(volume) - volume
+        volume_before -= np.repeat(volume_before[path_start], np.diff(np.concatenate([path_start, [len(segments)]])))
+        a2v = 2*max_flow_acceleration*volume_before
+        squared = limit[segments]**2
+        # forwards: flow can only increase from earlier segments of the path at the maximum rate
+        squared = np.minimum(squared, running_minimum(squared - a2v, path) + a2v)
+        # backwards: flow can only decrease towards later segments of the path at the maximum rate
+        squared = np.minimum(squared, running_minimum((squared + a2v)[::-1], path[::-1].max() - path[::-1])[::-1] - a2v)
+        limit[segments] = np.sqrt(np.maximum(squared, 0))
+
+    # flows within check_limits' tolerance of their limit are left unchanged, and all others are clamped, so the
+    # speeds pass check_limits
+    limited = extruding & (flow > limit*(1 + LIMIT_TOLERANCE))
+    speed[1:][limited] = limit[limited]*60/area[1:][limited]
+    return speed
+
+
+def limit_flow(steps: list, controls: GcodeControls = None, max_flow: float = None, max_flow_acceleration: float = None,
+               speed_resolution: float = 1, report: bool = False) -> list:
+    '''
+    Reduce print speeds in a design so that volumetric flow stays within the capacity of the hotend, accounting for
+    changes of ExtrusionGeometry along the design. Printer(print_speed=...) steps are added only where the print speed
+    needs to change, and the design's own print speed is restored after sections that were slowed down.
+
+    Args:
+        steps (list): The design.
+        controls (GcodeControls, optional): Controls of the printer - used for initial speeds and extrusion geometry,
+            and for max_volumetric_flow (mm3/s) if max_flow is not given. Defaults to None (base settings).
+        max_flow (float, optional): Maximum volumetric flow (mm3/s). Defaults to None (the printer's max_volumetric_flow).
+        max_flow_acceleration (float, optional): Maximum rate of change of volumetric flow (mm3/s2) along a continuous
+            extruding path, so flow ramps smoothly (e.g. where extrusion width increases). Defaults to None (no limit).
+        speed_resolution (float, optional): Reduced speeds are rounded down to a multiple of this (mm/min), to avoid
+            speed changes for tiny differences. Defaults to 1.
+        report (bool, optional): Whether to print the number of segments slowed down. Defaults to False.
+
+    Returns:
+        list: The design with Printer steps added before Points where the print speed changes.
+    '''
+    if controls != None:
+        from fullcontrol.gcode.state import printer_initialization_data
+        controls.initialize()
+        initialization_data = printer_initialization_data(controls)
+    else:
+        initialization_data = base_settings.default_initial_settings
+    if max_flow == None:
+        max_flow = initialization_data.get('max_volumetric_flow')
+    if max_flow == None and max_flow_acceleration == None:
+        raise Exception('set max_flow (or max_volumetric_flow in GcodeControls.initialization_data) or max_flow_acceleration to limit flow')
+
+    steps = flatten(steps)
+    arrays = design_arrays(steps, initialization_data)
+    point_steps, print_speed = arrays['step'], arrays['print_speed']
+    speed = flow_limited_speeds(arrays, max_flow, max_flow_acceleration)
+    slowed = speed < print_speed
+    speed[slowed] = np.floor(speed[slowed]/speed_resolution)*speed_resolution
+
+    # print speed wanted for each point: the (possibly reduced) speed for extruding moves. travel moves keep the speed
+    # wanted for the previous point (the print speed doesn't matter for travel) unless the design sets a print speed
+    printer_steps = [index for index, step in enumerate(steps) if isinstance(step, Printer) and step.print_speed != None]
+    following_point = np.searchsorted(point_steps, printer_steps)
+    design_sets = np.zeros(len(point_steps), dtype=bool)
+    design_sets[following_point[following_point < len(point_steps)]] = True
+    design_sets[0] = True
+    wanted = np.where(arrays['on'] | design_sets, speed, np.nan)
+    last = np.where(np.isnan(wanted), 0, np.arange(len(wanted)))
+    np.maximum.accumulate(last, out=last)
+    wanted = wanted[last]
+    # the speed before each point is the design's if it set one since the previous point, otherwise the previous wanted speed
+    before = np.where(design_sets, print_speed, np.concatenate([[np.nan], wanted[:-1]]))
+    change = np.flatnonzero(wanted != before)
+
+    inserts = dict(zip(point_steps[change].tolist(), wanted[change].tolist()))
+    new_steps = []
+    for index, step in enumerate(steps):
+        if index in inserts:
+            new_steps.append(Printer(print_speed=inserts[index]))
+        new_steps.append(step)
+    if report:
+        print(f'limit_flow: {int(slowed.sum())} of {int(arrays["on"][1:].sum())} extruding moves slowed down, with {len(inserts)} print speed changes added')
+    return new_steps
@@ -0,0 +1,346 @@
+import io
+import gc
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from math import pi, ceil
+from fullcontrol import Point, Extruder, ExtrusionGeometry, StationaryExtrusion, Printer, Hotend, Buildplate, Fan, ManualGcode
+
+# gcode is parsed in chunks of whole lines. each chunk is tokenised with numpy: every letter outside a comment starts a
+# word, and the number after it is converted to a float in bulk. modal state (positions, relative/absolute modes,
+# feedrate, layer) is resolved for all lines in a chunk at once with cumulative sums and forward-fills, and carried
+# from one chunk to the next. about 20 MB/s (0.4 million lines/s) is achieved on a typical single-core machine, mostly
+# spent converting the numbers of words to floats with numpy - well short of hundreds of MB/s, which needs a compiled
+# tokeniser
+
+LINE_TYPES = {'blank': 0, 'other': 1, 'G0': 2, 'G1': 3, 'G2': 4, 'G3': 5, 'G92': 6, 'G90': 7, 'G91': 8, 'M82': 9,
+              'M83': 10, 'M104': 11, 'M109': 12, 'M140': 13, 'M190': 14, 'M106': 15, 'M107': 16}
+# 'blank' lines have no gcode words (e.g. empty or comment-only lines). 'other' lines have gcode words but no
+# recognised command (e.g. G28, M84, or a line with only an F word)
+
+PARAMETERS = 'XYZEFIJS'  # letters of the parameters parsed into columns
+WORD_WIDTH = 16  # numbers with more characters than this are parsed individually (slower)
+
+# commands are looked up by letter*65536 + number
+COMMAND_KEYS = np.array(sorted(ord(name[0])*65536 + int(name[1:]) for name in LINE_TYPES if name[0] in 'GM'))
+COMMAND_TYPES = np.array([LINE_TYPES[f'{chr(key//65536)}{key % 65536}'] for key in COMMAND_KEYS], dtype=np.int8)
+
+
+class GcodeData:
+    '''
+    Columnar representation of parsed gcode, with one element in each array for every line of gcode:
+    - x, y, z: the position after the line (in the gcode coordinate system, i.e. after any G92 offsets). NaN until known
+    - e: the extrusion (or retraction if negative) of the line, regardless of relative/absolute extrusion mode
+    - f: the feedrate in effect after the line. NaN until set
+    - type: the type of line (see LINE_TYPES)
+    - layer: the layer number. a new layer starts wherever the z of extruding moves (moves with xy motion and E>0,
+      so stationary priming is ignored) changes (in spiral vase designs, every extruding move that rises is therefore
+      a new layer)
+    - i, j, s: the I, J and S parameters of the line (NaN if not present)
+    The text of 'other' lines (without comments) is saved in the dictionary 'other' with the line index as the key.
+    '''
+
+    def __init__(self, columns: dict, other: dict):
+        for name, values in columns.items():
+            setattr(self, name, values)
+        self.other = other
+
+    def __len__(self):
+        return len(self.type)
+
+    def moves(self) -> np.ndarray:
+        'return a boolean array which is True for lines that are moves (G0/G1/G2/G3)'
+        return (self.type >= LINE_TYPES['G0']) & (self.type <= LINE_TYPES['G3'])
+
+    def extruding(self) -> np.ndarray:
+        'return a boolean array which is True for moves that extrude material'
+        return self.moves() & (self.e > 0)
+
+    def points(self, extruding_only: bool = False) -> np.ndarray:
+        'return an array of the xyz position at the end of every move (or every extruding move): shape (moves, 3)'
+        mask = self.extruding() if extruding_only else self.moves()
+        return np.stack([self.x[mask], self.y[mask], self.z[mask]], axis=1)
+
+    def to_steps(self, filament_diameter: float = 1.75, arc_segment_length: float = 0.5, keep_other: bool = False) -> list:
+        '''
+        Convert the gcode into a list of fullcontrol steps, so it can be analysed, transformed and re-posted with
+        fc.transform(). Extrusion is converted into ExtrusionGeometry(area_model='manual') based on the volume extruded
+        per mm of each move, so re-posted gcode extrudes the same amount of material. Retractions and extrusions without
+        movement become StationaryExtrusion. Feedrates become Printer print_speed/travel_speed, and M104/M109, M140/M190
+        and M106/M107 become Hotend, Buildplate and Fan. G2/G3 arcs (I/J format) are converted to segments of about
+        arc_segment_length. 'other' lines are converted to ManualGcode if keep_other=True (off by default since start
+        and end gcode are normally generated by fullcontrol during re-posting). Each step is a validated python object,
+        so this takes about 8 s per million moves - use the arrays directly for analysis of large files.
+
+        Args:
+            filament_diameter (float, optional): Filament diameter used to convert E values to volume. Set to None if E values are volumes (mm3). Defaults to 1.75.
+            arc_segment_length (float, optional): Approximate length of segments used for arcs. Defaults to 0.5.
+            keep_other (bool, optional): Whether to include 'other' lines as ManualGcode. Defaults to False.
+
+        Returns:
+            list: A list of fullcontrol steps.
+        '''
+        filament_area = pi*(filament_diameter/2)**2 if filament_diameter != None else 1
+        moves, types = self.moves(), self.type
+        start = np.stack([np.r_[np.nan, self.x[:-1]], np.r_[np.nan, self.y[:-1]], np.r_[np.nan, self.z[:-1]]], axis=1)
+        end = np.stack([self.x, self.y, self.z], axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            length = np.linalg.norm(end - start, axis=1)
+            # arcs: centre is relative to the start point. sweep is negative for clockwise (G2) arcs
+            arcs = np.flatnonzero(((types == LINE_TYPES['G2']) | (types == LINE_TYPES['G3'])) & ~np.isnan(self.i + self.j) & ~np.isnan(start[:, 0]))
+            centre = start[arcs, :2] + np.stack([self.i[arcs], self.j[arcs]], axis=1)
+            radius = np.hypot(self.i[arcs], self.j[arcs])
+            start_angle = np.arctan2(start[arcs, 1] - centre[:, 1], start[arcs, 0] - centre[:, 0])
+            end_angle = np.arctan2(end[arcs, 1] - centre[:, 1], end[arcs, 0] - centre[:, 0])
+            clockwise = types[arcs] == LINE_TYPES['G2']
+            sweep = np.where(clockwise, -((start_angle - end_angle) % (2*pi)), (end_angle - start_angle) % (2*pi))
+            sweep[sweep == 0] = np.where(clockwise, -2*pi, 2*pi)[sweep == 0]  # same start and end: full circle
+            length[arcs] = np.hypot(radius*sweep, end[arcs, 2] - start[arcs, 2])
+            moved = moves & ~(length <= 1e-9)  # the first move (with unknown start) counts as moved
+            area = np.where(moved & (self.e > 0), self.e*filament_area/length, 0)
+        arc_data = {line: (centre[n], radius[n], start_angle[n], sweep[n]) for n, line in enumerate(arcs.tolist())}
+
+        steps = []
+        extruder_on, area_now, print_speed, travel_speed = None, None, None, None
+        x, y, z, e, f, s = (column.tolist() for column in (self.x, self.y, self.z, self.e, self.f, self.s))
+        moved, area = moved.tolist(), area.tolist()
+        # the steps are not reference cycles, so the garbage collector is paused while they are created (otherwise it
+        # repeatedly scans the growing list of steps, which takes almost as long as creating them)
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for line, line_type in zip(np.flatnonzero(types > LINE_TYPES['blank']).tolist(), types[types > LINE_TYPES['blank']].tolist()):
+                if LINE_TYPES['G0'] <= line_type <= LINE_TYPES['G3']:
+                    if e[line] != 0 and (not moved[line] or e[line] < 0):
+                        # extrusion without movement, or retraction during a travel move
+                        steps.append(StationaryExtrusion(volume=e[line]*filament_area, speed=round(f[line]) if f[line] == f[line] else 1000))
+                    if not moved[line]:
+                        continue
+                    if area[line] > 0:
+                        if extruder_on != True:
+                            steps.append(Extruder(on=True))
+                            extruder_on = True
+                        if area_now == None or abs(area[line] - area_now) > 0.01*area_now:
+                            steps.append(ExtrusionGeometry(area_model='manual', area=area[line]))
+                            area_now = area[line]
+                        if f[line] != print_speed and f[line] == f[line]:
+                            steps.append(Printer(print_speed=f[line]))
+                            print_speed = f[line]
+                    else:
+                        if extruder_on != False:
+                            steps.append(Extruder(on=False))
+                            extruder_on = False
+                        if f[line] != travel_speed and f[line] == f[line]:
+                            steps.append(Printer(travel_speed=f[line]))
+                            travel_speed = f[line]
+                    if line in arc_data:
+                        steps.extend(arc_points(*arc_data[line], z[line-1], z[line], arc_segment_length))
+                    else:
+                        steps.append(Point(x=none_if_nan(x[line]), y=none_if_nan(y[line]), z=none_if_nan(z[line])))
+                elif line_type in (LINE_TYPES['M104'], LINE_TYPES['M109']) and s[line] == s[line]:
+                    steps.append(Hotend(temp=round(s[line]), wait=line_type == LINE_TYPES['M109']))
+                elif line_type in (LINE_TYPES['M140'], LINE_TYPES['M190']) and s[line] == s[line]:
+                    steps.append(Buildplate(temp=round(s[line]), wait=line_type == LINE_TYPES['M190']))
+                elif line_type == LINE_TYPES['M106']:
+                    steps.append(Fan(speed_percent=round(100*s[line]/255) if s[line] == s[line] else 100))
+                elif line_type == LINE_TYPES['M107']:
+                    steps.append(Fan(speed_percent=0))
+                elif line_type == LINE_TYPES['other'] and keep_other and self.other[line] != '':
+                    steps.append(ManualGcode(text=self.other[line]))
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return steps
+
+
+def none_if_nan(value: float) -> float:
+    return None if value != value else value
+
+
+def arc_points(centre: np.ndarray, radius: float, start_angle: float, sweep: float, z_start: float, z_end: float, segment_length: float) -> list:
+    'return Points along an arc (excluding the start point), with z changing linearly for helical arcs'
+    segments = max(1, ceil(abs(sweep)*radius/segment_length))
+    t = np.arange(1, segments+1)/segments
+    angles = start_angle + sweep*t
+    xs, ys = (centre[0] + radius*np.cos(angles)).tolist(), (centre[1] + radius*np.sin(angles)).tolist()
+    zs = (z_start + (z_end - z_start)*t).tolist()
+    return [Point(x=xs[n], y=ys[n], z=none_if_nan(zs[n])) for n in range(segments)]
+
+
+def forward_fill(mask: np.ndarray, values: np.ndarray, initial) -> np.ndarray:
+    'return an array where each element is the value at the most recent index where mask is True (or initial if there is none)'
+    index = np.where(mask, np.arange(len(mask)), -1)
+    np.maximum.accumulate(index, out=index)
+    return np.where(index >= 0, values[np.maximum(index, 0)], initial)
+
+
+def axis_position(values: np.ndarray, moves: np.ndarray, relative: np.ndarray, reset: np.ndarray, initial: float) -> np.ndarray:
+    'return the position of an axis after each line, for relative moves, absolute moves and resets (G92)'
+    present = ~np.isnan(values)
+    cumulative = np.cumsum(np.where(moves & present & relative, values, 0.0))
+    absolute = present & ((moves & ~relative) | reset)
+    return cumulative + forward_fill(absolute, values - cumulative, initial)
+
+
+def parse_words(chunk: bytes):
+    '''return the letter (upper case), value and line index of each word (outside comments) in a chunk of gcode that
+    ends with a newline, and the positions of newline characters'''
+    data = np.frombuffer(chunk + b' '*WORD_WIDTH, dtype=np.uint8)
+    newlines = np.flatnonzero(data == 10)
+    lower = data | 0x20
+    is_letter = (lower >= 97) & (lower <= 122)
+    # a letter starts a word unless it is followed by another letter (e.g. text of M117)
+    letters = np.flatnonzero(is_letter[:-1] & ~is_letter[1:])
+    line = np.searchsorted(newlines, letters)
+    # ignore letters in comments, which start at the first semicolon of a line
+    semicolons = np.flatnonzero(data == 59)
+    if len(semicolons) > 0:
+        comment_start = newlines.copy()
+        semicolon_line = np.searchsorted(newlines, semicolons)
+        first = np.r_[True, semicolon_line[1:] != semicolon_line[:-1]]
+        comment_start[semicolon_line[first]] = semicolons[first]
+        code = letters < comment_start[line]
+        letters, line = letters[code], line[code]
+    chars = sliding_window_view(data, WORD_WIDTH)[letters + 1]
+    is_number = ((chars >= 48) & (chars <= 57)) | (chars == 46) | (chars == 45) | (chars == 43)
+    np.logical_and.accumulate(is_number, axis=1, out=is_number)  # characters up to the end of the number
+    chars *= is_number
+    strings = chars.view(f'S{WORD_WIDTH}').ravel()
+    strings[~is_number[:, 0]] = b'nan'  # words without a number (e.g. G28 X)
+    try:
+        values = strings.astype(np.float64)
+    except ValueError:  # e.g. a word with only '-'
+        values = np.array([to_float(string) for string in strings.tolist()])
+    long = np.flatnonzero(is_number[:, -1])  # numbers longer than WORD_WIDTH are parsed individually
+    for word in long.tolist():
+        end = letters[word] + 1
+        while end < len(chunk) and chunk[end] in b'0123456789.-+':
+            end += 1
+        values[word] = to_float(chunk[letters[word] + 1:end])
+    return data[letters] & 0xDF, values, line, newlines
+
+
+def to_float(string: bytes) -> float:
+    try:
+        return float(string)
+    except ValueError:
+        return np.nan
+
+
+def parse_chunk(chunk: bytes, state: dict, line_offset: int, other: dict) -> dict:
+    'parse a chunk of gcode (ending with a newline) into columns, continuing from (and updating) the modal state'
+    letters, values, line, newlines = parse_words(chunk)
+    n_lines = len(newlines)
+
+    types = np.zeros(n_lines, dtype=np.int8)
+    types[line] = LINE_TYPES['other']
+    command = np.flatnonzero((letters == 71) | (letters == 77))  # G or M
+    first = np.r_[True, line[command[1:]] != line[command[:-1]]] if len(command) > 0 else np.zeros(0, dtype=bool)
+    command = command[first]
+    number = values[command]
+    key = np.where(number == np.floor(number), letters[command].astype(np.int64)*65536 + np.nan_to_num(number, nan=-1).astype(np.int64), -1)
+    index = np.minimum(np.searchsorted(COMMAND_KEYS, key), len(COMMAND_KEYS) - 1)
+    known = COMMAND_KEYS[index] == key
+    types[line[command[known]]] = COMMAND_TYPES[index[known]]
+
+    columns = {}
+    for letter in PARAMETERS:
+        column = np.full(n_lines, np.nan)
+        mask = letters == ord(letter)
+        column[line[mask]] = values[mask]
+        columns[letter] = column
+
+    moves = (types >= LINE_TYPES['G0']) & (types <= LINE_TYPES['G3'])
+    reset = types == LINE_TYPES['G92']
+    mode_xyz = (types == LINE_TYPES['G90']) | (types == LINE_TYPES['G91'])
+    mode_e = mode_xyz | (types == LINE_TYPES['M82']) | (types == LINE_TYPES['M83'])
+    relative_xyz = forward_fill(mode_xyz, types == LINE_TYPES['G91'], state['relative_xyz'])
+    relative_e = forward_fill(mode_e, (types == LINE_TYPES['G91']) | (types == LINE_TYPES['M83']), state['relative_e'])
+
+    result = {axis: axis_position(columns[axis.upper()], moves, relative_xyz, reset, state[axis]) for axis in 'xyz'}
+    e_position = axis_position(columns['E'], moves, relative_e, reset, state['e'])
+    e_previous = np.r_[state['e'], e_position[:-1]]
+    with np.errstate(invalid='ignore'):
+        extrusion = np.where(relative_e, columns['E'], columns['E'] - e_previous)
+    result['e'] = np.where(moves & ~np.isnan(columns['E']), extrusion, 0.0)
+    result['f'] = forward_fill(~np.isnan(columns['F']), columns['F'], state['f'])
+    result['type'] = types
+    for parameter in 'ijs':
+        result[parameter] = columns[parameter.upper()]
+
+    # layers: a new layer starts wherever the z of extruding moves (moves with xy motion and E>0 - not stationary
+    # extrusion such as priming) changes
+    x_previous, y_previous = np.r_[state['x'], result['x'][:-1]], np.r_[state['y'], result['y'][:-1]]
+    xy_motion = (result['x'] != x_previous) | (result['y'] != y_previous)
+    extruding = np.flatnonzero(moves & (result['e'] > 0) & xy_motion & ~np.isnan(result['z']))
+    z_extruding = result['z'][extruding]
+    new_layer = np.zeros(n_lines, dtype=np.int64)
+    new_layer[extruding] = z_extruding != np.r_[state['z_extruding'], z_extruding[:-1]]
+    layer_count = state['layer_count'] + np.cumsum(new_layer)
+    result['layer'] = np.maximum(layer_count - 1, 0).astype(np.int32)
+
+    for line_index in np.flatnonzero(types == LINE_TYPES['other']).tolist():
+        start = newlines[line_index - 1] + 1 if line_index > 0 else 0
+        text = chunk[start:newlines[line_index]].split(b';', 1)[0].strip()
+        other[line_offset + line_index] = text.decode(errors='replace')
+
+    if n_lines > 0:
+        state.update(x=result['x'][-1], y=result['y'][-1], z=result['z'][-1], e=e_position[-1], f=result['f'][-1],
+                     relative_xyz=relative_xyz[-1], relative_e=relative_e[-1], layer_count=layer_count[-1])
+        if len(extruding) > 0:
+            state['z_extruding'] = z_extruding[-1]
+    return result
+
+
+def parse_stream(stream, chunk_mb: float) -> GcodeData:
+    'parse gcode from a binary stream, reading chunk_mb at a time'
+    state = dict(x=np.nan, y=np.nan, z=np.nan, e=0.0, f=np.nan, relative_xyz=False, relative_e=False, z_extruding=np.nan, layer_count=0)
+    chunks, other, line_offset, remainder = [], {}, 0, b''
+    while True:
+        block = stream.read(max(int(chunk_mb*1e6), 1))
+        if not block:
+            break
+        block = remainder + block
+        end = block.rfind(b'\n') + 1
+        if end == 0:  # a line longer than the chunk size
+            remainder = block
+            continue
+        chunks.append(parse_chunk(block[:end], state, line_offset, other))
+        line_offset += len(chunks[-1]['type'])
+        remainder = block[end:]
+    if remainder:
+        chunks.append(parse_chunk(remainder + b'\n', state, line_offset, other))
+    if not chunks:
+        chunks.append(parse_chunk(b'', state, 0, other))
+    return GcodeData({name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}, other)
+
+
+def read_gcode(filename: str, chunk_mb: float = 4) -> GcodeData:
+    '''
+    Read a gcode file into columnar arrays (see GcodeData). The file is read and parsed in chunks of about chunk_mb.
+
+    G0/G1/G2/G3 moves, G92, G90/G91, M82/M83, F and common M-codes (M104/M109, M140/M190, M106/M107) are
+    recognised. Use GcodeData.to_steps() to convert the gcode into fullcontrol steps. Parsing runs at about 20 MB/s.
+
+    Args:
+        filename (str): The gcode file.
+        chunk_mb (float, optional): Size of chunks that are parsed at a time (MB). Defaults to 4.
+
+    Returns:
+        GcodeData: The parsed gcode.
+    '''
+    with open(filename, 'rb') as f:
+        return parse_stream(f, chunk_mb)
+
+
+def parse_gcode(gcode: str, chunk_mb: float = 4) -> GcodeData:
+    '''
+    Parse a gcode string (e.g. generated by fc.transform) into columnar arrays (see GcodeData and read_gcode).
+
+    Args:
+        gcode (str): The gcode.
+        chunk_mb (float, optional): Size of chunks that are parsed at a time (MB). Defaults to 4.
+
+    Returns:
+        GcodeData: The parsed gcode.
+    '''
+    return parse_stream(io.BytesIO(gcode.encode()), chunk_mb)
@@ -5,8 +5,8 @@ from fullcontrol.geometry import Point
 from lab.fullcontrol.geometry.bezier import bezier, bezierXYdiscrete, bezier_through_points
 from lab.fullcontrol.geometry.convex import convex_pathsXY
 from lab.fullcontrol.geometry.reflectXYpolar_list import reflectXYpolar_list
-from lab.fullcontrol.geometry.intersect import line_intersection_by_points_XY, line_intersection_by_polar_XY, crossing_lines_check_XY
-from lab.fullcontrol.geometry.offset_path import offset_path
+from lab.fullcontrol.geometry.intersect import line_intersection_by_points_XY, line_intersection_by_polar_XY, crossing_lines_check_XY, segment_crossings_XY, path_crossings_XY
+from lab.fullcontrol.geometry.offset_path import offset_path, offset_paths, offset_polygon
 from lab.fullcontrol.geometry.loop_between_lines import loop_between_lines
 from lab.fullcontrol.geometry.rotate import rotate
 from lab.fullcontrol.geometry.spherical import point_to_spherical, spherical_to_point, spherical_to_vector, angleZ
@@ -1,4 +1,5 @@
 from lab.fullcontrol.geometry import Point
+import numpy as np
 
 # Bezier curve
 # from https://orthallelous.wordpress.com/2020/06/21/pure-python-bezier-curve/
@@ -60,11 +61,73 @@ def bezier_original(clpts, numpts=10, endpt=True):
     return xy
 
 
-def bezier(control_points, num_points=10, end_point=True):
-    'returns a bezier curve with num_points based on the supplied control points, ending on the final control point if end_point is True. returns list of points in curve'
-    clpts = [[point.x, point.y, point.z] for point in control_points]
-    bez_curve = bezier_original(clpts, num_points, end_point)
-    return [Point(x=bez_curve[i][0], y=bez_curve[i][1], z=bez_curve[i][2]) for i in range(len(bez_curve))]
+def bernstein_matrix(degree: int, t: np.ndarray) -> np.ndarray:
+    ''' return the bernstein basis polynomials of the given degree for all parameter values t at once, as an array of
+    shape (len(t), degree+1). for high degrees (where binomial coefficients overflow floats) the polynomials are 
+    calculated in log space
+    '''
+    t = np.asarray(t, dtype=float)[:, None]
+    i = np.arange(degree + 1)
+    if degree <= 100:
+        ncr = np.array([comb(degree, k) for k in range(degree + 1)], dtype=float)
+        return ncr * t ** i * (1 - t) ** (degree - i)
+    log_ncr = np.concatenate([[0], np.cumsum(np.log(np.arange(degree, 0, -1)) - np.log(np.arange(1, degree + 1)))])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_b = log_ncr + np.where(i == 0, 0, i*np.log(t)) + np.where(i == degree, 0, (degree - i)*np.log(1 - t))
+    return np.exp(log_b)
+
+
+def bezier_array(control_points: np.ndarray, t: np.ndarray) -> np.ndarray:
+    ''' evaluate a bezier curve of any degree for all parameter values t (0 to 1) at once in matrix form. control_points
+    is an array of shape (n, dimensions). returns an array of shape (len(t), dimensions)
+    '''
+    control_points = np.asarray(control_points, dtype=float)
+    return bernstein_matrix(len(control_points) - 1, t) @ control_points
+
+
+def adaptive_parameters(curve, t: np.ndarray, tolerance: float, max_iterations: int = 30) -> np.ndarray:
+    ''' return parameter values for sampling a curve so that each straight segment deviates from the curve by less than
+    'tolerance' (chord tolerance). curve(t) must return an array of points for an array of parameter values. starting
+    from the parameter values in t, every interval that deviates from its chord by more than the tolerance is split in 
+    two. the deviation is approximately curvature*length^2/8, so intervals are split more where the curve is tight and
+    long straight sections are left as single segments. all intervals are checked at once in each iteration
+    '''
+    t = np.asarray(t, dtype=float)
+    for _ in range(max_iterations):
+        points = curve(t)
+        chords = points[1:] - points[:-1]
+        lengths_squared = np.maximum(np.sum(chords**2, axis=1), 1e-300)
+        deviation = np.zeros(len(chords))
+        # the quarter points are also checked so that s-shaped intervals (with their midpoint on the chord) are split
+        for fraction in (0.25, 0.5, 0.75):
+            offsets = curve(t[:-1] + fraction*(t[1:] - t[:-1])) - points[:-1]
+            along = np.clip(np.sum(offsets*chords, axis=1)/lengths_squared, 0, 1)
+            deviation = np.maximum(deviation, np.linalg.norm(offsets - along[:, None]*chords, axis=1))
+        split = deviation > tolerance
+        if not split.any():
+            break
+        t = np.insert(t, np.flatnonzero(split) + 1, (t[:-1][split] + t[1:][split])/2)
+    return t
+
+
+def bezier(control_points, num_points=10, end_point=True, tolerance: float = None, as_array: bool = False):
+    ''' returns a bezier curve with num_points based on the supplied control points, ending on the final control point 
+    if end_point is True. returns list of points in curve. the curve is evaluated for all points at once in matrix form, 
+    for any number of control points. if tolerance is set, num_points is ignored and the curve is adaptively sampled so 
+    that no segment deviates from the curve by more than tolerance (fewer points on straighter sections). set 
+    as_array=True to return a numpy array of xyz coordinates instead of Points
+    '''
+    clpts = np.array([[point.x, point.y, point.z] for point in control_points], dtype=float)
+    if len(clpts) < 2:
+        raise ValueError("at least two control points are required")
+    if tolerance != None:
+        t = adaptive_parameters(lambda t: bezier_array(clpts, t), np.linspace(0, 1, len(clpts)), tolerance)
+    else:
+        t = np.arange(num_points)/float(num_points - 1 if end_point else num_points)
+    bez_curve = bezier_array(clpts, t)
+    if as_array:
+        return bez_curve
+    return [Point(x=x, y=y, z=z) for x, y, z in bez_curve.tolist()]
 
 
 def bezierXYdiscrete(control_points, num_points=10, end_point=True):
@@ -77,57 +140,21 @@ def refine_bezier_points(control_points, segments_between_control_points=10, ite
     iteration fraction indicates how far to move the control points in each iteration, relative to the distance
     between the nearest point of the bezier curve to the control point. return list of new control points'''
 
-    from copy import deepcopy
-
-    def calculate_bezier(t, ctrl_points):
-        n = len(ctrl_points) - 1
-        result = Point(x=0, y=0, z=0)
-        for i in range(n + 1):
-            binomial = binomial_coefficient(n, i)
-            result = add_points(result, scale_point(binomial * (1 - t) ** (n - i) * t ** i, ctrl_points[i]))
-        return result
-
-    def binomial_coefficient(n, k):
-        if 0 <= k <= n:
-            result = 1
-            for i in range(1, min(k, n - k) + 1):
-                result = result * (n - i + 1) // i
-            return result
-        else:
-            return 0
-
-    def subtract_points(point1, point2):
-        return Point(x=point1.x - point2.x, y=point1.y - point2.y, z=point1.z - point2.z)
-
-    def add_points(point1, point2):
-        return Point(x=point1.x + point2.x, y=point1.y + point2.y, z=point1.z + point2.z)
-
-    def scale_point(scalar, point):
-        return Point(x=scalar * point.x, y=scalar * point.y, z=scalar * point.z)
-
-    def magnitude(point):
-        return (point.x ** 2 + point.y ** 2 + point.z ** 2) ** 0.5
-
     num_points = (segments_between_control_points * (len(control_points)-1))+1
-    adjusted_control_points = deepcopy(control_points)
+    t = np.arange(num_points + 1)/num_points
+    basis = bernstein_matrix(len(control_points) - 1, t)
+    original = np.array([[point.x, point.y, point.z] for point in control_points], dtype=float)
+    adjusted = original.copy()
     for _ in range(iterations):
-        curve_points = []
-        for t in [i / num_points for i in range(num_points + 1)]:
-            curve_points.append(calculate_bezier(t, adjusted_control_points))
-
-        for i, original_point in enumerate(control_points):
-            closest_point = min(curve_points, key=lambda p: magnitude(subtract_points(p, original_point)))
-            distance = magnitude(subtract_points(closest_point, original_point))
-
-            # Check for zero distance to avoid division by zero
-            if distance == 0:
-                pass
-            else:
-                move_distance = iteration_fraction * distance
-                direction = scale_point(1 / distance, subtract_points(original_point, closest_point))  # Reverse direction
-                adjusted_control_points[i] = add_points(adjusted_control_points[i], scale_point(move_distance, direction))
-
-    return adjusted_control_points
+        curve_points = basis @ adjusted
+        # closest point on the curve to each original control point
+        gaps = original[:, None] - curve_points[None]
+        distances = np.linalg.norm(gaps, axis=2)
+        closest = np.argmin(distances, axis=1)
+        gap = gaps[np.arange(len(original)), closest]
+        # move each control point by iteration_fraction of its distance from the curve (no movement if the distance is zero)
+        adjusted += iteration_fraction*gap
+    return [point.with_(x=x, y=y, z=z) for point, (x, y, z) in zip(control_points, adjusted.tolist())]
 
 
 def bezier_through_points(control_points, num_points=10, iteration_fraction=0.5, iterations=20):
@@ -1,113 +1,58 @@
 
 from fullcontrol.combinations.gcode_and_visualize.classes import Point, ExtrusionGeometry, Printer, Extruder
-from fullcontrol.geometry import midpoint, distance, point_to_polar, segmented_line
-from fullcontrol.common import flatten
-from math import cos, pi
+from math import pi
+import numpy as np
 
 # these functions allow streamline-slicing - see method images and case study in this journal paper:
 # https://www.researchgate.net/publication/346098541
 
 
-def make_grid(path1: list, path2: list, cells_between: int) -> list:
-    'create a grid of points by interpolating between the points in the two supplied paths'
-    return [segmented_line(path1[i], path2[i], cells_between) for i in range(len(path1))]
+def resample_path_xy(xy: np.ndarray, points: int) -> np.ndarray:
+    'resample a path (numpy array of xy coordinates) to the given number of points, equally spaced by arc length'
+    arc_length = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(xy, axis=0).T))])
+    targets = np.linspace(0, arc_length[-1], points)
+    return np.stack([np.interp(targets, arc_length, xy[:, 0]), np.interp(targets, arc_length, xy[:, 1])], axis=1)
 
 
-def convex_segment(a1: Point, a2: Point, b1: Point, b2: Point, overextrusion_percent: float) -> list:
-    ''' identify the start/end coordinates and 'extrusion width' of a line that fills a region defined by four corners. the
-    line goes from the midpoint of points a1 and a2 to the midpoint of points b1 and b2. since a single extrusion width is 
-    used for the whole line (printed by one GCode command) a single average 'extrusion width' is calulated. returns a list 
-    of an ExtrusionGeometry (extrusion width) and two Points for the start and end of each line
-    '''
-    mid_a = midpoint(a1, a2)  # start point of line
-    mid_b = midpoint(b1, b2)  # end point of line
-    mid_1 = midpoint(a1, b1)  # mid point of one edge of the line
-    mid_2 = midpoint(a2, b2)  # mid point of other edge of the line
-    # this width is NOT normal to the line direction so needs adjustment based on skew
-    mid_width = distance(mid_1, mid_2)
-    skew = point_to_polar(mid_a, mid_b).angle - (point_to_polar(mid_1, mid_2).angle - pi/2)
-    # the absolute value is used since it means the "- pi/2" can be used to calculate skew regardless of line directions
-    line_width = mid_width * abs(cos(skew))
-    # this function has been checked by comparing the area calculated from returned line_width*line_length to that calculated for vertices a1/a2/b1/b2 here: https://www.omnicalculator.com/math/quadrilateral
-    return [ExtrusionGeometry(width=line_width*(1+overextrusion_percent/100)), mid_a, mid_b]
-
-
-def convex_from_grid(points_grid: list, travel: bool, zigzag: bool, overextrusion_percent: float) -> list:
-    ''' create a list of steps to print the necessary lines of the necessary width to fill all the cells in a grid (printing line by line)
-    '''
-    steplist = []
-    point_count_j = len(points_grid[0])-1
-    point_count_i = len(points_grid)-1
-    # j represents one of the lines being printed
-    for j in range(point_count_j):
-        # i runs through the segments of each line
-        for i in range(point_count_i):
-            # set i1 and i2 to run through points in reverse if zigzag == True and this is an even line
-            i1 = point_count_i - i if zigzag and j % 2 == 1 else i
-            i2 = point_count_i - (i+1) if zigzag and j % 2 == 1 else (i+1)
-            if travel and i == 0 and j > 0:
-                convex_steps = convex_segment(points_grid[i1][j], points_grid[i1][j+1], points_grid[i2]
-                                              [j], points_grid[i2][j+1], overextrusion_percent)
-                steplist.append(Extruder(on=False))
-                steplist.append(convex_steps[1])  # start point of first segment
-                steplist.append(Extruder(on=True))
-                steplist.extend(convex_steps)
-            else:
-                steplist.extend(convex_segment(points_grid[i1][j], points_grid[i1][j+1],
-                                points_grid[i2][j], points_grid[i2][j+1], overextrusion_percent))
-    return steplist
-
-
-def convex_segment_and_speed(a1: Point, a2: Point, b1: Point, b2: Point, speed_ref: float, width_ref: float, overextrusion_percent: float) -> list:
-    ''' identify the start/end coordinates and 'extrusion width' of a line that fills a region defined by four corners. the
-    line goes from the midpoint of points a1 and a2 to the midpoint of points b1 and b2. since a single extrusion width is 
-    used for the whole line (printed by one GCode command) a single average 'extrusion width' is calulated. returns a list 
-    of an Extruder (extrusion width) and two Points for the start and end of the line. Max speeds are capped to 10x speed_ref
-    '''
-    mid_a = midpoint(a1, a2)  # start point of line
-    mid_b = midpoint(b1, b2)  # end point of line
-    mid_1 = midpoint(a1, b1)  # mid point of one edge of the line
-    mid_2 = midpoint(a2, b2)  # mid point of other edge of the line
-    # this width is NOT normal to the line direction so needs adjustment based on skew
-    mid_width = distance(mid_1, mid_2)
-    skew = point_to_polar(mid_a, mid_b).angle - \
-        (point_to_polar(mid_1, mid_2).angle - pi/2)
-    # the absolute value is used since it means the "- pi/2" can be used to calculate skew regardless of line directions
-    line_width = mid_width * abs(cos(skew))
-    speed = speed_ref*(width_ref/line_width)
-    speed = min(speed, speed_ref*10)
-    # this function has been checked by comparing the area calculated from returned line_width*line_length to that calculated for vertices a1/a2/b1/b2 here: https://www.omnicalculator.com/math/quadrilateral
-    return [ExtrusionGeometry(width=line_width*(1+overextrusion_percent/100)), Printer(print_speed=speed), mid_a, mid_b]
+# cache of streamline geometry for previously-seen pairs of boundaries, so the same outline on several layers is only
+# calculated once (see convex_geometry())
+convex_cache = {}
+convex_cache_size = 32
 
 
-def convex_from_grid_and_speed(points_grid: list, speed_ref: float, width_ref: float, travel: bool, zigzag: bool, overextrusion_percent: float) -> list:
-    ''' same as convex_from_grid() but also calculates what speed should be used for each segement to maintain a constant
-    volumetric flow rate (dictated by the reference speed and width supplied by the user)
+def convex_geometry(xyz1: np.ndarray, xyz2: np.ndarray, lines: int) -> tuple:
+    ''' vectorised calculation for convex_pathsXY(). all streamlines between the two boundaries (numpy arrays of xyz
+    coordinates with the same number of points) are interpolated at once. returns the xyz coordinates of the points 
+    along each line (shape: lines, points, 3) and the extrusion width of each segment (shape: lines, points-1). the 
+    width of each segment is the 3D distance between the midpoints of the two edges of its cell, corrected for the skew
+    between the line direction and that cross-cell direction (skew angles are measured in the xy plane). results are 
+    cached for boundaries that are identical apart from their z-height (e.g. the same outline on several layers)
     '''
-    steplist = []
-    point_count_j = len(points_grid[0])-1
-    point_count_i = len(points_grid)-1
-    # j represents one of the lines being printed
-    for j in range(point_count_j):
-        # i runs through the segments of each line
-        for i in range(len(points_grid)-1):
-            # run through points in reverse if zigzag == True and this is an even line
-            i1 = point_count_i - i if zigzag and j % 2 == 1 else i
-            i2 = point_count_i - (i+1) if zigzag and j % 2 == 1 else (i+1)
-            if travel and i == 0 and j > 0:
-                convex_segs = convex_segment_and_speed(
-                    points_grid[i1][j], points_grid[i1][j+1], points_grid[i2][j], points_grid[i2][j+1], speed_ref, width_ref, overextrusion_percent)
-                steplist.append(Extruder(on=False))
-                steplist.append(convex_segs[2])  # start point of first segment
-                steplist.append(Extruder(on=True))
-                steplist.extend(convex_segs)
-            else:
-                steplist.extend(convex_segment_and_speed(
-                    points_grid[i1][j], points_grid[i1][j+1], points_grid[i2][j], points_grid[i2][j+1], speed_ref, width_ref, overextrusion_percent))
-    return steplist
+    # the geometry is calculated relative to the z-height of the first point and coordinates are rounded to 1e-9 for
+    # the cache key, so boundaries that only differ by a z-translation (or by rounding errors) share a cached result
+    z_offset = np.array([0, 0, xyz1[0, 2] if np.isfinite(xyz1[0, 2]) else 0])
+    xyz1, xyz2 = xyz1 - z_offset, xyz2 - z_offset
+    key = (np.round(xyz1, 9).tobytes(), np.round(xyz2, 9).tobytes(), len(xyz1), lines)
+    if key not in convex_cache:
+        grid = np.linspace(xyz1, xyz2, lines+1, axis=1)  # shape: points, lines+1, 3
+        line_points = (grid[:, :-1] + grid[:, 1:])/2  # start/end points of all segments
+        mid_1 = (grid[:-1, :-1] + grid[1:, :-1])/2  # mid point of one edge of each segment's cell
+        mid_2 = (grid[:-1, 1:] + grid[1:, 1:])/2  # mid point of the other edge
+        along = line_points[:-1] - line_points[1:]
+        across = mid_1 - mid_2
+        # the width across the cell is NOT normal to the line direction so needs adjustment based on skew. the absolute
+        # value of cos() means "- pi/2" can be used to calculate skew regardless of line directions
+        skew = np.arctan2(along[..., 1], along[..., 0]) - (np.arctan2(across[..., 1], across[..., 0]) - pi/2)
+        widths = np.linalg.norm(across, axis=-1)*np.abs(np.cos(skew))
+        # this calculation has been checked by comparing the area calculated from width*line_length to that calculated for the cell's four corners here: https://www.omnicalculator.com/math/quadrilateral
+        if len(convex_cache) >= convex_cache_size:
+            convex_cache.pop(next(iter(convex_cache)))
+        convex_cache[key] = (line_points.transpose(1, 0, 2), widths.T)
+    line_points, widths = convex_cache[key]
+    return line_points + z_offset, widths
 
 
-def convex_pathsXY(path1: list, path2: list, lines: int, vary_speed: bool = False, speed_ref: float = None, width_ref: float = None, travel: bool = True, zigzag: bool = False, overextrusion_percent: float = 0) -> list:
+def convex_pathsXY(path1: list, path2: list, lines: int, vary_speed: bool = False, speed_ref: float = None, width_ref: float = None, travel: bool = True, zigzag: bool = False, overextrusion_percent: float = 0, resample_points: int = None) -> list:
     ''' generate a series of paths to fill the space between supplied path1 and path2 with 
     streamlined lines of continuously varying extrusion width. the points in each path are
     directly interpolated between. if vary_speed=True, the reference speed and extrusion 
@@ -115,16 +60,43 @@ def convex_pathsXY(path1: list, path2: list, lines: int, vary_speed: bool = Fals
     contant volumetric flowrate. if travel==True (default), there will be travel from the 
     end of each path to the beginning of the next. set zigzag==True to alternate the
     printing direction of each path. set overextrusion_percent > 0 to overextrude to improve
-    lateral bonding between paths. research study: https://www.researchgate.net/publication/346098541
+    lateral bonding between paths. set resample_points to resample both paths to this number 
+    of points (equally spaced by arc length) before interpolating, which allows paths with 
+    different numbers of points. research study: https://www.researchgate.net/publication/346098541
     '''
-    points_grid = make_grid(path1, path2, lines)
-    if vary_speed == False:
-        steplist = convex_from_grid(points_grid, travel, zigzag, overextrusion_percent)
-    else:
+    if vary_speed == True:
         if speed_ref == None:
             raise ValueError("parameter speed_ref must be supplied")
         if width_ref == None:
             raise ValueError("parameter width_ref must be supplied")
-        steplist = convex_from_grid_and_speed(points_grid, speed_ref, width_ref, travel, zigzag, overextrusion_percent)
+    xyz1 = np.array([[p.x, p.y, p.z] for p in path1], dtype=float)
+    xyz2 = np.array([[p.x, p.y, p.z] for p in path2], dtype=float)
+    if resample_points == None:
+        # each point in path1 is paired with the point at the same index in path2
+        xyz2 = xyz2[:len(xyz1)]
+    else:
+        xyz1 = np.concatenate([resample_path_xy(xyz1[:, :2], resample_points), np.full((resample_points, 1), xyz1[0, 2])], axis=1)
+        xyz2 = np.concatenate([resample_path_xy(xyz2[:, :2], resample_points), np.full((resample_points, 1), xyz2[0, 2])], axis=1)
+    line_points, widths = convex_geometry(xyz1, xyz2, lines)
+    with np.errstate(divide='ignore'):
+        speeds = np.minimum(speed_ref*(width_ref/widths), speed_ref*10) if vary_speed else None
+    widths = widths*(1+overextrusion_percent/100)
+    steplist = []
+    for j in range(lines):
+        points = [Point(x=x, y=y, z=z) for x, y, z in line_points[j].tolist()]
+        line_widths, line_speeds = widths[j].tolist(), speeds[j].tolist() if vary_speed else None
+        order = range(len(points)-1)
+        if zigzag and j % 2 == 1:
+            order = reversed(order)
+        for k, i in enumerate(order):
+            # each segment is printed from its own copies of the start and end points
+            start, end = (points[i+1], points[i]) if zigzag and j % 2 == 1 else (points[i], points[i+1])
+            start, end = start.model_copy(), end.model_copy()
+            if travel and k == 0 and j > 0:
+                steplist.extend([Extruder(on=False), start, Extruder(on=True)])
+            steplist.append(ExtrusionGeometry(width=line_widths[i]))
+            if vary_speed:
+                steplist.append(Printer(print_speed=line_speeds[i]))
+            steplist.extend([start, end])
     print('yay! CONVEX function used :) please cite our CONVEX research study: https://www.researchgate.net/publication/346098541')
     return steplist
@@ -1,5 +1,6 @@
 from fullcontrol import Point, polar_to_point, point_to_polar, BoundingBox, Vector, move, travel_to
 from lab.fullcontrol.geometry.convex import convex_pathsXY
+import numpy as np
 
 
 # necessary functions
@@ -16,17 +17,14 @@ def create_solid_layer(outline: list, extrusion_width: float, z_height: float):
     bounds = BoundingBox()
     bounds.calc_bounds(outline)
     mid_point = Point(x=bounds.midx, y=bounds.midy, z=z_height)
-    point_count = 0
-    offset_outline = []
-    max_rad = 0
-    for step in outline:
-        if isinstance(step, Point):
-            polar_data = point_to_polar(step, mid_point)
-            offset_outline.append(polar_to_point(
-                mid_point, polar_data.radius-0.25*extrusion_width, polar_data.angle))
-            point_count += 1
-            max_rad = max(max_rad, polar_data.radius-0.25*extrusion_width)
-    solid_fill = convex_pathsXY(offset_outline, [mid_point]*point_count, int(max_rad/extrusion_width), travel=False, overextrusion_percent=5)
+    xy = np.array([[step.x, step.y] for step in outline if isinstance(step, Point)])
+    # offset each point towards mid_point (i.e. reduce its polar radius) by 0.25*extrusion_width
+    radii = np.hypot(xy[:, 0]-mid_point.x, xy[:, 1]-mid_point.y)
+    scale = (radii-0.25*extrusion_width)/radii
+    offset_outline = [Point(x=x, y=y, z=z_height) for x, y in
+                      zip((mid_point.x+(xy[:, 0]-mid_point.x)*scale).tolist(), (mid_point.y+(xy[:, 1]-mid_point.y)*scale).tolist())]
+    max_rad = float((radii-0.25*extrusion_width).max())
+    solid_fill = convex_pathsXY(offset_outline, [mid_point]*len(xy), int(max_rad/extrusion_width), travel=False, overextrusion_percent=5)
     return solid_fill
 
 
@@ -61,9 +59,9 @@ def fill_base_full(steps: list, segments_per_layer: int, solid_layers: int, extr
         new_steps.append(steps[i])
         if t_val > 0 and t_val % 1 == 0 and t_val <= solid_layers:
             current_layer_outline = steps[i-segments_per_layer:i]
-            solid_layer = create_solid_layer(
-                current_layer_outline, extrusion_width, 0)
             last_point = new_steps[-1]
-            new_steps.extend(move(solid_layer, Vector(z=last_point.z)))
+            # the solid layer is created at the z-height of the layer. convex_pathsXY caches its geometry relative to
+            # the z-height, so layers with identical outlines are only calculated once
+            new_steps.extend(create_solid_layer(current_layer_outline, extrusion_width, last_point.z))
             new_steps.extend(travel_to(last_point))
     return new_steps
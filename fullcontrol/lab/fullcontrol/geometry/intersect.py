@@ -1,6 +1,7 @@
 
 from fullcontrol.common import *
 from fullcontrol.geometry import *
+import numpy as np
 
 # see http://www.ambrsoft.com/MathCalc/Line/TwoLinesIntersection/TwoLinesIntersection.htm
 
@@ -69,3 +70,117 @@ def crossing_lines_check_XY(point_a1: Point, point_a2: Point, point_b1: Point, p
     def ccw(A, B, C):
         return (C.y-A.y) * (B.x-A.x) > (B.y-A.y) * (C.x-A.x)
     return ccw(point_a1, point_b1, point_b2) != ccw(point_a2, point_b1, point_b2) and ccw(point_a1, point_a2, point_b1) != ccw(point_a1, point_a2, point_b2)
+
+
+def grid_candidate_pairs(lower: np.ndarray, upper: np.ndarray, cell_size: np.ndarray) -> tuple:
+    ''' uniform-grid broad phase. lower and upper are the (n, dimensions) corners of the bounding box of each segment.
+    each segment is added to every grid cell its bounding box touches, and every pair of segments sharing a cell is a
+    candidate. return arrays (i, j) of candidate pairs with i < j and overlapping bounding boxes, each pair included 
+    once
+    '''
+    n, dimensions = lower.shape
+    origin = lower.min(axis=0)
+    first_cell = np.floor((lower - origin)/cell_size).astype(np.int64)
+    last_cell = np.floor((upper - origin)/cell_size).astype(np.int64)
+    grid_size = last_cell.max(axis=0) + 1
+
+    def cell_code(cell_indices):
+        'single integer identifying a grid cell'
+        code = np.zeros(len(cell_indices), dtype=np.int64)
+        for d in range(dimensions):
+            code = code*grid_size[d] + cell_indices[:, d]
+        return code
+
+    span = last_cell - first_cell + 1
+    counts = np.prod(span, axis=1)
+    segment = np.repeat(np.arange(n), counts)
+    # position of each (segment, cell) entry within the block of cells covered by its segment
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cell_indices = np.empty((len(segment), dimensions), dtype=np.int64)
+    for d in reversed(range(dimensions)):
+        cell_indices[:, d] = first_cell[segment, d] + k % span[segment, d]
+        k = k // span[segment, d]
+    cells = cell_code(cell_indices)
+    order = np.argsort(cells, kind='stable')
+    cells, segment = cells[order], segment[order]
+    # every pair of entries within each cell
+    cell_start = np.flatnonzero(np.concatenate([[True], cells[1:] != cells[:-1]]))
+    cell_count = np.diff(np.concatenate([cell_start, [len(cells)]]))
+    entry = np.arange(len(cells))
+    later = np.repeat(cell_start + cell_count, cell_count) - entry - 1  # entries after this one in the same cell
+    first = np.repeat(entry, later)
+    second = first + 1 + np.arange(later.sum()) - np.repeat(np.cumsum(later) - later, later)
+    i, j = np.minimum(segment[first], segment[second]), np.maximum(segment[first], segment[second])
+    # pairs sharing several cells are only kept in the cell containing the lower corner of the overlap of their bounding
+    # boxes. pairs whose bounding boxes don't overlap are removed too
+    overlap = ((lower[i] <= upper[j]) & (lower[j] <= upper[i])).all(axis=1)
+    i, j, cells = i[overlap], j[overlap], cells[first[overlap]]
+    reference = cell_code(np.maximum(first_cell[i], first_cell[j]))
+    return i[reference == cells], j[reference == cells]
+
+
+def segment_crossings_XY(starts: np.ndarray, ends: np.ndarray, z_band: float = None, cell_size: float = None) -> tuple:
+    ''' find all crossings between segments (starts[i] -> ends[i]) in the XY plane. starts and ends are numpy arrays of
+    shape (n, 3). if z_band is set, segments only cross if their z-ranges are within z_band of each other (e.g. half a
+    layer height for segments in the same layer). consecutive segments (which share an end point) are ignored, as are 
+    parallel segments. candidate pairs are found with a uniform grid (cell_size defaults to the mean segment length) and
+    all candidates are tested at once. return arrays (i, j, t, u) with i < j for each crossing at 
+    starts[i] + t*(ends[i]-starts[i]) = starts[j] + u*(ends[j]-starts[j])
+    '''
+    valid = np.flatnonzero(np.isfinite(starts).all(axis=1) & np.isfinite(ends).all(axis=1))
+    s, e = starts[valid], ends[valid]
+    dimensions = 2 if z_band == None else 3
+    lower, upper = np.minimum(s, e)[:, :dimensions], np.maximum(s, e)[:, :dimensions]
+    if len(valid) < 2:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0), np.zeros(0)
+    if cell_size == None:
+        cell_size = max(np.mean(np.linalg.norm(e[:, :2] - s[:, :2], axis=1)), 1e-9)
+    cell_sizes = np.full(dimensions, float(cell_size))
+    if z_band != None:
+        # expanding the z-range of each segment by half the z_band means segments within z_band share a cell
+        lower[:, 2] -= z_band/2
+        upper[:, 2] += z_band/2
+        cell_sizes[2] = max(z_band, 1e-9)
+    a, b = grid_candidate_pairs(lower, upper, cell_sizes)
+    keep = valid[b] - valid[a] > 1
+    a, b = a[keep], b[keep]
+    d1, d2, w = e[a, :2] - s[a, :2], e[b, :2] - s[b, :2], s[b, :2] - s[a, :2]
+    denominator = d1[:, 0]*d2[:, 1] - d1[:, 1]*d2[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (w[:, 0]*d2[:, 1] - w[:, 1]*d2[:, 0])/denominator
+        u = (w[:, 0]*d1[:, 1] - w[:, 1]*d1[:, 0])/denominator
+    # parameters are half-open ([0, 1)) so that a crossing exactly at a point between two segments is reported once
+    crossing = (denominator != 0) & (t >= 0) & (t < 1) & (u >= 0) & (u < 1)
+    return valid[a[crossing]], valid[b[crossing]], t[crossing], u[crossing]
+
+
+def path_crossings_XY(steps: list, z_band: float = None, extrusion_only: bool = False, cell_size: float = None) -> list:
+    ''' find all places where a toolpath (list of steps) crosses itself in the XY plane. for 3D paths, set z_band to 
+    only report crossings between segments within z_band of each other (e.g. half the layer height to check each layer
+    separately). set extrusion_only=True to ignore travel moves (based on Extruder steps in the list). returns a list 
+    of crossings. each crossing is a list of [Point, (first segment step indices), (second segment step indices)], 
+    where the step indices are the indices in 'steps' of the start and end Points of each segment and the Point is the
+    location of the crossing (z is taken from the first segment)
+    '''
+    position, on = [None, None, None], True
+    xyz, point_indices, extruding = [], [], []
+    for index, step in enumerate(steps):
+        if isinstance(step, Extruder) and step.on != None:
+            on = step.on
+        elif isinstance(step, Point):
+            position = [step.x if step.x != None else position[0], step.y if step.y != None else position[1],
+                        step.z if step.z != None else position[2]]
+            xyz.append(position)
+            point_indices.append(index)
+            extruding.append(on)
+    xyz = np.array(xyz, dtype=float).reshape(-1, 3)
+    if z_band == None:
+        xyz[:, 2] = np.nan_to_num(xyz[:, 2])
+    starts, ends = xyz[:-1].copy(), xyz[1:]
+    if extrusion_only:
+        starts[~np.array(extruding[1:], dtype=bool)] = np.nan
+    i, j, t, u = segment_crossings_XY(starts, ends, z_band, cell_size)
+    locations = starts[i] + t[:, None]*(ends[i] - starts[i])
+    return [[Point(x=x, y=y, z=z), (point_indices[a], point_indices[a+1]), (point_indices[b], point_indices[b+1])]
+            for (x, y, z), a, b in zip(locations.tolist(), i.tolist(), j.tolist())]
+
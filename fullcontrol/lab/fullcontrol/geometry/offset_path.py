@@ -1,6 +1,7 @@
 
-from fullcontrol.geometry import point_to_polar, polar_to_point, arcXY, travel_to
+from fullcontrol.geometry import Point, point_to_polar, polar_to_point, arcXY, travel_to
 from math import radians, tau, sin
+import numpy as np
 
 def offset_path(points: list, offset: float, flip: bool = False, repeats: int = 1, arc_outer_corners: bool = False, arc_segments: int = 8, travel: bool = False, include_original: bool = False) -> list:
     ''' return an offset path (list of Points) defined by the parameter 'points' and 'offset'. parameter 'flip'
@@ -57,4 +58,444 @@ def offset_path(points: list, offset: float, flip: bool = False, repeats: int =
     if include_original: 
         return points_original + offset_points
     else:
-        return offset_points
\ No newline at end of file
+        return offset_points
+
+
+# array-based offset engine. paths are numpy arrays of xy coordinates with shape (n, 2). closed paths do not repeat
+# the first point at the end. positive offset distances are to the left of the direction of the path (inwards for
+# an anticlockwise outline), matching offset_path()
+
+
+def segment_pairs(starts: np.ndarray, ends: np.ndarray) -> tuple:
+    '''find all pairs of segments (starts[i] -> ends[i]) whose bounding boxes overlap. candidate pairs are found by
+    sorting the segments by their minimum x and pairing segments with overlapping x-ranges. return arrays (i, j) with
+    i < j
+    '''
+    n = len(starts)
+    xmin, xmax = np.minimum(starts[:, 0], ends[:, 0]), np.maximum(starts[:, 0], ends[:, 0])
+    ymin, ymax = np.minimum(starts[:, 1], ends[:, 1]), np.maximum(starts[:, 1], ends[:, 1])
+    order = np.argsort(xmin, kind='stable')
+    counts = np.searchsorted(xmin[order], xmax[order], side='right') - np.arange(n) - 1
+    first = np.repeat(np.arange(n), counts)
+    second = first + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    i, j = np.minimum(order[first], order[second]), np.maximum(order[first], order[second])
+    keep = (ymin[i] <= ymax[j]) & (ymin[j] <= ymax[i])
+    return i[keep], j[keep]
+
+
+def segment_crossings(starts: np.ndarray, ends: np.ndarray, closed: bool = True) -> tuple:
+    '''find all crossings between the segments (starts[i] -> ends[i]) of a path, ignoring neighbouring segments.
+    return arrays (i, j, t, u) with i < j for each crossing at starts[i] + t*(ends[i]-starts[i])
+    '''
+    n = len(starts)
+    i, j = segment_pairs(starts, ends)
+    keep = j - i > 1
+    if closed:
+        keep &= j - i != n - 1
+    i, j = i[keep], j[keep]
+    d1, d2, w = ends[i] - starts[i], ends[j] - starts[j], starts[j] - starts[i]
+    denominator = d1[:, 0]*d2[:, 1] - d1[:, 1]*d2[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (w[:, 0]*d2[:, 1] - w[:, 1]*d2[:, 0])/denominator
+        u = (w[:, 0]*d1[:, 1] - w[:, 1]*d1[:, 0])/denominator
+    # parameters are half-open ([0, 1)) so that paths touching at the start of a segment are split there once
+    crossing = (denominator != 0) & (t > -1e-9) & (t < 1-1e-9) & (u > -1e-9) & (u < 1-1e-9)
+    return i[crossing], j[crossing], t[crossing], u[crossing]
+
+
+def offset_geometry(xy: np.ndarray, distance: float, closed: bool = True) -> tuple:
+    'return the lengths, unit tangents and unit normals of the segments of a path, and the start of each offset segment'
+    edges = np.roll(xy, -1, axis=0) - xy if closed else np.diff(xy, axis=0)
+    lengths = np.linalg.norm(edges, axis=1)
+    tangents = edges/lengths[:, None]
+    normals = np.stack([-tangents[:, 1], tangents[:, 0]], axis=1)
+    offset_starts = xy[:len(edges)] + distance*normals  # each offset segment is offset_starts[i] + s*tangents[i] for 0 <= s <= lengths[i]
+    return lengths, tangents, normals, offset_starts
+
+
+def offset_intersections(tangents: np.ndarray, offset_starts: np.ndarray, distance, a: np.ndarray, b: np.ndarray) -> tuple:
+    '''for corners between offset segments a and b, whether the corner is an inner corner and where their offset lines
+    meet. 'distance' is the offset distance, or an array of the offset distance of each corner'''
+    cross = tangents[a, 0]*tangents[b, 1] - tangents[a, 1]*tangents[b, 0]
+    dot = np.clip(np.sum(tangents[a]*tangents[b], axis=1), -1, 1)
+    gap = offset_starts[b] - offset_starts[a]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = (gap[:, 0]*tangents[b, 1] - gap[:, 1]*tangents[b, 0])/cross  # intersection along segment a
+        u = (gap[:, 0]*tangents[a, 1] - gap[:, 1]*tangents[a, 0])/cross  # intersection along segment b
+    inner = (cross*distance > 1e-12) & (dot > -1 + 1e-9) & np.isfinite(s) & np.isfinite(u)
+    return cross, dot, inner, s, u
+
+
+def surviving_edges(xy: np.ndarray, distances, closed: bool = True) -> list:
+    '''for each offset distance, return the indices of the segments of a path whose offset segments are not removed by
+    trimming at inner corners (an empty array if the path collapses completely). segments that are reversed by
+    trimming (because the offset is larger than the features of the path) are removed, shortest first, and their
+    neighbours are intersected instead. all distances are processed together, as one array of segments
+    '''
+    distances = np.atleast_1d(np.asarray(distances, dtype=float))
+    lengths, tangents, normals, _ = offset_geometry(xy, 0, closed)
+    n, rings = len(lengths), len(distances)
+    # segment i of the offset by distances[k] is index k*n + i. index N stands for the missing neighbours at the ends
+    # of an open path
+    N = n*rings
+    lengths, tangents = np.tile(lengths, rings), np.tile(tangents, (rings, 1))
+    offset_starts = (xy[:n] + distances[:, None, None]*normals).reshape(-1, 2)
+    ring_distance = np.repeat(distances, n)
+    local = np.arange(N) % n
+    if closed:
+        previous, following = np.arange(N) - local + (local - 1) % n, np.arange(N) - local + (local + 1) % n
+    else:
+        previous, following = np.where(local == 0, N, np.arange(N) - 1), np.where(local == n-1, N, np.arange(N) + 1)
+    previous, following = np.append(previous, N), np.append(following, N)
+    a = np.flatnonzero(following[:N] < N)
+    b = following[a]
+    _, _, inner, s, u = offset_intersections(tangents, offset_starts, ring_distance[a], a, b)
+    end, start = np.append(lengths, np.inf), np.zeros(N+1)  # distances along each offset segment to its corners
+    end[a], start[b] = np.where(inner, s, lengths[a]), np.where(inner, u, 0)
+    # each pass removes the reversed segments that are shorter than both neighbours (remaining lengths are negative
+    # when reversed) and their neighbours are intersected instead. only the corners either side of removed segments
+    # change, so each pass only recalculates those corners and only tests the segments next to them, rather than
+    # every corner in every pass. removal stops in an offset that has too few segments left
+    def remaining(index):
+        return end[index] - start[index]
+
+    alive = np.ones(N+1, dtype=bool)
+    count = np.full(rings, n)
+    active = np.flatnonzero(end[:N] < start[:N])
+    active = active[count[active//n] > (2 if closed else 1)]
+    while len(active) > 0:
+        removed = active[(remaining(active) <= remaining(previous[active])) & (remaining(active) <= remaining(following[active]))]
+        alive[removed] = False
+        count -= np.bincount(removed//n, minlength=rings)
+        removed = removed[count[removed//n] > (2 if closed else 0)]
+        # connect the kept segments either side of each run of removed segments
+        before, after = previous[removed], following[removed]
+        while not (alive[before].all() and alive[after].all()):
+            before, after = np.where(alive[before], before, previous[before]), np.where(alive[after], after, following[after])
+        a, b = before, after
+        following[a[a < N]], previous[b[b < N]] = b[a < N], a[b < N]
+        both = (a < N) & (b < N)
+        _, _, inner, s, u = offset_intersections(tangents, offset_starts, ring_distance[a[both]], a[both], b[both])
+        end[a[both]], start[b[both]] = np.where(inner, s, lengths[a[both]]), np.where(inner, u, 0)
+        end[a[(a < N) & (b == N)]], start[b[(a == N) & (b < N)]] = lengths[a[(a < N) & (b == N)]], 0
+        # only segments whose remaining length (or a neighbour's) changed can become the shortest of their neighbours
+        changed = np.sort(np.concatenate([a, b, previous[a], following[b]]))
+        active = changed[(changed < N) & np.append(True, changed[1:] != changed[:-1])]
+        active = active[alive[active] & (end[active] < start[active]) & (count[active//n] > (2 if closed else 1))]
+    alive = alive[:N].reshape(rings, n)
+    return [np.flatnonzero(alive[k]) if count[k] > (2 if closed else 0) else np.zeros(0, dtype=int) for k in range(rings)]
+
+
+def raw_offset(xy: np.ndarray, distance: float, join: str = 'miter', miter_limit: float = 2.0, arc_segments: int = 8, closed: bool = True, kept: np.ndarray = None) -> np.ndarray:
+    '''offset every segment of a path by 'distance' and connect neighbouring segments with joins. at inner corners,
+    offset segments are trimmed to their intersection. segments that are reversed by trimming are removed - see
+    surviving_edges() ('kept' can be its result, if already calculated). outer corners use a 'miter' join (squared off
+    if the miter is longer than miter_limit*distance), a 'square' join or a 'round' join ('arc_segments' per 90
+    degrees of arc). the returned path may intersect itself - see split_self_intersections()
+    '''
+    if join not in ['miter', 'square', 'round']:
+        raise Exception(f"join must be 'miter', 'square' or 'round' (join='{join}' was given)")
+    if kept is None:
+        kept = surviving_edges(xy, distance, closed)[0]
+    if len(kept) == 0:
+        return np.zeros((0, 2))
+    lengths, tangents, normals, offset_starts = offset_geometry(xy, distance, closed)
+
+    a, b = (np.roll(kept, 1), kept) if closed else (kept[:-1], kept[1:])  # segments before and after each corner
+    cross, dot, inner, s, u = offset_intersections(tangents, offset_starts, distance, a, b)
+    dot = np.clip(dot, -1, 1)
+    adjacent = b == (a + 1) % len(xy)
+    outer = ~inner & adjacent
+    p = xy[b]  # corner point (for adjacent edges)
+    miter = (normals[a] + normals[b])/np.maximum(1 + dot, 1e-12)[:, None]
+    long_miter = np.sqrt(2/np.maximum(1 + dot, 1e-12)) > miter_limit
+    # kind of corner: 0 = single point, 1 = square, 2 = round, 3 = straight connection between non-adjacent segments
+    kind = np.zeros(len(a), dtype=int)
+    if join == 'miter':
+        kind[outer & long_miter] = 1
+    elif join == 'square':
+        kind[outer] = 1
+    elif join == 'round':
+        kind[outer] = 2
+    kind[~inner & ~adjacent] = 3
+    turn = np.arccos(dot)
+    segments = np.maximum(1, np.ceil(arc_segments*turn/(np.pi/2))).astype(int)
+    # number of points at each corner: 1 for single points, 2 for square corners and straight connections, segments+1 for round corners
+    counts = np.select([kind == 0, kind == 2], [1, segments + 1], 2)
+    corner = np.repeat(np.arange(len(a)), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    a_now, b_now, kind_now = a[corner], b[corner], kind[corner]
+    first = (k == 0)[:, None]
+    result = np.where(inner[corner, None], offset_starts[a_now] + np.where(inner, s, 0)[corner, None]*tangents[a_now], p[corner] + distance*miter[corner])
+    square = kind_now == 1
+    # square corners are cut perpendicular to the bisector, at the miter limit (or at the offset distance for square joins)
+    limit = miter_limit if join == 'miter' else 1.0
+    cut = abs(distance)*np.maximum(limit - np.cos(turn/2), 0)/np.maximum(np.sin(turn/2), 1e-12)
+    result[square] = np.where(first, p[corner] + distance*normals[a_now] + cut[corner, None]*tangents[a_now],
+                              p[corner] + distance*normals[b_now] - cut[corner, None]*tangents[b_now])[square]
+    arc = kind_now == 2
+    if arc.any():
+        c = corner[arc]
+        angle = np.arctan2(distance*normals[a[c], 1], distance*normals[a[c], 0]) - np.sign(distance)*turn[c]*k[arc]/segments[c]
+        result[arc] = p[c] + abs(distance)*np.stack([np.cos(angle), np.sin(angle)], axis=1)
+    straight = kind_now == 3
+    result[straight] = np.where(first, offset_starts[a_now] + lengths[a_now, None]*tangents[a_now], offset_starts[b_now])[straight]
+    if not closed:
+        result = np.concatenate([offset_starts[kept[:1]], result, offset_starts[kept[-1:]] + lengths[kept[-1:], None]*tangents[kept[-1:]]])
+    return result
+
+
+def winding_numbers(query: np.ndarray, xy: np.ndarray) -> np.ndarray:
+    '''return the winding number of a closed path around each query point. segments are binned into horizontal bands
+    by their y-range so each query point is only tested against segments in its band (there are no more bands than
+    query points, since binning tall segments into many bands costs more than it saves for a few query points)
+    '''
+    starts, ends = xy, np.roll(xy, -1, axis=0)
+    y_low, y_high = xy[:, 1].min(), xy[:, 1].max()
+    bands = max(1, min(len(xy)//8, len(query)))
+    band_height = max((y_high - y_low)/bands, 1e-12)
+    first_band = np.clip(((np.minimum(starts[:, 1], ends[:, 1]) - y_low)/band_height).astype(int), 0, bands-1)
+    last_band = np.clip(((np.maximum(starts[:, 1], ends[:, 1]) - y_low)/band_height).astype(int), 0, bands-1)
+    counts = last_band - first_band + 1
+    band = np.repeat(first_band, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    order = np.argsort(band, kind='stable')
+    band_segments = np.repeat(np.arange(len(starts)), counts)[order]
+    band_start = np.searchsorted(band[order], np.arange(bands+1))
+    inside = (query[:, 1] >= y_low) & (query[:, 1] <= y_high)
+    query_band = np.clip(((query[:, 1] - y_low)/band_height).astype(int), 0, bands-1)
+    counts = np.where(inside, band_start[query_band+1] - band_start[query_band], 0)
+    q = np.repeat(np.arange(len(query)), counts)
+    i = band_segments[np.repeat(band_start[query_band] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+    x, y = query[q, 0], query[q, 1]
+    is_left = (ends[i, 0] - starts[i, 0])*(y - starts[i, 1]) - (x - starts[i, 0])*(ends[i, 1] - starts[i, 1])
+    upwards = (starts[i, 1] <= y) & (ends[i, 1] > y) & (is_left > 0)
+    downwards = (ends[i, 1] <= y) & (starts[i, 1] > y) & (is_left < 0)
+    return np.bincount(q, weights=upwards.astype(int) - downwards.astype(int), minlength=len(query)).astype(int)
+
+
+def boundary_loops(xy: np.ndarray, orientation: int = None) -> list:
+    '''return the boundary of the area enclosed by a closed path as a list of simple closed loops. the path is split at
+    every crossing and at the ends of collinear overlaps, so overlapping parts of the path become identical pieces. each
+    distinct piece is kept if the area is on one side of it but not the other (tested with the winding number of the
+    path just either side of its middle) and kept pieces are joined into loops, turning as far left as possible where
+    loops touch. 'orientation' is 1 if the area is to the left of the path (anticlockwise) or -1 if it is to the
+    right, and is taken from the signed area of the path if not given. loops have the same orientation as the area
+    '''
+    if orientation == None:
+        orientation = 1 if polygon_areas([xy])[0] > 0 else -1
+    n = len(xy)
+    starts, ends = xy, np.roll(xy, -1, axis=0)
+    i, j = segment_pairs(starts, ends)
+    d1, d2, w = ends[i] - starts[i], ends[j] - starts[j], starts[j] - starts[i]
+    length1, length2 = np.linalg.norm(d1, axis=1), np.linalg.norm(d2, axis=1)
+    denominator = d1[:, 0]*d2[:, 1] - d1[:, 1]*d2[:, 0]
+    parallel = np.abs(denominator) <= 1e-9*length1*length2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (w[:, 0]*d2[:, 1] - w[:, 1]*d2[:, 0])/denominator
+        u = (w[:, 0]*d1[:, 1] - w[:, 1]*d1[:, 0])/denominator
+    crossing = ~parallel & (t > -1e-9) & (t < 1+1e-9) & (u > -1e-9) & (u < 1+1e-9)
+    ic, jc, t, u, d1c = i[crossing], j[crossing], t[crossing], u[crossing], d1[crossing]
+    # crossings at (or very close to) the end of either segment are moved to that end, so both segments are split at
+    # exactly the same point
+    points = starts[ic] + t[:, None]*d1c
+    for near, end_points in ((t < 1e-9, starts[ic]), (t > 1-1e-9, ends[ic]), (u < 1e-9, starts[jc]), (u > 1-1e-9, ends[jc])):
+        points = np.where((near & np.all(points != end_points, axis=1))[:, None], end_points, points)
+    segment, parameter, split_points = [np.arange(n), ic, jc], [np.zeros(n), np.clip(t, 0, 1), np.clip(u, 0, 1)], [xy, points, points]
+    # segments that overlap collinearly are each split at the ends of the other
+    tolerance = 1e-9*max(np.abs(xy).max(), 1)
+    collinear = parallel & (length1 > 0) & (length2 > 0) & (np.abs(w[:, 0]*d1[:, 1] - w[:, 1]*d1[:, 0]) <= tolerance*length1)
+    for a, b in ((i[collinear], j[collinear]), (j[collinear], i[collinear])):
+        direction = ends[a] - starts[a]
+        for end_points in (starts[b], ends[b]):
+            p = np.sum((end_points - starts[a])*direction, axis=1)/np.sum(direction**2, axis=1)
+            within = (p > 1e-9) & (p < 1-1e-9)
+            segment.append(a[within]), parameter.append(p[within]), split_points.append(end_points[within])
+    segment, parameter, split_points = np.concatenate(segment), np.concatenate(parameter), np.concatenate(split_points)
+    split_points = split_points[np.lexsort((parameter, segment))]
+    # pieces between consecutive split points, identified by the split points at either end. split points closer than
+    # the tolerance (e.g. from rounding errors in the path) are the same node
+    rounded = np.round(split_points/tolerance)
+    order = np.lexsort((rounded[:, 1], rounded[:, 0]))
+    new_node = np.append(True, np.any(rounded[order[1:]] != rounded[order[:-1]], axis=1))
+    node = np.empty(len(order), dtype=int)
+    node[order] = np.cumsum(new_node) - 1
+    nodes = split_points[order[new_node]]
+    first, second = node, np.roll(node, -1)
+    first, second = first[first != second], second[first != second]
+    if len(first) == 0:
+        return []  # the path has collapsed to a point
+    # the winding numbers either side of the path only change where other parts of the path meet it, so they are
+    # tested once for each run of pieces between nodes that the path visits more than once, just either side of the
+    # middle of the longest piece in the run
+    shared = np.bincount(first, minlength=len(nodes)) > 1
+    run = np.cumsum(shared[first])
+    run[run == run[-1]] = 0  # the last run continues into the first one
+    direction = nodes[second] - nodes[first]
+    length = np.linalg.norm(direction, axis=1)
+    order = np.lexsort((length, run))
+    longest = order[np.append(np.flatnonzero(np.diff(run[order])), len(order)-1)]
+    left = np.stack([-direction[longest, 1], direction[longest, 0]], axis=1)/length[longest, None]*np.minimum(length[longest], 1)[:, None]*1e-6
+    middle = (nodes[first[longest]] + nodes[second[longest]])/2
+    inside = (winding_numbers(np.concatenate([middle + left, middle - left]), xy)*orientation > 0).reshape(2, -1)
+    inside_left, inside_right = inside[:, np.searchsorted(run[longest], run)]
+    keep = inside_left != inside_right
+    # orient kept pieces with the area on their left. pieces where the path overlaps itself are only kept once
+    a, b = np.where(inside_left, first, second)[keep], np.where(inside_left, second, first)[keep]
+    _, unique_pieces = np.unique(a*len(nodes) + b, return_index=True)
+    a, b = a[np.sort(unique_pieces)], b[np.sort(unique_pieces)]
+    if len(a) == 0:
+        return []
+    # at each node, the next piece is the one that turns furthest left, so loops that touch at a node stay separate
+    direction = nodes[b] - nodes[a]
+    order = np.argsort(a, kind='stable')
+    first_out = np.searchsorted(a[order], np.arange(len(nodes)+1))
+    count = first_out[b+1] - first_out[b]
+    following = np.where(count > 0, order[np.minimum(first_out[b], len(a)-1)], -1)
+    for piece in np.flatnonzero(count > 1):
+        options = order[first_out[b[piece]]:first_out[b[piece]+1]]
+        turn = np.arctan2(direction[piece, 0]*direction[options, 1] - direction[piece, 1]*direction[options, 0],
+                          np.sum(direction[piece]*direction[options], axis=1))
+        following[piece] = options[np.argmax(turn)]
+    loops = [nodes[a[loop]] if orientation > 0 else nodes[a[loop]][::-1] for loop in piece_cycles(following) if len(loop) > 2]
+    return loops
+
+
+def piece_cycles(following: np.ndarray) -> list:
+    '''split pieces into chains, given the index of the piece following each one (-1 for none). each chain starts at
+    its lowest unused piece and continues until it reaches a used piece or the end, and chains are in order of their
+    first piece. when every piece is followed by a different piece (so the chains are cycles), the cycles are found by
+    pointer jumping rather than by following them piece by piece
+    '''
+    n = len(following)
+    if (following >= 0).all() and len(np.unique(following)) == n:
+        # label each cycle by its lowest piece, then cut each cycle before that piece and count the steps from each
+        # piece to the cut
+        label, jump = np.arange(n), following.copy()
+        for _ in range(max(1, int(np.ceil(np.log2(n))))):
+            label, jump = np.minimum(label, label[jump]), jump[jump]
+        last = following[np.arange(n)] == label  # the piece before the start of its cycle
+        following_open = np.where(last, np.arange(n), following)
+        steps = (~last).astype(int)
+        for _ in range(max(1, int(np.ceil(np.log2(n))))):
+            steps, following_open = steps + steps[following_open], following_open[following_open]
+        order = np.lexsort((-steps, label))
+        return np.split(order, np.flatnonzero(np.diff(label[order])) + 1)
+    following, used, chains = following.tolist(), [False]*n, []
+    for piece in range(n):
+        chain = []
+        while piece != -1 and not used[piece]:
+            used[piece] = True
+            chain.append(piece)
+            piece = following[piece]
+        chains.append(chain)
+    return chains
+
+
+def split_self_intersections(xy: np.ndarray, closed: bool = True, orientation: int = None) -> list:
+    '''remove self-intersections from a path. for a closed path, return the boundary of the area that it encloses as a
+    list of simple closed loops - see boundary_loops(). for an open path, each crossing is found twice along the path
+    and the path between them (a loop) is cut out. return a list containing the path with its loops cut out
+    '''
+    if closed:
+        return boundary_loops(xy, orientation)
+    starts, ends = xy[:-1], xy[1:]
+    i, j, t, u = segment_crossings(starts, ends, closed=False)
+    points = starts[i] + t[:, None]*(ends[i] - starts[i])
+    segment, parameter = np.concatenate([i, j]), np.concatenate([t, u])
+    crossing = np.concatenate([np.arange(len(i)), np.arange(len(i))])
+    order = np.lexsort((parameter, segment))
+    segment, crossing = segment[order], crossing[order]
+    occurrences = np.argsort(crossing, kind='stable').reshape(-1, 2)
+    partner = np.empty(len(segment), dtype=int)
+    partner[occurrences[:, 0]], partner[occurrences[:, 1]] = occurrences[:, 1], occurrences[:, 0]
+    m = len(segment)
+    if m == 0:
+        return [xy]
+    # follow the path from its start, jumping across each loop from its first to its last occurrence
+    path, a = [xy[:segment[0]+1]], partner[0]
+    while a != m - 1:
+        path.extend([points[crossing[a]][None], xy[segment[a]+1:segment[a+1]+1]])
+        a = partner[a+1]
+    path.extend([points[crossing[a]][None], xy[segment[a]+1:]])
+    return [np.concatenate(path)]
+
+
+def unique_points(xy: np.ndarray, closed: bool = True) -> np.ndarray:
+    'delete duplicated consecutive points (and the repeated first point at the end of a closed path)'
+    xy = xy[np.concatenate([[True], np.any(np.abs(np.diff(xy, axis=0)) > 0.00000001, axis=1)])]
+    if closed and len(xy) > 1 and np.all(np.abs(xy[0] - xy[-1]) < 0.00000001):
+        xy = xy[:-1]
+    return xy
+
+
+def polygon_areas(loops: list) -> np.ndarray:
+    'return the signed area of each closed path in a list (positive if anticlockwise)'
+    if len(loops) == 0:
+        return np.zeros(0)
+    lengths = np.array([len(loop) for loop in loops])
+    xy = np.concatenate(loops)
+    following = np.arange(len(xy)) + 1
+    following[np.cumsum(lengths) - 1] = np.cumsum(lengths) - lengths  # the point after the last point is the first point
+    cross = xy[:, 0]*xy[following, 1] - xy[:, 1]*xy[following, 0]
+    return 0.5*np.add.reduceat(cross, np.cumsum(lengths) - lengths)
+
+
+def offset_polygon(xy: np.ndarray, distances, join: str = 'miter', miter_limit: float = 2.0, arc_segments: int = 8, closed: bool = True) -> list:
+    '''offset a path (array of xy coordinates) by each of the given distances. return a list with a list of paths
+    (arrays of xy coordinates) for each distance - a closed path may split into several loops or disappear completely.
+    self-intersections are removed. each offset is calculated from the original path so errors do not accumulate, and
+    the trimming of segments for all offsets is calculated together - see surviving_edges()
+    '''
+    xy = unique_points(np.asarray(xy, dtype=float)[:, :2], closed)
+    orientation = (1 if polygon_areas([xy])[0] > 0 else -1) if closed else None
+    distances = np.atleast_1d(distances)
+    results = [[xy] if distance == 0 else [] for distance in distances]
+    # once an inward offset of a closed path is empty, larger inward offsets are not calculated (they are empty too)
+    order = np.argsort(distances*orientation, kind='stable') if closed else np.arange(len(distances))
+    order = order[distances[order] != 0]
+    for k, kept in zip(order, surviving_edges(xy, distances[order], closed)):
+        if closed and distances[k]*orientation > 0 and len(kept) == 0:
+            break
+        results[k] = offset_loops(raw_offset(xy, distances[k], join, miter_limit, arc_segments, closed, kept), distances[k], closed, orientation)
+        if closed and distances[k]*orientation > 0 and len(results[k]) == 0:
+            break
+    return results
+
+
+def offset_loops(raw: np.ndarray, distance: float, closed: bool, orientation: int) -> list:
+    'remove self-intersections from a raw offset (see raw_offset()) and return the resulting paths'
+    if len(raw) < (3 if closed else 2):
+        return []
+    paths = split_self_intersections(raw, closed, orientation)
+    if closed:
+        # an inwards offset cannot create holes, so loops with the opposite orientation to the path are removed
+        loops = [loop for loop in (unique_points(path) for path in paths) if len(loop) > 2]
+        inwards = distance*orientation > 0
+        paths = [loop for loop, area in zip(loops, polygon_areas(loops)) if abs(area) > 1e-10 and (not inwards or area*orientation > 0)]
+    return paths
+
+
+def offset_paths(points: list, offset: float, count: int = 1, flip: bool = False, join: str = 'miter', miter_limit: float = 2.0, arc_segments: int = 8, travel: bool = False, include_original: bool = False) -> list:
+    ''' return 'count' concentric offset paths (list of Points) of the path defined by 'points', spaced by 'offset'.
+    this is an array-based alternative to offset_path() for large paths and many offsets. parameter 'flip' changes
+    the direction of the offset. outer corners are joined according to 'join' ('miter', 'square' or 'round');
+    'miter_limit' squares off miters longer than miter_limit*offset and 'arc_segments' is the number of segments per
+    90 degrees of round joins. self-intersections are removed, so each offset of a closed path may result in several
+    closed paths or none at all. set 'travel' to True to travel to the first point in each offset path.
+    'include_original' can be used to include the original path as well as offset paths in the returned list.
+    '''
+    closed_path = True if abs(points[0].x - points[-1].x) < 0.00000001 and abs(points[0].y - points[-1].y) < 0.00000001 else False
+    xy = np.array([[point.x, point.y] for point in points])
+    distances = offset*np.arange(1, count+1)*(-1 if flip else 1)
+    offset_points = []
+    for paths in offset_polygon(xy, distances, join, miter_limit, arc_segments, closed_path):
+        for path in paths:
+            if closed_path:
+                path = np.concatenate([path, path[:1]])
+            points_now = [Point(x=float(x), y=float(y), z=points[0].z) for x, y in path]
+            if travel: offset_points.extend(travel_to(points_now[0]))
+            offset_points.extend(points_now)
+    if include_original:
+        return points + offset_points
+    else:
+        return offset_points
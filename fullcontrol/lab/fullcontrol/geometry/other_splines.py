@@ -1,39 +1,48 @@
 from lab.fullcontrol.geometry import Point
+from lab.fullcontrol.geometry.bezier import adaptive_parameters
+import numpy as np
 
 
-def catmull_rom_spline(control_points, num_points=10, tension=0.5):
+def catmull_rom_array(control_points: np.ndarray, segment: np.ndarray, t: np.ndarray, tension=0.5) -> np.ndarray:
+    '''evaluate a catmull-rom spline through control_points (array of shape (n, dimensions)) at parameter t (0 to 1) 
+    along the given segments (0 to n-2) between control points. all values are evaluated at once with the basis 
+    matrix of the spline
+    '''
+    control_points = np.asarray(control_points, dtype=float)
+    num_segments = len(control_points) - 1
+    segment, t = np.asarray(segment), np.asarray(t, dtype=float)
+    # basis matrix: coefficients of 1, t, t^2, t^3 for each of the four control points p0, p1, p2, p3
+    basis = np.array([[0, 1, 0, 0],
+                      [-tension, 0, tension, 0],
+                      [2*tension, tension - 3, 3 - 2*tension, -tension],
+                      [-tension, 2 - tension, tension - 2, tension]])
+    coefficients = np.stack([np.ones_like(t), t, t**2, t**3], axis=1) @ basis
+    neighbours = np.stack([np.maximum(segment - 1, 0), segment, segment + 1, np.minimum(segment + 2, num_segments)], axis=1)
+    return np.einsum('ij,ijk->ik', coefficients, control_points[neighbours])
+
+
+def catmull_rom_spline(control_points, num_points=10, tension=0.5, tolerance: float = None, as_array: bool = False):
     '''return a list of points following a catmull-rom spline that passes through the control
-    points. control the smoothness with tension (higher value is smoother - e.g. 0.5). 
+    points. control the smoothness with tension (higher value is smoother - e.g. 0.5). if tolerance
+    is set, num_points is ignored and the spline is adaptively sampled so that no segment deviates 
+    from the spline by more than tolerance. set as_array=True to return a numpy array of xyz 
+    coordinates instead of Points
     '''
-    interpolated_points = []  # List to store the interpolated points
-
+    clpts = np.array([[point.x, point.y, point.z] for point in control_points], dtype=float)
     num_segments = len(control_points) - 1
-
-    segments_per_control_point = max(2, int(num_points/num_segments))
-    for i in range(num_segments):
-        # Select the control points for this segment
-        p0, p1, p2, p3 = control_points[max(0, i - 1)], control_points[i], control_points[i + 1], control_points[min(i + 2, num_segments)]
-
-        # Generate interpolated points for this segment
-        for t in range(segments_per_control_point + 1):
-            t_normalized = t / segments_per_control_point
-
-            # Calculate blending coefficients
-            t2 = t_normalized * t_normalized
-            t3 = t2 * t_normalized
-
-            c0 = -tension * t3 + 2 * tension * t2 - tension * t_normalized
-            c1 = (2 - tension) * t3 + (tension - 3) * t2 + 1
-            c2 = (tension - 2) * t3 + (3 - 2 * tension) * t2 + tension * t_normalized
-            c3 = tension * t3 - tension * t2
-
-            # Interpolate the point on the curve using the control points and coefficients
-            interpolated_point = Point(
-                x=c0 * p0.x + c1 * p1.x + c2 * p2.x + c3 * p3.x,
-                y=c0 * p0.y + c1 * p1.y + c2 * p2.y + c3 * p3.y,
-                z=c0 * p0.z + c1 * p1.z + c2 * p2.z + c3 * p3.z
-            )
-
-            interpolated_points.append(interpolated_point)
-
-    return interpolated_points
+    if tolerance != None:
+        def spline_at(u):
+            # u runs from 0 to num_segments, with the integer part identifying the segment
+            segment = np.minimum(np.floor(u).astype(int), num_segments - 1)
+            return catmull_rom_array(clpts, segment, u - segment, tension)
+        u = adaptive_parameters(spline_at, np.arange(num_segments + 1), tolerance)
+        spline = spline_at(u)
+    else:
+        # as for the original segment-by-segment calculation, each segment includes both of its end points
+        segments_per_control_point = max(2, int(num_points/num_segments))
+        t = np.arange(segments_per_control_point + 1)/segments_per_control_point
+        segment = np.repeat(np.arange(num_segments), len(t))
+        spline = catmull_rom_array(clpts, segment, np.tile(t, num_segments), tension)
+    if as_array:
+        return spline
+    return [Point(x=x, y=y, z=z) for x, y, z in spline.tolist()]
@@ -9,7 +9,7 @@ def reflectXYpolar_list(steps: list, p_reflect: Point, angle_reflect: float) ->
     new_steplist = []
     for i in range(len(steps)):
         step_now = (len(steps)-1)-i
-        if type(steps[step_now]).__name__ != "Point":
+        if not isinstance(steps[step_now], Point):
             raise Exception(
                 f'list of steps contained a {type(steps[step_now]).__name__}. only Points can be included in the list being reflected for now. Other types of objects needs careful consideration in terms of sequencing.')
         new_steplist.append(reflectXYpolar(steps[step_now], p_reflect, angle_reflect))
@@ -1,7 +1,6 @@
 import math
 from fullcontrol.geometry import Point
 from typing import Union
-from copy import deepcopy
 from math import sqrt, cos, sin, radians
 
 
@@ -47,8 +46,6 @@ def rotate_geometry(geometry: Union[Point, list], axis_start: Point, axis_end: P
 
     def rotate_point(point: Point, axis_start: Point, axis_end: Point, angle_rad: float) -> Point:
         'return a copy of a the given point, rotated about the given axis by the given angle'
-        point_new = deepcopy(point)  # deepcopy so that color attribute is copied
-
         # Vector along the rotation axis
         axis = Point(x=axis_end.x - axis_start.x, y=axis_end.y - axis_start.y, z=axis_end.z - axis_start.z)
 
@@ -57,9 +54,7 @@ def rotate_geometry(geometry: Union[Point, list], axis_start: Point, axis_end: P
         axis = Point(x=axis.x/norm, y=axis.y/norm, z=axis.z/norm)
 
         # offset to be relative to origin
-        point_new.x -= axis_start.x
-        point_new.y -= axis_start.y
-        point_new.z -= axis_start.z
+        point_new = Point(x=point.x - axis_start.x, y=point.y - axis_start.y, z=point.z - axis_start.z)
 
         # Rodrigues' rotation formula to find point rotated about vector through origin
         rotated_x = point_new.x*cos(angle_rad) + cross_product(axis, point_new).x*sin(angle_rad) + \
@@ -69,12 +64,8 @@ def rotate_geometry(geometry: Union[Point, list], axis_start: Point, axis_end: P
         rotated_z = point_new.z*cos(angle_rad) + cross_product(axis, point_new).z*sin(angle_rad) + \
             axis.z*dot_product(axis, point_new)*(1 - cos(angle_rad))
 
-        # offset away from origin
-        point_new.x = rotated_x + axis_start.x
-        point_new.y = rotated_y + axis_start.y
-        point_new.z = rotated_z + axis_start.z
-
-        return point_new
+        # offset away from origin (with_ copies the color attribute)
+        return point.with_(x=rotated_x + axis_start.x, y=rotated_y + axis_start.y, z=rotated_z + axis_start.z)
 
     if isinstance(geometry, Point):
         return rotate_point(geometry, axis_start, axis_end, angle_rad)
@@ -13,6 +13,15 @@ class Laser(BaseModelPlus):
     cutting_speed: Optional[float] = None
     travel_speed: Optional[float] = None
     spotsize: Optional[float] = None
+    # if True, laser power (S) is scaled by print_speed/cutting_speed for cutting moves in 'laser_cutter_gcode'
+    ramp_power_by_speed: Optional[bool] = None
+    # attibutes not set by user ... calculated automatically during laser gcode generation:
+    power: Optional[float] = None  # the most recently set constant_power or dynamic_power
+    power_now: Optional[float] = None  # the laser power (S) currently active in the gcode
+
+    def ramped_power(self, speed: float) -> float:
+        'return the laser power for a move at the given speed, scaled relative to the power set for cutting_speed'
+        return self.power * speed / self.cutting_speed
 
     def get_dummy_objects(self):
         'create pseudo objects (for desktop 3D printing FullControl) based on laser parameters'
@@ -0,0 +1,71 @@
+from datetime import datetime
+from fullcontrol.common import Point
+from fullcontrol.gcode.state import State
+from fullcontrol.gcode.controls import GcodeControls
+from fullcontrol.gcode.tips import tips
+from lab.fullcontrol.laser.laser import Laser
+
+
+def xy_gcode(point, state) -> str:
+    'generate XY gcode string to move from the point in state to this point (Z is not used for laser cutting)'
+    s = ''
+    if point.x != None and point.x != state.point.x:
+        s += f'X{point.x:.6f}'.rstrip('0').rstrip('.') + ' '
+    if point.y != None and point.y != state.point.y:
+        s += f'Y{point.y:.6f}'.rstrip('0').rstrip('.') + ' '
+    return s if s != '' else None
+
+
+def point_gcode(point, state, laser: Laser) -> str:
+    '''laser equivalent of Point.gcode(): write a G0/G1 line with F, X and Y words, and an S word if the laser power is
+    ramped by speed. no Z or E words are calculated. return None if there is no movement in XY
+    '''
+    XY_str = xy_gcode(point, state)
+    state.point.update_from(point)
+    if XY_str != None:
+        G_str = 'G1 ' if state.extruder.on or state.extruder.travel_format == "G1_E0" else 'G0 '
+        F_str = state.printer.f_gcode(state)
+        S_str = ''
+        if laser.ramp_power_by_speed and state.extruder.on:
+            power = laser.ramped_power(state.printer.print_speed)
+            if power != laser.power_now:
+                S_str = f'S{power:.1f} '
+                laser.power_now = power
+        state.printer.speed_changed = False
+        return f'{G_str}{F_str}{XY_str}{S_str}'.strip()  # strip the final space
+
+
+def laser_gcode(steps: list, gcode_controls: GcodeControls, show_tips: bool):
+    '''generate laser-cutter gcode from a list of steps in a single pass. Points only write XY moves, Laser objects write
+    M3 (constant power) or M4 (dynamic power) commands, and extrusion commands (e.g. M83) are not written
+    '''
+    gcode_controls.initialize()
+    if show_tips: tips(gcode_controls)
+
+    state = State(steps, gcode_controls)
+    laser = Laser()  # tracks the current laser settings
+    # need a while loop because some classes may change the length of state.steps
+    while state.i < len(state.steps):
+        step = state.steps[state.i]
+        if isinstance(step, Point):
+            gcode_line = point_gcode(step, state, laser)
+        else:
+            gcode_line = step.gcode(state)
+            if type(step).__name__ in ['Extruder', 'StationaryExtrusion']:
+                gcode_line = None  # extrusion commands are not relevant for laser cutting
+            elif type(step).__name__ == 'Laser':
+                laser.update_from(step)
+                if step.constant_power != None or step.dynamic_power != None:
+                    laser.power = step.dynamic_power if step.dynamic_power != None else step.constant_power
+                    laser.power_now = laser.power
+        if gcode_line != None:
+            state.gcode.append(gcode_line)
+        state.i += 1
+    gc = '\n'.join(state.gcode)
+
+    if gcode_controls.save_as != None:
+        filename = gcode_controls.save_as
+        filename += datetime.now().strftime("__%d-%m-%Y__%H-%M-%S.gcode") if gcode_controls.include_date == True else '.gcode'
+        open(filename, 'w').write(gc)
+
+    return gc
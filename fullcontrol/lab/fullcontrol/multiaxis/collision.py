@@ -0,0 +1,268 @@
+from typing import Optional
+from pydantic import BaseModel
+import numpy as np
+from lab.fullcontrol.multiaxis.gcode.kinematics import tool_axis
+
+
+class HeadPart(BaseModel):
+    '''a solid of revolution that is coaxial with the nozzle, used to model the print head (nozzle, heater block,
+    carriage, etc.) for collision checking. it spans from axial_start to axial_end (mm from the nozzle tip along the
+    nozzle axis towards the print head) and its radius varies linearly from radius_start to radius_end. a cone is
+    defined by different radii, a cylinder by equal radii
+    '''
+    name: Optional[str] = 'head'
+    axial_start: Optional[float] = 0
+    axial_end: Optional[float] = None
+    radius_start: Optional[float] = None
+    radius_end: Optional[float] = None
+
+
+class CollisionControls(BaseModel):
+    'control to adjust the machine head model and resolution of collision checking'
+    # primitives that make up the print head. the default represents a typical nozzle and heater block
+    head: Optional[list] = [HeadPart(name='nozzle', axial_start=0, axial_end=5, radius_start=0.5, radius_end=3),
+                            HeadPart(name='heater block', axial_start=5, axial_end=17, radius_start=12, radius_end=12)]
+    voxel_size: Optional[float] = 0.5  # edge length (mm) of voxels used to track printed material
+    bead_width: Optional[float] = 0.4  # the head is enlarged by half of this value to account for the width of printed material
+    clearance: Optional[float] = None  # head surfaces closer than this (mm) to the nozzle tip are not checked. default = 2*voxel_size
+    pose_spacing: Optional[float] = 1.0  # moves longer than this (mm) are checked at intermediate positions
+    angle_spacing: Optional[float] = 5.0  # moves with rotary changes greater than this (degrees) are checked at intermediate orientations
+    bed_z: Optional[float] = None  # if set, the head is checked for collisions with the bed (the plane z=bed_z in model coordinates)
+    layer_height: Optional[float] = 0.2  # z-height of the bands used for the per-layer collision map
+    # parts of the head are first checked at this coarser resolution against a dilated occupancy, so detailed checks are only needed for poses near printed material
+    coarse_voxel_size: Optional[float] = 2.0
+    max_samples_per_batch: Optional[int] = 2000000  # limits memory use by checking poses in batches
+
+
+class CollisionReport(BaseModel):
+    'results of a collision check. first_collision is None if no collisions were found'
+    first_collision: Optional[dict] = None
+    colliding_moves: Optional[list] = []  # indices of steps (Points) at the end of each colliding move
+    layer_map: Optional[dict] = {}  # {layer index: number of colliding moves in that layer}
+    moves_checked: Optional[int] = 0
+    poses_checked: Optional[int] = 0
+
+    def __str__(self):
+        if self.first_collision == None:
+            return f'no collisions found ({self.moves_checked} moves checked at {self.poses_checked} positions)'
+        c = self.first_collision
+        return f"{len(self.colliding_moves)} of {self.moves_checked} moves collide. first collision: step {c['step_index']} " \
+            f"({c['part']} hits {c['obstacle']}) at x={c['x']:.3f} y={c['y']:.3f} z={c['z']:.3f} b={c['b']:.3f} c={c['c']:.3f}" \
+            f"\ncolliding moves per layer: {self.layer_map}"
+
+
+def toolpath_with_extrusion(steps: list) -> tuple:
+    '''return (step_indices, xyzbc, extruding) for all Points in a list of steps. xyzbc is an array of shape (n, 5) of the
+    model position and orientation after each Point, extruding is a boolean array stating whether the move to each Point
+    deposits material. the extruder is on at the start, consistent with multiaxis gcode generation
+    '''
+    step_indices, rows, extruding = [], [], []
+    now = [np.nan]*5
+    on = True
+    for i, step in enumerate(steps):
+        if type(step).__name__ == 'Extruder' and step.on != None:
+            on = step.on
+        elif type(step).__name__ == 'Point':
+            values = (step.x, step.y, step.z, getattr(step, 'b', None), getattr(step, 'c', None))
+            now = [now[j] if values[j] == None else values[j] for j in range(5)]
+            step_indices.append(i)
+            rows.append(now)
+            extruding.append(on)
+    xyzbc = np.array(rows, dtype=float).reshape(-1, 5)
+    xyzbc[:, 3:] = np.nan_to_num(xyzbc[:, 3:])  # undefined rotary axes are treated as 0
+    return np.array(step_indices, dtype=int), xyzbc, np.array(extruding, dtype=bool)
+
+
+def head_samples(part: HeadPart, spacing: float, inflation: float, clearance: float) -> np.ndarray:
+    '''return an array of shape (n, 3) of points on the surface of a HeadPart in local coordinates (axial distance,
+    radial u, radial v), with no two neighbouring points more than spacing apart. points closer to the nozzle tip than
+    clearance (axially) are excluded
+    '''
+    axial = np.linspace(part.axial_start, part.axial_end, max(2, int(np.ceil((part.axial_end-part.axial_start)/spacing))+1))
+    radii = part.radius_start + (part.radius_end-part.radius_start)*(axial-part.axial_start) / \
+        max(part.axial_end-part.axial_start, 1e-9) + inflation
+    # rings on the side of the part plus concentric rings to fill the end caps
+    rings = list(zip(axial, radii))
+    for a, r_cap in ((axial[0], radii[0]), (axial[-1], radii[-1])):
+        rings += [(a, r) for r in np.arange(0, r_cap, spacing)]
+    samples = []
+    for a, r in rings:
+        if a >= clearance:
+            n = max(1, int(np.ceil(2*np.pi*r/spacing)))
+            theta = np.arange(n)*2*np.pi/n
+            samples.append(np.stack([np.full(n, a), r*np.cos(theta), r*np.sin(theta)], axis=1))
+    return np.concatenate(samples) if len(samples) > 0 else np.zeros((0, 3))
+
+
+def lowest_point(part: HeadPart, inflation: float, clearance: float, axis: np.ndarray) -> np.ndarray:
+    'return the z-offset from the nozzle tip of the lowest point of a HeadPart for each tool axis in an array of shape (n, 3)'
+    a_start, a_end = max(part.axial_start, clearance), part.axial_end
+    if a_start > a_end:
+        return np.full(len(axis), np.inf)
+    radius_at = lambda a: part.radius_start + (part.radius_end-part.radius_start)*(a-part.axial_start) / \
+        max(part.axial_end-part.axial_start, 1e-9) + inflation
+    sideways = np.sqrt(np.clip(1 - axis[:, 2]**2, 0, 1))
+    return np.minimum(a_start*axis[:, 2] - radius_at(a_start)*sideways, a_end*axis[:, 2] - radius_at(a_end)*sideways)
+
+
+def voxel_keys(points: np.ndarray, origin: np.ndarray, spacing: float, shape: np.ndarray) -> np.ndarray:
+    'return a unique int64 key for the voxel containing each point, or -1 for points outside the voxel grid'
+    indices = np.floor((points - origin)/spacing).astype(np.int64)
+    inside = np.all((indices >= 0) & (indices < shape), axis=-1)
+    keys = (indices[..., 0]*shape[1] + indices[..., 1])*shape[2] + indices[..., 2]
+    return np.where(inside, keys, -1)
+
+
+def first_in_voxel(keys: np.ndarray, moves: np.ndarray) -> tuple:
+    'return sorted unique voxel keys and the earliest move for each key'
+    order = np.lexsort((moves, keys))
+    keys, moves = keys[order], moves[order]
+    first = np.concatenate(([True], keys[1:] != keys[:-1]))
+    return keys[first], moves[first]
+
+
+def occupancy(points: np.ndarray, moves: np.ndarray, spacing: float, dilation: int = 0) -> dict:
+    '''return a sparse voxel occupancy of printed material that records the index of the move that first printed material
+    in each voxel. if dilation > 0, every voxel also marks its neighbours within that many voxels (used for conservative
+    checks at coarse resolution)
+    '''
+    origin = points.min(axis=0) - (dilation+1)*spacing
+    shape = np.ceil((points.max(axis=0) + (dilation+1)*spacing - origin)/spacing).astype(np.int64) + 1
+    keys, first_printed = first_in_voxel(voxel_keys(points, origin, spacing, shape), moves)
+    if dilation > 0:
+        indices = np.stack([keys // (shape[1]*shape[2]), (keys // shape[2]) % shape[1], keys % shape[2]], axis=1)
+        offsets = np.stack(np.meshgrid(*[np.arange(-dilation, dilation+1)]*3, indexing='ij'), axis=-1).reshape(-1, 3)
+        indices = (indices[:, None] + offsets[None]).reshape(-1, 3)
+        keys = (indices[:, 0]*shape[1] + indices[:, 1])*shape[2] + indices[:, 2]
+        keys, first_printed = first_in_voxel(keys, np.repeat(first_printed, len(offsets)))
+    return {'origin': origin, 'spacing': spacing, 'shape': shape, 'keys': keys, 'first_printed': first_printed}
+
+
+def printed_before(occupied: dict, points: np.ndarray, moves: np.ndarray) -> np.ndarray:
+    'return whether each point (shape (..., 3)) is in a voxel with material printed before the corresponding move'
+    keys = voxel_keys(points, occupied['origin'], occupied['spacing'], occupied['shape'])
+    found = np.clip(np.searchsorted(occupied['keys'], keys), 0, len(occupied['keys'])-1)
+    return (occupied['keys'][found] == keys) & (keys >= 0) & (occupied['first_printed'][found] < moves)
+
+
+def nearest_samples(samples: np.ndarray, targets: np.ndarray, max_pairs: int) -> tuple:
+    '''return the index of the nearest target to each sample and the distance to it. samples are processed in batches
+    so that no more than max_pairs sample-target distances are held at once
+    '''
+    nearest, distances = np.zeros(len(samples), dtype=int), np.zeros(len(samples))
+    target_norms = np.sum(targets**2, axis=1)
+    batch = max(1, max_pairs // max(len(targets), 1))
+    for i0 in range(0, len(samples), batch):
+        chunk = samples[i0:i0+batch]
+        squared = np.sum(chunk**2, axis=1)[:, None] + target_norms[None] - 2*chunk @ targets.T
+        nearest[i0:i0+batch] = squared.argmin(axis=1)
+        distances[i0:i0+batch] = np.sqrt(np.maximum(squared[np.arange(len(chunk)), nearest[i0:i0+batch]], 0))
+    return nearest, distances
+
+
+def head_hits(fine: dict, coarse: dict, fine_samples: np.ndarray, coarse_samples: np.ndarray, groups: np.ndarray,
+              poses: np.ndarray, frames: np.ndarray, pose_moves: np.ndarray, max_samples_per_batch: int) -> np.ndarray:
+    '''return whether the head (samples in local coordinates) hits material printed before the move of each pose.
+    frames is an array of shape (n, 3, 3) of the tool axis and two perpendicular unit vectors for each pose.
+    coarse samples are checked against the dilated coarse occupancy first, then only the fine samples in the groups of
+    coarse samples that hit (groups[i] is the coarse sample nearest to fine sample i) are checked in detail
+    '''
+    hits = np.zeros(len(poses), dtype=bool)
+    order = np.argsort(groups, kind='stable')
+    group_counts = np.bincount(groups, minlength=len(coarse_samples))
+    group_starts = np.cumsum(group_counts) - group_counts
+    batch = max(1, max_samples_per_batch // max(len(coarse_samples), 1))
+    for i0 in range(0, len(poses), batch):
+        i1 = min(i0+batch, len(poses))
+        points = poses[i0:i1, None, :3] + np.matmul(coarse_samples[None], frames[i0:i1])
+        pose, group = np.nonzero(printed_before(coarse, points, pose_moves[i0:i1, None]))
+        counts = group_counts[group]
+        pose = np.repeat(pose + i0, counts)
+        sample = fine_samples[order[np.repeat(group_starts[group], counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts)-counts, counts)]]
+        points = poses[pose, :3] + np.matmul(sample[:, None], frames[pose])[:, 0]
+        hits[pose[printed_before(fine, points, pose_moves[pose])]] = True
+    return hits
+
+
+def check_collisions(steps: list, system: str, controls: CollisionControls = None) -> CollisionReport:
+    '''check whether the print head collides with already-printed material (or the bed, if controls.bed_z is set) at
+    any point in a multiaxis toolpath. everything is evaluated in model coordinates. printed material is tracked in a
+    sparse voxel occupancy that records the move at which each voxel was first printed, so every pose of the head is
+    checked against the material that existed at that time in one vectorised pass. each head part is first checked
+    at a coarse resolution so the detailed check is only done for poses near printed material
+    '''
+    controls = CollisionControls() if controls == None else controls
+    step_indices, xyzbc, extruding = toolpath_with_extrusion(steps)
+    report = CollisionReport(moves_checked=max(len(xyzbc)-1, 0))
+    if len(xyzbc) < 2:
+        return report
+    spacing, coarse_spacing = controls.voxel_size, max(controls.coarse_voxel_size, controls.voxel_size)
+    inflation = controls.bead_width/2
+    clearance = 2*spacing if controls.clearance == None else controls.clearance
+    start, end = xyzbc[:-1], xyzbc[1:]
+    defined = ~np.isnan(start).any(axis=1) & ~np.isnan(end).any(axis=1)
+
+    # material: points along the centreline of every extruding move, labelled with the index of the move
+    printing = np.flatnonzero(defined & extruding[1:])
+    lengths = np.linalg.norm(end[printing, :3] - start[printing, :3], axis=1)
+    counts = np.maximum(1, np.ceil(lengths/(spacing/2)).astype(int)) + 1
+    material_move = np.repeat(printing, counts)
+    t = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts)-counts, counts))/np.repeat(counts-1, counts)
+    material = start[material_move, :3] + (end[material_move, :3] - start[material_move, :3])*t[:, None]
+
+    # poses of the head: the end of every move plus intermediate positions for long moves or large rotations
+    moves = np.flatnonzero(defined)
+    distance = np.linalg.norm(end[moves, :3] - start[moves, :3], axis=1)
+    rotation = np.abs(end[moves, 3:] - start[moves, 3:]).max(axis=1)
+    counts = np.maximum(1, np.maximum(np.ceil(distance/controls.pose_spacing), np.ceil(rotation/controls.angle_spacing)).astype(int))
+    pose_moves = np.repeat(moves, counts)
+    t = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts)-counts, counts) + 1)/np.repeat(counts, counts)
+    poses = start[pose_moves] + (end[pose_moves] - start[pose_moves])*t[:, None]
+    report.poses_checked = len(poses)
+
+    # local frame of the head for each pose: the tool axis and two perpendicular directions
+    axis = tool_axis(system, poses[:, 3], poses[:, 4])
+    reference = np.where(np.abs(axis[:, :1]) < 0.9, [[1.0, 0, 0]], [[0, 1.0, 0]])
+    u = np.cross(axis, reference)
+    u /= np.linalg.norm(u, axis=1)[:, None]
+    v = np.cross(axis, u)
+    frames = np.stack([axis, u, v], axis=1)
+
+    hit_part = np.full(len(poses), -1)
+    obstacle = np.full(len(poses), None, dtype=object)
+    if len(material) > 0:
+        fine = occupancy(material, material_move, spacing)
+        coarse = {}
+        for part_id, part in enumerate(controls.head):
+            fine_samples = head_samples(part, spacing, inflation, clearance)
+            coarse_samples = head_samples(part, coarse_spacing, inflation, clearance - coarse_spacing)
+            if len(fine_samples) == 0:
+                continue
+            groups, distances = nearest_samples(fine_samples, coarse_samples, controls.max_samples_per_batch)
+            # the coarse occupancy is dilated enough to include all material that the fine samples of a group could hit
+            dilation = int(np.ceil((distances.max() + spacing*np.sqrt(3))/coarse_spacing))
+            if dilation not in coarse:
+                coarse[dilation] = occupancy(material, material_move, coarse_spacing, dilation)
+            unchecked = np.flatnonzero(hit_part == -1)
+            hits = head_hits(fine, coarse[dilation], fine_samples, coarse_samples, groups, poses[unchecked], frames[unchecked],
+                             pose_moves[unchecked], controls.max_samples_per_batch)
+            hit_part[unchecked[hits]] = part_id
+            obstacle[unchecked[hits]] = 'printed material'
+    if controls.bed_z != None:
+        for part_id, part in enumerate(controls.head):
+            below_bed = (hit_part == -1) & (poses[:, 2] + lowest_point(part, inflation, clearance, axis) < controls.bed_z)
+            hit_part[below_bed] = part_id
+            obstacle[below_bed] = 'the bed'
+
+    colliding = hit_part != -1
+    if colliding.any():
+        colliding_moves = np.unique(pose_moves[colliding])
+        first_pose = np.flatnonzero(colliding)[0]
+        x, y, z, b, c = (float(value) for value in poses[first_pose])
+        report.first_collision = {'step_index': int(step_indices[pose_moves[first_pose]+1]), 'move_index': int(pose_moves[first_pose]),
+                                  'part': controls.head[hit_part[first_pose]].name, 'obstacle': obstacle[first_pose],
+                                  'x': x, 'y': y, 'z': z, 'b': b, 'c': c}
+        report.colliding_moves = [int(i) for i in step_indices[colliding_moves+1]]
+        layers = np.floor((end[colliding_moves, 2] - np.nanmin(xyzbc[:, 2]))/controls.layer_height + 1e-6).astype(int)
+        report.layer_map = {int(layer): int(count) for layer, count in zip(*np.unique(layers, return_counts=True))}
+    return report
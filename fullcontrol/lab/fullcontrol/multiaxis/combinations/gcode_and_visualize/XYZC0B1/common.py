@@ -11,6 +11,7 @@ from fullcontrol.combinations.gcode_and_visualize.classes import *
 from .classes import *  # over-write above imports
 import fullcontrol.geometry as xyz_geom
 from .xyz_add_bc import xyz_add_bc
+from lab.fullcontrol.multiaxis.collision import HeadPart, CollisionControls, CollisionReport
 
 
 def transform(steps: list, result_type: str, controls: Union[GcodeControls, PlotControls] = None, show_tips: bool = True):
@@ -28,3 +29,11 @@ def transform(steps: list, result_type: str, controls: Union[GcodeControls, Plot
         from fullcontrol.visualize.steps2visualization import visualize
         if controls is None: controls = PlotControls()
         return visualize(steps, controls, show_tips)
+
+
+def check_collisions(steps: list, controls: CollisionControls = None) -> CollisionReport:
+    '''check a design for collisions between the print head and already-printed material (and the bed if
+    controls.bed_z is set). optionally, CollisionControls can be passed to define the print head and resolution
+    '''
+    from lab.fullcontrol.multiaxis.collision import check_collisions as check_system_collisions
+    return check_system_collisions(steps, 'XYZC0B1', controls)
@@ -9,3 +9,6 @@ class GcodeControls(BaseModel):
     bc_intercept: Optional[Point] = Point(x=0, y=0, z=0)
     initialization_data: Optional[dict] = {}  # values passed for initialization_data overwrite the default initialization_data of the printer
     save_as: Optional[str] = None
+    feed_mode: Optional[str] = None  # None for plain F words, 'inverse_time' for G93 inverse-time feed, 'compensated' for F values adjusted to give the designed tool-tip speed
+    unwrap_c: Optional[bool] = False  # unwrap C values to avoid 360-degree spins between consecutive moves
+    tip_tolerance: Optional[float] = None  # if set, moves with rotary motion are subdivided so the tool tip stays within this distance (mm) of the designed path
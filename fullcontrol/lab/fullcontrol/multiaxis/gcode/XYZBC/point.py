@@ -1,6 +1,7 @@
 from typing import Optional
 from fullcontrol.common import Point as BasePoint
 from copy import deepcopy
+from lab.fullcontrol.multiaxis.gcode.feedrate import record_move
 import numpy as np
 
 class Point(BasePoint):
@@ -77,4 +78,6 @@ class Point(BasePoint):
             state.printer.speed_changed = False
             state.point.update_from(self)
             state.point_systemXYZ.update_from(self_systemXYZ)
+            if state.moves != None:
+                record_move(state, len(state.gcode))
             return gcode_str.strip()  # strip the final space
@@ -2,11 +2,15 @@
 import os
 from lab.fullcontrol.multiaxis.gcode.XYZBC.state import State
 from lab.fullcontrol.multiaxis.gcode.XYZBC.controls import GcodeControls
+from lab.fullcontrol.multiaxis.gcode.feedrate import apply_feed_mode
+from lab.fullcontrol.multiaxis.gcode.segmentation import subdivide_rotary_moves
 from datetime import datetime
 
 
 def gcode(steps: list, gcode_controls: GcodeControls = GcodeControls()):
     'return a gcode string generated from a list of steps'
+    if gcode_controls.tip_tolerance != None:
+        steps = subdivide_rotary_moves(steps, 'XYZBC', gcode_controls)
     state = State(steps, gcode_controls)
     # need a while loop because some classes may change the length of state.steps
     while state.i < len(state.steps):
@@ -15,6 +19,8 @@ def gcode(steps: list, gcode_controls: GcodeControls = GcodeControls()):
         if gcode_line != None:
             state.gcode.append(gcode_line)
         state.i += 1
+    if state.moves != None:
+        state.gcode = apply_feed_mode(state.gcode, state.moves, gcode_controls.feed_mode, gcode_controls.unwrap_c)
     gc = '\n'.join(state.gcode)
 
     if gcode_controls.save_as != None:
@@ -17,3 +17,9 @@ class GcodeControls(BaseModel):
     # values passed for initialization_data overwrite the default initialization_data of the printer
     initialization_data: Optional[dict] = {}
     save_as: Optional[str] = None
+    # None for plain F words, 'inverse_time' for G93 inverse-time feed, 'compensated' for F values adjusted to give the designed tool-tip speed
+    feed_mode: Optional[str] = None
+    # unwrap C values to avoid 360-degree spins between consecutive moves
+    unwrap_c: Optional[bool] = False
+    # if set, moves with rotary motion are subdivided so the tool tip stays within this distance (mm) of the designed path
+    tip_tolerance: Optional[float] = None
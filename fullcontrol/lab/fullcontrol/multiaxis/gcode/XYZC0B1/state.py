@@ -27,6 +27,7 @@ class State(BaseModel):
     point_systemXYZ: Optional[Point] = Point()
     i: Optional[int] = 0
     gcode: Optional[list] = []
+    moves: Optional[list] = None
 
     def __init__(self, steps: list, gcode_controls: GcodeControls):
         super().__init__()
@@ -86,3 +87,6 @@ class State(BaseModel):
         self.steps = initialization_data['starting_procedure_steps'] + \
             primer_steps + steps + \
             initialization_data['ending_procedure_steps']
+
+        if gcode_controls.feed_mode != None or gcode_controls.unwrap_c:
+            self.moves = []  # moves are recorded for the feed-mode post-stage
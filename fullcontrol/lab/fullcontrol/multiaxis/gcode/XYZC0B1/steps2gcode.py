@@ -2,6 +2,8 @@
 import os
 from lab.fullcontrol.multiaxis.gcode.XYZC0B1.state import State
 from lab.fullcontrol.multiaxis.gcode.XYZC0B1.controls import GcodeControls
+from lab.fullcontrol.multiaxis.gcode.feedrate import apply_feed_mode
+from lab.fullcontrol.multiaxis.gcode.segmentation import subdivide_rotary_moves
 from datetime import datetime
 
 
@@ -10,6 +12,8 @@ def gcode(steps: list, gcode_controls: GcodeControls = GcodeControls()):
     if gcode_controls.b_offset_z == None:
         raise Exception(
             "gcode generation requires an fc4.GcodeControls object to be supplied with the attribute 'b_offset_z' set correctly")
+    if gcode_controls.tip_tolerance != None:
+        steps = subdivide_rotary_moves(steps, 'XYZC0B1', gcode_controls)
     state = State(steps, gcode_controls)
     # need a while loop because some classes may change the length of state.steps
     while state.i < len(state.steps):
@@ -18,6 +22,8 @@ def gcode(steps: list, gcode_controls: GcodeControls = GcodeControls()):
         if gcode_line != None:
             state.gcode.append(gcode_line)
         state.i += 1
+    if state.moves != None:
+        state.gcode = apply_feed_mode(state.gcode, state.moves, gcode_controls.feed_mode, gcode_controls.unwrap_c)
     gc = '\n'.join(state.gcode)
 
     if gcode_controls.save_as != None:
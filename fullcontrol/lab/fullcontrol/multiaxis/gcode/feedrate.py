@@ -0,0 +1,130 @@
+import numpy as np
+
+# feed modes supported by the multiaxis gcode post-stage. None means plain F words (the designed speed of the machine axes)
+FEED_MODES = [None, 'inverse_time', 'compensated']
+# moves shorter than this (in minutes) are clamped to avoid infinite inverse-time feeds for moves with no effective motion
+MIN_MOVE_TIME = 1e-6
+
+
+def record_move(state, line_index: int):
+    '''store model coordinates, system coordinates and the designed feedrate of the move that was just converted to gcode.
+    this must be called after state.point and state.point_systemXYZ have been updated for the move
+    '''
+    model, system = state.point, state.point_systemXYZ
+    feedrate = state.printer.print_speed if state.extruder.on else state.printer.travel_speed
+    state.moves.append((line_index, model.x, model.y, model.z, system.x, system.y, system.z,
+                        getattr(system, 'b', None), getattr(system, 'c', None), feedrate, state.printer.travel_speed))
+
+
+def tool_tip_times(moves: np.ndarray) -> tuple:
+    '''calculate the duration (minutes) of each recorded move so the tool tip travels at the designed speed relative to the part.
+    moves with no tool-tip motion fall back to machine xyz distance, then to rotary distance in degrees. moves are never
+    faster than the travel speed for the machine axes (xyz distance and rotary distance in degrees), so a tool tip that
+    barely moves while the machine axes move a long way does not give an extreme feedrate.
+    returns (times, machine_distances) - the first move, and any move from an undefined position, has a time of nan
+    '''
+    tip = np.linalg.norm(np.diff(moves[:, 1:4], axis=0), axis=1)
+    machine = np.linalg.norm(np.diff(moves[:, 4:7], axis=0), axis=1)
+    rotary = np.linalg.norm(np.nan_to_num(np.diff(moves[:, 7:9], axis=0)), axis=1)
+    machine_or_rotary = np.where(machine > 1e-9, machine, rotary)
+    distance = np.where(tip > 1e-9, tip, machine_or_rotary)
+    times = np.maximum(distance / moves[1:, 9], MIN_MOVE_TIME)
+    fastest = np.maximum(machine, rotary) / moves[1:, 10]
+    times = np.where(np.isnan(times), times, np.fmax(times, fastest))  # no limit if the travel speed is not set (nan)
+    times = np.concatenate(([np.nan], times))
+    machine_or_rotary = np.concatenate(([np.nan], machine_or_rotary))
+    return times, machine_or_rotary
+
+
+def unwrap_rotary(angles: np.ndarray) -> np.ndarray:
+    'unwrap rotary angles (degrees) so no consecutive moves differ by more than 180 degrees, which avoids unnecessary 360-degree spins'
+    angles = angles.copy()
+    defined = ~np.isnan(angles)
+    angles[defined] = np.round(np.unwrap(angles[defined], period=360), 6)
+    return angles
+
+
+def set_words(line: str, f_word: str = None, c_word: str = None, remove_f: bool = False) -> str:
+    'replace the F and/or C words of a line of gcode (any comment at the end of the line is preserved)'
+    code, separator, comment = line.partition(' ; ')
+    words = code.split(' ')
+    if f_word != None or remove_f:
+        words = [word for word in words if not word.startswith('F')]
+    if c_word != None:
+        words = [c_word if word.startswith('C') else word for word in words]
+    if f_word != None:
+        words.insert(1, f_word)
+    return ' '.join(words) + separator + comment
+
+
+def apply_feed_mode(gcode_lines: list, moves: list, feed_mode: str = None, unwrap_c: bool = False) -> list:
+    '''post-process gcode lines from a multiaxis gcode generation based on the moves recorded by record_move().
+    feed_mode 'inverse_time' wraps the moves in G93/G94 and gives every move F=1/duration. feed_mode 'compensated'
+    changes F so the machine-axis feedrate results in the designed tool-tip speed. in both modes, the machine axes are
+    not moved faster than the travel speed - see tool_tip_times(). unwrap_c=True unwraps C values
+    so the C axis never rotates more than 180 degrees between consecutive moves. returns a new list of gcode lines
+    '''
+    if feed_mode not in FEED_MODES:
+        raise Exception(f"feed_mode must be one of {FEED_MODES} (feed_mode='{feed_mode}' was given)")
+    if len(moves) == 0:
+        return gcode_lines
+    moves = np.array(moves, dtype=float)  # None values become nan
+    line_indices = moves[:, 0].astype(int)
+
+    c_words = [None]*len(moves)
+    if unwrap_c:
+        c_unwrapped = unwrap_rotary(moves[:, 8])
+        for i in np.flatnonzero(c_unwrapped != np.round(moves[:, 8], 6)):
+            c_words[i] = f'C{c_unwrapped[i]:.6f}'.rstrip('0').rstrip('.')
+        moves[:, 8] = c_unwrapped
+
+    if feed_mode == None:
+        new_gcode_lines = list(gcode_lines)
+        for i, line_index in enumerate(line_indices):
+            if c_words[i] != None:
+                new_gcode_lines[line_index] = set_words(new_gcode_lines[line_index], c_word=c_words[i])
+        return new_gcode_lines
+
+    times, machine_distances = tool_tip_times(moves)
+    if feed_mode == 'inverse_time':
+        feedrates = 1/times
+        f_words = [f'F{f:.6f}'.rstrip('0').rstrip('.') for f in feedrates]
+    elif feed_mode == 'compensated':
+        feedrates = np.where(np.isnan(times), moves[:, 9], machine_distances/times)
+        f_words = [f'F{f:.1f}'.rstrip('0').rstrip('.') for f in feedrates]
+
+    defined_moves = np.flatnonzero(~np.isnan(times))
+    first_g93_line = line_indices[defined_moves[0]] if len(defined_moves) > 0 else None
+    last_g93_line = line_indices[defined_moves[-1]] if len(defined_moves) > 0 else None
+    move_number = {line_index: i for i, line_index in enumerate(line_indices)}
+
+    new_gcode_lines = []
+    f_now = None
+    for line_index, line in enumerate(gcode_lines):
+        i = move_number.get(line_index)
+        if feed_mode == 'inverse_time':
+            in_g93 = first_g93_line != None and first_g93_line <= line_index <= last_g93_line
+            if line_index == first_g93_line:
+                new_gcode_lines.append('G93 ; inverse-time feed mode')
+            if i != None and in_g93:
+                line = set_words(line, f_word=f_words[i], c_word=c_words[i])
+            elif i != None:
+                line = set_words(line, c_word=c_words[i])
+            elif in_g93 and line.startswith(('G0 ', 'G1 ')):
+                # moves that were not recorded (e.g. stationary extrusion) are given in units-per-minute
+                new_gcode_lines.extend(['G94 ; units-per-minute feed mode', line, 'G93 ; inverse-time feed mode'])
+                continue
+            new_gcode_lines.append(line)
+            if line_index == last_g93_line:
+                new_gcode_lines.append('G94 ; units-per-minute feed mode')
+        elif feed_mode == 'compensated':
+            if i != None:
+                if f_words[i] != f_now:
+                    line = set_words(line, f_word=f_words[i], c_word=c_words[i])
+                    f_now = f_words[i]
+                else:
+                    line = set_words(line, c_word=c_words[i], remove_f=True)
+            elif line.startswith(('G0 ', 'G1 ')) and ' F' in line.partition(' ; ')[0]:
+                f_now = None  # the designed feedrate of this line is now active
+            new_gcode_lines.append(line)
+    return new_gcode_lines
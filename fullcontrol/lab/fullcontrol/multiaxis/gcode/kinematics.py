@@ -0,0 +1,109 @@
+import numpy as np
+
+# vectorised kinematics for the multiaxis systems. model (part) coordinates and system (machine) coordinates are
+# numpy arrays of shape (..., 3) for xyz. b and c are arrays of angles in degrees that broadcast against xyz[..., 0].
+# the equations match the inverse_kinematics() methods of the Point classes for each system
+
+
+def inverse_kinematics(system: str, xyz: np.ndarray, b: np.ndarray, c: np.ndarray, gcode_controls) -> np.ndarray:
+    'return system xyz for model xyz at the given rotary angles'
+    x, y, z = xyz[..., 0], xyz[..., 1], xyz[..., 2]
+    sb, cb = np.sin(np.radians(b)), np.cos(np.radians(b))
+    if system == 'XYZBC':
+        # inverse transformation for a b-c bed (https://linuxcnc.org/docs/html/motion/5-axis-kinematics.html)
+        sc, cc = np.sin(np.radians(c)), np.cos(np.radians(c))
+        ix, iz = gcode_controls.bc_intercept.x, gcode_controls.bc_intercept.z
+        x_rotated = cb*cc*x - sc*cb*y + sb*z
+        y_rotated = sc*x + cc*y
+        z_rotated = -sb*cc*x + sb*sc*y + cb*z
+        x_system = x_rotated + ix - sb*iz - cb*ix
+        y_system = y_rotated
+        z_system = z_rotated + iz*(1-cb) + sb*ix
+    elif system == 'XYZB':
+        x_system, y_system, z_system = x - b_nozzle_offset_x(sb, cb, gcode_controls), y, z - b_nozzle_offset_z(sb, cb, gcode_controls)
+    elif system == 'XYZC0B1':
+        sc, cc = np.sin(np.radians(c)), np.cos(np.radians(c))
+        cx, cy = gcode_controls.c_offset_x, gcode_controls.c_offset_y
+        x_after_c = cx + (x-cx)*cc - (y-cy)*sc
+        y_after_c = cy + (y-cy)*cc + (x-cx)*sc
+        x_system, y_system, z_system = x_after_c - b_nozzle_offset_x(sb, cb, gcode_controls), y_after_c, z - b_nozzle_offset_z(sb, cb, gcode_controls)
+    else:
+        raise Exception(f"kinematics are not defined for system '{system}' - use 'XYZBC', 'XYZB' or 'XYZC0B1'")
+    return np.stack(np.broadcast_arrays(x_system, y_system, z_system), axis=-1)
+
+
+def forward_kinematics(system: str, xyz_system: np.ndarray, b: np.ndarray, c: np.ndarray, gcode_controls) -> np.ndarray:
+    'return model xyz for system xyz at the given rotary angles (the inverse of inverse_kinematics())'
+    x, y, z = xyz_system[..., 0], xyz_system[..., 1], xyz_system[..., 2]
+    sb, cb = np.sin(np.radians(b)), np.cos(np.radians(b))
+    if system == 'XYZBC':
+        sc, cc = np.sin(np.radians(c)), np.cos(np.radians(c))
+        ix, iz = gcode_controls.bc_intercept.x, gcode_controls.bc_intercept.z
+        x_rotated = x - ix + sb*iz + cb*ix
+        y_rotated = y
+        z_rotated = z - iz*(1-cb) - sb*ix
+        # the rotation matrix is orthonormal so its transpose is its inverse
+        x_model = cb*cc*x_rotated + sc*y_rotated - sb*cc*z_rotated
+        y_model = -sc*cb*x_rotated + cc*y_rotated + sb*sc*z_rotated
+        z_model = sb*x_rotated + cb*z_rotated
+    elif system == 'XYZB':
+        x_model, y_model, z_model = x + b_nozzle_offset_x(sb, cb, gcode_controls), y, z + b_nozzle_offset_z(sb, cb, gcode_controls)
+    elif system == 'XYZC0B1':
+        sc, cc = np.sin(np.radians(c)), np.cos(np.radians(c))
+        cx, cy = gcode_controls.c_offset_x, gcode_controls.c_offset_y
+        x_after_c, y_after_c = x + b_nozzle_offset_x(sb, cb, gcode_controls), y
+        x_model = cx + (x_after_c-cx)*cc + (y_after_c-cy)*sc
+        y_model = cy + (y_after_c-cy)*cc - (x_after_c-cx)*sc
+        z_model = z + b_nozzle_offset_z(sb, cb, gcode_controls)
+    else:
+        raise Exception(f"kinematics are not defined for system '{system}' - use 'XYZBC', 'XYZB' or 'XYZC0B1'")
+    return np.stack(np.broadcast_arrays(x_model, y_model, z_model), axis=-1)
+
+
+def b_nozzle_offset_x(sb: np.ndarray, cb: np.ndarray, gcode_controls) -> np.ndarray:
+    'offset in x of the nozzle tip from its b=0 position for a nozzle tilting about the y axis'
+    nozzle_offset_x, nozzle_offset_z = -gcode_controls.b_offset_x, -gcode_controls.b_offset_z
+    return -(nozzle_offset_x*(1-cb)) + nozzle_offset_z*sb
+
+
+def b_nozzle_offset_z(sb: np.ndarray, cb: np.ndarray, gcode_controls) -> np.ndarray:
+    'offset in z of the nozzle tip from its b=0 position for a nozzle tilting about the y axis'
+    nozzle_offset_x, nozzle_offset_z = -gcode_controls.b_offset_x, -gcode_controls.b_offset_z
+    return -(nozzle_offset_z*(1-cb)) - nozzle_offset_x*sb
+
+
+def tool_axis(system: str, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    'return the unit vector from the nozzle tip towards the print head in model coordinates'
+    sb, cb = np.sin(np.radians(b)), np.cos(np.radians(b))
+    if system == 'XYZBC':
+        sc, cc = np.sin(np.radians(c)), np.cos(np.radians(c))
+        axis = (-sb*cc, sb*sc, cb)
+    elif system == 'XYZB':
+        axis = (sb, np.zeros_like(sb), cb)
+    elif system == 'XYZC0B1':
+        sc, cc = np.sin(np.radians(c)), np.cos(np.radians(c))
+        axis = (sb*cc, -sb*sc, cb)
+    else:
+        raise Exception(f"kinematics are not defined for system '{system}' - use 'XYZBC', 'XYZB' or 'XYZC0B1'")
+    return np.stack(np.broadcast_arrays(*axis), axis=-1)
+
+
+def toolpath_arrays(steps: list) -> tuple:
+    '''return (step_indices, xyzbc) for all Points in a list of steps, where xyzbc is an array of shape (n, 5) of the
+    model position and orientation after each Point. undefined attributes are carried forward from previous Points
+    (they are nan until first defined). c is 0 for systems without a c axis
+    '''
+    step_indices, rows = [], []
+    now = [np.nan]*5
+    has_c = False
+    for i, step in enumerate(steps):
+        if type(step).__name__ == 'Point':
+            values = (step.x, step.y, step.z, getattr(step, 'b', None), getattr(step, 'c', None))
+            now = [now[j] if values[j] == None else values[j] for j in range(5)]
+            has_c = has_c or hasattr(step, 'c')
+            step_indices.append(i)
+            rows.append(now)
+    xyzbc = np.array(rows, dtype=float).reshape(-1, 5)
+    if not has_c:
+        xyzbc[:, 4] = 0
+    return np.array(step_indices, dtype=int), xyzbc
@@ -0,0 +1,80 @@
+import numpy as np
+from lab.fullcontrol.multiaxis.gcode.kinematics import inverse_kinematics, forward_kinematics, toolpath_arrays
+from lab.fullcontrol.multiaxis.gcode.feedrate import unwrap_rotary
+
+# number of intervals each (sub)segment is sampled at when measuring tool-tip deviation
+SAMPLES_PER_SEGMENT = 8
+# maximum number of times the number of segments is increased for moves that still exceed the tolerance
+MAX_REFINEMENTS = 8
+
+
+def segment_deviation(system: str, start: np.ndarray, end: np.ndarray, gcode_controls, samples: int = SAMPLES_PER_SEGMENT) -> np.ndarray:
+    '''return the maximum distance between the designed tool-tip path (a straight line in model coordinates) and the
+    tool-tip path that results from the machine interpolating all of its axes linearly. start and end are arrays of
+    shape (n, 5) of model xyzbc. forward kinematics of the interpolated machine axes gives the actual tool-tip path
+    '''
+    t = (np.arange(1, samples)/samples)[None, :, None]
+    system_start = inverse_kinematics(system, start[:, :3], start[:, 3], start[:, 4], gcode_controls)
+    system_end = inverse_kinematics(system, end[:, :3], end[:, 3], end[:, 4], gcode_controls)
+    system_xyz = system_start[:, None] + t*(system_end - system_start)[:, None]
+    angles = start[:, None, 3:] + t*(end - start)[:, None, 3:]
+    actual = forward_kinematics(system, system_xyz, angles[..., 0], angles[..., 1], gcode_controls)
+    designed = start[:, None, :3] + t*(end - start)[:, None, :3]
+    return np.linalg.norm(actual - designed, axis=-1).max(axis=1)
+
+
+def segments_needed(system: str, start: np.ndarray, end: np.ndarray, tolerance: float, gcode_controls) -> np.ndarray:
+    '''return the number of equal segments each move (start -> end, arrays of model xyzbc) must be split into so the
+    tool-tip deviation of every segment is within tolerance. deviation of a segment scales with the square of its length,
+    so the first estimate is sqrt(deviation/tolerance) segments, which is then verified and refined where necessary
+    '''
+    segments = np.ones(len(start), dtype=int)
+    defined = ~np.isnan(start).any(axis=1) & ~np.isnan(end).any(axis=1)
+    moves = np.flatnonzero(defined & np.any(start[:, 3:] != end[:, 3:], axis=1))  # only moves with rotary motion deviate
+    if len(moves) == 0:
+        return segments
+    deviation = segment_deviation(system, start[moves], end[moves], gcode_controls)
+    segments[moves] = np.maximum(1, np.ceil(np.sqrt(deviation/tolerance)))
+    for _ in range(MAX_REFINEMENTS):
+        moves = moves[segments[moves] > 1]
+        if len(moves) == 0:
+            break
+        counts = segments[moves]
+        first_segment = np.cumsum(counts) - counts
+        move = np.repeat(np.arange(len(moves)), counts)
+        k = (np.arange(counts.sum()) - first_segment[move])[:, None]
+        move_start, move_end = start[moves][move], end[moves][move]
+        sub_start = move_start + (move_end - move_start)*(k/counts[move, None])
+        sub_end = move_start + (move_end - move_start)*((k+1)/counts[move, None])
+        worst = np.maximum.reduceat(segment_deviation(system, sub_start, sub_end, gcode_controls), first_segment)
+        failing = worst > tolerance
+        if not failing.any():
+            break
+        moves = moves[failing]
+        segments[moves] = np.maximum(counts[failing]+1, np.ceil(counts[failing]*np.sqrt(worst[failing]/tolerance)))
+    return segments
+
+
+def subdivide_rotary_moves(steps: list, system: str, gcode_controls) -> list:
+    '''return a new list of steps in which Points are inserted to split moves with rotary motion wherever the tool tip
+    would deviate from the designed path by more than gcode_controls.tip_tolerance. moves that stay within the tolerance
+    (including all moves without rotary motion) are not changed
+    '''
+    step_indices, xyzbc = toolpath_arrays(steps)
+    if len(step_indices) < 2:
+        return steps
+    if getattr(gcode_controls, 'unwrap_c', False):
+        xyzbc[:, 4] = unwrap_rotary(xyzbc[:, 4])  # interpolate c in the same direction the machine will rotate
+    segments = segments_needed(system, xyzbc[:-1], xyzbc[1:], gcode_controls.tip_tolerance, gcode_controls)
+    new_steps = []
+    i_previous = 0
+    for j in np.flatnonzero(segments > 1):
+        i = step_indices[j+1]
+        new_steps.extend(steps[i_previous:i])
+        attributes = ['x', 'y', 'z', 'b', 'c'] if hasattr(steps[i], 'c') else ['x', 'y', 'z', 'b']
+        fractions = np.arange(1, segments[j])/segments[j]
+        for values in xyzbc[j] + (xyzbc[j+1] - xyzbc[j])*fractions[:, None]:
+            new_steps.append(type(steps[i])(**{attribute: round(float(value), 6) for attribute, value in zip(attributes, values)}))
+        i_previous = i
+    new_steps.extend(steps[i_previous:])
+    return new_steps
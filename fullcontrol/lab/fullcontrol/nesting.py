@@ -0,0 +1,243 @@
+import numpy as np
+from copy import deepcopy
+from math import ceil, floor
+from fullcontrol import Point, Extruder, ExtrusionGeometry, Printer, Vector, GcodeControls, flatten, move
+from fullcontrol.gcode.limits import design_arrays
+import fullcontrol.devices.community.singletool.base_settings as base_settings
+
+# designs are nested on a raster of the build plate. each design's XY footprint (the convex hull of its extruded path,
+# or the cells its path covers with enclosed holes filled) is rasterised and dilated by half the spacing between parts.
+# parts are placed largest first at the bottom-left-most position where their footprint doesn't overlap the footprints
+# already placed. the overlap for every position on the plate is found at once by correlating the footprint with the
+# occupied cells of the plate using FFTs
+
+
+def extruded_xy(steps: list) -> np.ndarray:
+    'return the xy coordinates (n, 2) of the start and end of every extruding segment in a design'
+    arrays = design_arrays(steps, base_settings.default_initial_settings)
+    xy, on = arrays['xyz'][:, :2], arrays['on']
+    extruding = np.flatnonzero(on[1:] & np.isfinite(xy[1:]).all(axis=1) & np.isfinite(xy[:-1]).all(axis=1))
+    if len(extruding) == 0:
+        # designs without any extrusion (e.g. just points) are nested by their points
+        return xy[np.isfinite(xy).all(axis=1)]
+    return np.stack([xy[extruding], xy[extruding + 1]], axis=1).reshape(-1, 2)
+
+
+def convex_hull(xy: np.ndarray) -> np.ndarray:
+    'return the vertices (anticlockwise) of the convex hull of points xy (n, 2), using the monotone chain algorithm'
+    xy = np.unique(xy, axis=0)
+    if len(xy) < 3:
+        return xy
+
+    def half_hull(points):
+        hull = []
+        for point in points.tolist():
+            while len(hull) >= 2 and (hull[-1][0]-hull[-2][0])*(point[1]-hull[-2][1]) - (hull[-1][1]-hull[-2][1])*(point[0]-hull[-2][0]) <= 0:
+                hull.pop()
+            hull.append(point)
+        return hull[:-1]
+    return np.array(half_hull(xy) + half_hull(xy[::-1]))
+
+
+def dilate(mask: np.ndarray, cells: int) -> np.ndarray:
+    'dilate a boolean mask by a square of (2*cells+1) cells, with the mask enlarged by cells on every side'
+    if cells <= 0:
+        return mask
+    mask = np.pad(mask, cells)
+    for axis in (0, 1):
+        counts = np.cumsum(np.moveaxis(mask, axis, 0), axis=0, dtype=np.int64)
+        # window[k] = number of cells k-cells .. k+cells in the mask
+        counts = np.pad(np.pad(counts, [(cells + 1, 0), (0, 0)]), [(0, cells), (0, 0)], mode='edge')
+        window = counts[2*cells + 1:] - counts[:len(counts) - 2*cells - 1]
+        mask = np.moveaxis(window > 0, 0, axis)
+    return mask
+
+
+def fill_holes(mask: np.ndarray) -> np.ndarray:
+    'return the mask with every empty region that is not connected to the edge of the mask filled'
+    empty = ~np.pad(mask, 1)
+    outside = np.zeros_like(empty)
+    outside[0, :] = outside[-1, :] = outside[:, 0] = outside[:, -1] = True
+    while True:
+        grown = outside.copy()
+        grown[1:] |= outside[:-1]
+        grown[:-1] |= outside[1:]
+        grown[:, 1:] |= outside[:, :-1]
+        grown[:, :-1] |= outside[:, 1:]
+        grown &= empty
+        if (grown == outside).all():
+            return ~outside[1:-1, 1:-1]
+        outside = grown
+
+
+def footprint_mask(xy: np.ndarray, resolution: float, margin: float, footprint: str = 'convex') -> tuple:
+    '''
+    Rasterise the XY footprint of a design (from the points xy of its extruded path) on a grid with cells of size
+    resolution, dilated by margin.
+
+    Args:
+        xy (np.ndarray): Coordinates (n, 2) of the path.
+        resolution (float): Size of grid cells (mm).
+        margin (float): Distance (mm) the footprint is enlarged by on every side.
+        footprint (str, optional): 'convex' for the convex hull of the path, or 'path' for the cells covered by the path
+            with enclosed holes filled (a concave footprint). Defaults to 'convex'.
+
+    Returns:
+        tuple: (mask, origin) - boolean mask (rows in y, columns in x) and the xy coordinates of its lower-left corner.
+    '''
+    lower = xy.min(axis=0)
+    size = np.maximum(np.ceil((xy.max(axis=0) - lower)/resolution).astype(int), 0) + 1
+    if footprint == 'convex':
+        hull = convex_hull(xy)
+        centres = np.stack(np.meshgrid(np.arange(size[0]), np.arange(size[1])), axis=-1)*resolution + lower + resolution/2
+        mask = np.ones((size[1], size[0]), dtype=bool)
+        if len(hull) >= 3:
+            # cells are inside the hull if their centre is within half a cell of the left side of every edge
+            edges = np.roll(hull, -1, axis=0) - hull
+            for start, edge in zip(hull, edges):
+                cross = edge[0]*(centres[..., 1] - start[1]) - edge[1]*(centres[..., 0] - start[0])
+                mask &= cross >= -np.hypot(*edge)*resolution*0.71
+    elif footprint == 'path':
+        # sample the path segments (pairs of rows in xy) at intervals of half a cell
+        starts, ends = (xy[0::2], xy[1::2]) if len(xy) > 1 else (xy, xy)
+        samples = np.maximum(np.ceil(np.linalg.norm(ends - starts, axis=1)/(resolution/2)).astype(int), 1) + 1
+        segment = np.repeat(np.arange(len(starts)), samples)
+        t = (np.arange(samples.sum()) - np.repeat(np.cumsum(samples) - samples, samples))/np.repeat(samples - 1, samples).clip(1)
+        points = starts[segment] + t[:, None]*(ends[segment] - starts[segment])
+        cells = np.minimum(((points - lower)/resolution).astype(int), size - 1)
+        mask = np.zeros((size[1], size[0]), dtype=bool)
+        mask[cells[:, 1], cells[:, 0]] = True
+        mask = fill_holes(mask)
+    else:
+        raise ValueError(f"footprint '{footprint}' not recognized. Please use 'convex' or 'path'")
+    cells = ceil(margin/resolution)
+    return dilate(mask, cells), lower - cells*resolution
+
+
+def plate_layout(designs: list, bed_size: tuple, spacing: float = 5, resolution: float = 1, footprint: str = 'convex') -> list:
+    '''
+    Find positions for several designs on a build plate with a bottom-left heuristic: designs are placed largest
+    footprint first, each at the lowest y (then lowest x) position where it is at least 'spacing' from designs already
+    placed and at least spacing/2 from the edge of the plate (to the resolution of the grid).
+
+    Args:
+        designs (list): List of designs (each a list of steps).
+        bed_size (tuple): (x, y) size of the build plate (mm), with the origin at (0, 0).
+        spacing (float, optional): Minimum distance (mm) between the footprints of designs. Defaults to 5.
+        resolution (float, optional): Size (mm) of grid cells used to rasterise footprints. Defaults to 1.
+        footprint (str, optional): 'convex' or 'path' - see footprint_mask(). Defaults to 'convex'.
+
+    Returns:
+        list: The (x, y) offset to move each design by to its position on the plate, or None for designs that don't fit.
+    '''
+    plate = np.zeros((floor(bed_size[1]/resolution), floor(bed_size[0]/resolution)), dtype=bool)
+    masks = [footprint_mask(extruded_xy(flatten(design)), resolution, spacing/2, footprint) for design in designs]
+    offsets = [None]*len(designs)
+    for index in sorted(range(len(designs)), key=lambda index: -masks[index][0].sum()):
+        mask, origin = masks[index]
+        h, w = mask.shape
+        if h > plate.shape[0] or w > plate.shape[1]:
+            continue
+        # overlap[j, i] = number of occupied plate cells under the footprint with its lower-left corner at cell (i, j)
+        shape = (plate.shape[0] + h, plate.shape[1] + w)
+        overlap = np.fft.irfft2(np.fft.rfft2(plate, shape)*np.conj(np.fft.rfft2(mask, shape)), shape)
+        free = overlap[:plate.shape[0] - h + 1, :plate.shape[1] - w + 1] < 0.5
+        if not free.any():
+            continue
+        j, i = divmod(int(np.argmax(free.ravel())), free.shape[1])  # first free position in row order (bottom-left)
+        plate[j:j + h, i:i + w] |= mask
+        offsets[index] = (float(i*resolution - origin[0]), float(j*resolution - origin[1]))
+    return offsets
+
+
+def nest(designs: list, controls: GcodeControls = None, bed_size: tuple = None, spacing: float = 5, resolution: float = 1,
+         footprint: str = 'convex', layer_band: float = None, z_hop: float = 1) -> list:
+    '''
+    Nest several designs onto the build plate (see plate_layout()) and combine them into one design, with travel moves
+    between them. Travel moves lift to z_hop above the highest point printed so far before moving in XY.
+
+    If layer_band is None, each design is printed completely before the next one (beware of collisions between the
+    print head/gantry and taller parts). If layer_band is set (e.g. the layer height), designs are interleaved: each
+    design is split wherever its z moves into a new band of height layer_band and all designs are printed one band at
+    a time. Splitting a design keeps every segment - after travelling back to a design, it continues from the last
+    point it reached.
+
+    Print speed, travel speed, extrusion geometry and extruder on/off are restored each time the combined design moves
+    to another design, so designs do not inherit each other's settings. Other changes of state (e.g. fan, temperature
+    or tool changes) are not restored.
+
+    Args:
+        designs (list): List of designs (each a list of steps) with their own x/y positions (they are moved).
+        controls (GcodeControls, optional): Controls of the printer - used for the build plate size (build_volume_x/y)
+            and initial speeds and extrusion geometry. Defaults to None (base settings).
+        bed_size (tuple, optional): (x, y) size of the build plate (mm) if not taken from the printer. Defaults to None.
+        spacing (float, optional): Minimum distance (mm) between designs. Defaults to 5.
+        resolution (float, optional): Size (mm) of grid cells used to rasterise footprints. Defaults to 1.
+        footprint (str, optional): 'convex' or 'path' - see footprint_mask(). Defaults to 'convex'.
+        layer_band (float, optional): Height (mm) of bands to interleave designs by. Defaults to None.
+        z_hop (float, optional): Height (mm) of travel moves above the highest printed point. Defaults to 1.
+
+    Returns:
+        list: The combined design.
+    '''
+    if controls != None:
+        from fullcontrol.gcode.state import printer_initialization_data
+        controls.initialize()
+        initialization_data = printer_initialization_data(controls)
+    else:
+        initialization_data = base_settings.default_initial_settings
+    if bed_size == None:
+        bed_size = (initialization_data.get('build_volume_x'), initialization_data.get('build_volume_y'))
+        if None in bed_size:
+            raise Exception('the build plate size is not known for this printer - set bed_size=(x, y) or build_volume_x/y in GcodeControls.initialization_data')
+
+    designs = [flatten(design) for design in designs]
+    offsets = plate_layout(designs, bed_size, spacing, resolution, footprint)
+    if None in offsets:
+        raise Exception(f'designs {[index for index, offset in enumerate(offsets) if offset == None]} do not fit on the build plate ({bed_size[0]} x {bed_size[1]} mm) with spacing {spacing} mm')
+    designs = [move(design, Vector(x=dx, y=dy)) for design, (dx, dy) in zip(designs, offsets)]
+
+    # split designs into chunks: (band, design index, xyz at the start of the chunk, state at the start, steps)
+    chunks = []
+    for index, design in enumerate(designs):
+        printer = Printer(print_speed=initialization_data['print_speed'], travel_speed=initialization_data['travel_speed'])
+        geometry = ExtrusionGeometry(area_model=initialization_data['area_model'], width=initialization_data['extrusion_width'],
+                                     height=initialization_data['extrusion_height'])
+        on, position, band = True, [None, None, None], None
+        start, state, chunk_steps = None, None, []
+        for step in design:
+            if isinstance(step, Point):
+                new_position = [step.x if step.x != None else position[0], step.y if step.y != None else position[1],
+                                step.z if step.z != None else position[2]]
+                new_band = floor(new_position[2]/layer_band + 1e-9) if layer_band != None and new_position[2] != None else band
+                if start == None:
+                    # steps before the first point stay in the first chunk
+                    start, state, band = new_position, (deepcopy(printer), deepcopy(geometry), on), new_band
+                elif new_band != band:
+                    chunks.append((band, index, start, state, chunk_steps))
+                    start, state, band = position, (deepcopy(printer), deepcopy(geometry), on), new_band
+                    chunk_steps = []
+                position = new_position
+            elif isinstance(step, Extruder) and step.on != None:
+                on = step.on
+            elif isinstance(step, Printer):
+                printer.update_from(step)
+            elif isinstance(step, ExtrusionGeometry):
+                geometry.update_from(step)
+            chunk_steps.append(step)
+        if start != None:
+            chunks.append((band, index, start, state, chunk_steps))
+    chunks.sort(key=lambda chunk: (chunk[0] if chunk[0] != None else 0, chunk[1]))
+
+    steps, z_max = [], None
+    for band, index, start, (printer, geometry, on), chunk_steps in chunks:
+        steps.append(Extruder(on=False))
+        if z_max != None:
+            steps.append(Point(z=z_max + z_hop))
+            steps.append(Point(x=start[0], y=start[1], z=z_max + z_hop))
+        steps.append(Point(x=start[0], y=start[1], z=start[2]))
+        steps.extend([printer, geometry, Extruder(on=on)])
+        steps.extend(chunk_steps)
+        z_chunk = max([step.z for step in chunk_steps if isinstance(step, Point) and step.z != None] + [start[2]])
+        z_max = z_chunk if z_max == None else max(z_max, z_chunk)
+    return steps
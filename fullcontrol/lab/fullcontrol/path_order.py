@@ -0,0 +1,271 @@
+import numpy as np
+from math import floor, sqrt
+from fullcontrol import Point, Extruder, flatten
+
+# a design is split into blocks, each starting with Extruder(on=False) and continuing until the next Extruder(on=False).
+# consecutive blocks that only contain Points and Extruder steps, and are all at the same z, form a group that can be
+# printed in any order. any other step (e.g. Printer, ExtrusionGeometry, GcodeComment, ManualGcode) is a barrier that
+# blocks are not moved across. blocks of the form [Extruder(on=False), Point, Extruder(on=True), Point, ...] (a travel
+# to the start of a path, then the path) can also be reversed. each group is ordered by nearest neighbour (with a grid
+# of path ends instead of a KD-tree, so scipy isn't needed) and then improved with 2-opt moves between nearby paths
+
+
+class EndGrid:
+    '''
+    Uniform grid of the ends of paths, for repeated nearest-neighbour queries as ends are removed. Each end is a
+    candidate entry point for its path.
+    '''
+
+    def __init__(self, xy: np.ndarray, cell_size: float):
+        self.xy, self.cell_size = xy, cell_size
+        self.lower = xy.min(axis=0) if len(xy) > 0 else np.zeros(2)
+        cells = np.floor((xy - self.lower)/cell_size).astype(int)
+        self.shape = tuple((cells.max(axis=0) + 1).tolist()) if len(xy) > 0 else (1, 1)
+        self.cells = {}
+        self.location = {}  # end: (cell, position in the list of the cell)
+        for end, cell in enumerate(map(tuple, cells.tolist())):
+            members = self.cells.setdefault(cell, [])
+            self.location[end] = (cell, len(members))
+            members.append(end)
+
+    def remove(self, end: int):
+        'remove an end from the grid'
+        cell, position = self.location.pop(end)
+        members = self.cells[cell]
+        last = members.pop()
+        if last != end:
+            members[position] = last
+            self.location[last] = (cell, position)
+
+    def nearest(self, xy: tuple) -> int:
+        'return the nearest end to xy, or None if the grid is empty'
+        if not self.location:
+            return None
+        cx, cy = floor((xy[0] - self.lower[0])/self.cell_size), floor((xy[1] - self.lower[1])/self.cell_size)
+        best, best_distance = None, float('inf')
+        for ring in range(max(self.shape) + abs(cx) + abs(cy) + 1):
+            if 8*ring > len(self.location):
+                # when most of the grid is empty, checking the remaining ends directly is faster
+                remaining = np.fromiter(self.location.keys(), dtype=np.int64, count=len(self.location))
+                distances = np.hypot(self.xy[remaining, 0] - xy[0], self.xy[remaining, 1] - xy[1])
+                return int(remaining[np.argmin(distances)])
+            for i in range(cx - ring, cx + ring + 1):
+                step = 1 if abs(i - cx) == ring else 2*ring
+                for j in range(cy - ring, cy + ring + 1, max(step, 1)):
+                    for end in self.cells.get((i, j), ()):
+                        distance = sqrt((self.xy[end, 0] - xy[0])**2 + (self.xy[end, 1] - xy[1])**2)
+                        if distance < best_distance:
+                            best, best_distance = end, distance
+            # ends in the next ring are at least ring*cell_size away
+            if best != None and best_distance <= ring*self.cell_size:
+                return best
+        return best
+
+
+def nearest_neighbour_order(starts: np.ndarray, ends: np.ndarray, reversible: np.ndarray, position: np.ndarray) -> tuple:
+    '''
+    Order paths greedily: from position, repeatedly travel to the nearest start (or end, for reversible paths) of the
+    paths not yet printed. Return arrays (order, flipped) - the index of each path in print order and whether it is
+    printed in reverse.
+    '''
+    n = len(starts)
+    reversible_paths = np.flatnonzero(reversible)
+    # candidate entry points: the start of every path, then the end of every reversible path
+    xy = np.concatenate([starts, ends[reversible_paths]])
+    path_of = np.concatenate([np.arange(n), reversible_paths])
+    other_end = np.full(n, -1)
+    other_end[reversible_paths] = n + np.arange(len(reversible_paths))
+    extent = np.ptp(xy, axis=0).max() if n > 0 else 1
+    grid = EndGrid(xy, max(extent/sqrt(max(len(xy), 1))*2, 1e-9))
+    order, flipped = np.empty(n, dtype=np.int64), np.zeros(n, dtype=bool)
+    current = position.tolist()
+    for k in range(n):
+        entry = grid.nearest(current)
+        path = path_of[entry]
+        order[k], flipped[k] = path, entry >= n
+        grid.remove(path)
+        if other_end[path] >= 0:
+            grid.remove(int(other_end[path]))
+        current = (starts[path] if flipped[k] else ends[path]).tolist()
+    return order, flipped
+
+
+def two_opt(order: np.ndarray, flipped: np.ndarray, starts: np.ndarray, ends: np.ndarray, reversible: np.ndarray,
+            position: np.ndarray, window: int = 30, max_rounds: int = 10) -> tuple:
+    '''
+    Improve an order of paths with 2-opt moves: reversing the run of paths from i to j (and the direction of each one)
+    if that shortens the travel. Only runs of reversible paths of up to 'window' paths are considered. In each round
+    the gain of every move is calculated at once and the best move from each position is applied, in order of gain,
+    unless it overlaps a move already applied.
+    '''
+    order, flipped = order.copy(), flipped.copy()
+    n = len(order)
+    for _ in range(max_rounds):
+        entry = np.where(flipped[:, None], ends[order], starts[order])
+        exit = np.where(flipped[:, None], starts[order], ends[order])
+        previous_exit = np.concatenate([position[None], exit[:-1]])
+        # number of non-reversible paths up to each position, to find runs that only include reversible paths
+        fixed = np.concatenate([[0], np.cumsum(~reversible[order])])
+        # the move (i, j) replaces the links previous_exit[i] -> entry[i] and exit[j] -> entry[j+1] with
+        # previous_exit[i] -> exit[j] and entry[i] -> entry[j+1]. the link after the last path has no length
+        link = np.hypot(*(previous_exit - entry).T)
+        next_entry = np.concatenate([entry[1:], [[np.nan, np.nan]]])
+        link_next = np.nan_to_num(np.hypot(*(exit - next_entry).T))
+        # best move (largest gain) starting at each position i
+        best_gain, best_j = np.zeros(n), np.zeros(n, dtype=np.int64)
+        for d in range(min(window, n)):
+            m = n - d  # moves (i, i+d) for i in 0 .. m-1
+            new = np.hypot(previous_exit[:m, 0] - exit[d:, 0], previous_exit[:m, 1] - exit[d:, 1]) \
+                + np.nan_to_num(np.hypot(entry[:m, 0] - next_entry[d:, 0], entry[:m, 1] - next_entry[d:, 1]))
+            gain = link[:m] + link_next[d:] - new
+            gain[fixed[d + 1:] - fixed[:m] != 0] = 0
+            better = np.flatnonzero(gain > best_gain[:m])
+            best_gain[better], best_j[better] = gain[better], better + d
+        improving = np.flatnonzero(best_gain > 1e-9)
+        if len(improving) == 0:
+            break
+        moves = np.stack([best_gain[improving], improving, best_j[improving]], axis=1)
+        # moves are applied to python lists, which is faster than numpy for many small reversals
+        used = [False]*(n + 2)  # positions -1 .. n, offset by 1
+        order_list, flipped_list = order.tolist(), flipped.tolist()
+        applied = 0
+        for gain, i, j in moves[np.argsort(-moves[:, 0])].tolist():
+            i, j = int(i), int(j)
+            # a move changes the links either side of the run, so moves must not share any paths or neighbours
+            if any(used[i:j + 3]):
+                continue
+            used[i:j + 3] = [True]*(j - i + 3)
+            order_list[i:j + 1] = order_list[i:j + 1][::-1]
+            flipped_list[i:j + 1] = [not flip for flip in flipped_list[i:j + 1][::-1]]
+            applied += 1
+        order, flipped = np.array(order_list, dtype=np.int64), np.array(flipped_list, dtype=bool)
+        if applied == 0:
+            break
+    return order, flipped
+
+
+def travel_distance(order: np.ndarray, flipped: np.ndarray, starts: np.ndarray, ends: np.ndarray, position: np.ndarray) -> float:
+    'return the total travel distance to print paths in the given order (starting from position)'
+    entry = np.where(flipped[:, None], ends[order], starts[order])
+    exit = np.where(flipped[:, None], starts[order], ends[order])
+    return float(np.linalg.norm(entry - np.concatenate([position[None], exit[:-1]]), axis=1).sum())
+
+
+def full_point(point: Point, xyz: list) -> Point:
+    'return point if x, y and z are all defined, otherwise a copy of it with them defined'
+    if point.x != None and point.y != None and point.z != None:
+        return point
+    return point.with_(x=xyz[0], y=xyz[1], z=xyz[2])
+
+
+def order_paths(steps: list, window: int = 30, reverse: bool = True, z_tolerance: float = 1e-6, report: bool = False) -> list:
+    '''
+    Reorder independent paths in a design to reduce travel distance.
+
+    A path is a block of steps from an Extruder(on=False) to the next Extruder(on=False), e.g. as created by
+    fc.travel_to() followed by a list of points. Consecutive blocks containing only Points and Extruder steps, all at the
+    same z, are reordered. Any other step (Printer, ExtrusionGeometry, GcodeComment, etc.) is a barrier that paths are
+    not moved across, so it can be used to keep parts of a design in order. Paths are ordered by nearest neighbour and
+    then improved with 2-opt moves between paths up to 'window' positions apart. Paths of the form
+    [Extruder(on=False), Point, Extruder(on=True), Point, ...] may be printed in reverse if reverse is True.
+
+    Args:
+        steps (list): The design.
+        window (int, optional): Maximum number of paths reversed in one 2-opt move. Defaults to 30.
+        reverse (bool, optional): Whether paths may be printed in reverse. Defaults to True.
+        z_tolerance (float, optional): Tolerance for paths to be considered at the same z. Defaults to 1e-6.
+        report (bool, optional): Whether to print the travel distance before and after reordering. Defaults to False.
+
+    Returns:
+        list: The reordered design. The first Point of each moved path (and the first Point after each reordered group)
+        has x, y and z defined, since the position before it may change.
+    '''
+    steps = flatten(steps)
+    # find blocks and the position (forward-filled xyz) of every Point
+    positions, position = [], [None, None, None]
+    block_starts = []
+    for index, step in enumerate(steps):
+        if isinstance(step, Point):
+            position = [step.x if step.x != None else position[0], step.y if step.y != None else position[1],
+                        step.z if step.z != None else position[2]]
+            positions.append(position)
+        else:
+            positions.append(None)
+            if isinstance(step, Extruder) and step.on == False:
+                block_starts.append(index)
+    block_ends = block_starts[1:] + [len(steps)]
+
+    # describe each block: (first step, end step, movable, reversible, z, start xyz, end xyz)
+    blocks = []
+    for first, end in zip(block_starts, block_ends):
+        block = steps[first:end]
+        # the block ends at the first barrier step
+        barrier = next((k for k, step in enumerate(block) if not isinstance(step, (Point, Extruder))), len(block))
+        points = [positions[first + k] for k, step in enumerate(block[:barrier]) if isinstance(step, Point)]
+        if barrier < len(block) or not points or any(None in point for point in points):
+            blocks.append((first, first + barrier, False, False, None, None, None))
+            if barrier < len(block):
+                blocks.append((first + barrier, end, False, False, None, None, None))
+            continue
+        z = [point[2] for point in points]
+        planar = max(z) - min(z) <= z_tolerance
+        reversible = reverse and len(block) >= 3 and isinstance(block[1], Point) \
+            and isinstance(block[2], Extruder) and block[2].on == True and all(isinstance(step, Point) for step in block[3:])
+        blocks.append((first, end, planar, reversible, z[0], points[0], points[-1]))
+
+    # groups of consecutive movable blocks at the same z
+    groups, group = [], []
+    for block in blocks:
+        if group and (not block[2] or abs(block[4] - group[0][4]) > z_tolerance):
+            groups.append(group)
+            group = []
+        if block[2]:
+            group.append(block)
+    if group:
+        groups.append(group)
+
+    # the first Point after each reordered group is fully defined, since the position before it changes
+    group_index, fill = {}, set()
+    for n, group in enumerate(groups):
+        if len(group) >= 2:
+            group_index[group[0][0]] = n
+            fill.add(next((k for k in range(group[-1][1], len(steps)) if isinstance(steps[k], Point)), None))
+
+    new_steps = steps[:block_starts[0]] if block_starts else list(steps)
+    before, after, skip_to = 0, 0, 0
+    for block in blocks:
+        first, end = block[0], block[1]
+        if first < skip_to:
+            continue
+        if first not in group_index:
+            new_steps.extend(full_point(step, positions[k]) if k in fill and None not in positions[k] else step
+                             for k, step in enumerate(steps[first:end], first))
+            continue
+        group = groups[group_index[first]]
+        skip_to = group[-1][1]
+        previous = next((positions[k] for k in range(first - 1, -1, -1) if positions[k] != None), None)
+        # paths in a group are at the same z, so only xy is needed
+        starts, ends = np.array([b[5][:2] for b in group], dtype=float), np.array([b[6][:2] for b in group], dtype=float)
+        reversible = np.array([b[3] for b in group], dtype=bool)
+        position = np.array(previous[:2] if previous != None and None not in previous else group[0][5][:2], dtype=float)
+        order, flipped = nearest_neighbour_order(starts, ends, reversible, position)
+        order, flipped = two_opt(order, flipped, starts, ends, reversible, position, window)
+        before += travel_distance(np.arange(len(group)), np.zeros(len(group), dtype=bool), starts, ends, position)
+        after += travel_distance(order, flipped, starts, ends, position)
+        for path, flip in zip(order.tolist(), flipped.tolist()):
+            b_first, b_end = group[path][0], group[path][1]
+            if flip:
+                points = [full_point(steps[k], positions[k]) for k in range(b_end - 1, b_first, -1) if isinstance(steps[k], Point)]
+                new_steps.extend([steps[b_first], points[0], steps[b_first + 2]] + points[1:])
+            else:
+                k = next(k for k in range(b_first, b_end) if isinstance(steps[k], Point))
+                new_steps.extend(steps[b_first:k] + [full_point(steps[k], positions[k])] + steps[k + 1:b_end])
+
+        # the extruder finishes in the state it had at the end of the group
+        def final_extruder_state(block):
+            return next(steps[k].on for k in range(block[1] - 1, block[0] - 1, -1) if isinstance(steps[k], Extruder) and steps[k].on != None)
+        if final_extruder_state(group[order[-1]]) != final_extruder_state(group[-1]):
+            new_steps.append(Extruder(on=final_extruder_state(group[-1])))
+    if report:
+        print(f'order_paths: travel between reordered paths reduced from {before:.1f} mm to {after:.1f} mm')
+    return new_steps
@@ -0,0 +1,329 @@
+import asyncio
+import os
+import random
+from typing import Iterable, Callable
+from lab.fullcontrol.controlcode_formats.steps2controlcode import GcodeStats
+from fullcontrol import GcodeControls
+
+# real-time streaming of gcode to a printer, with the ok-based flow control used by marlin-style firmware over serial:
+# each line is answered with 'ok' once the printer has accepted it (into its planner buffer), so the sender keeps a
+# limited number of lines in flight. lines are numbered and checksummed so the printer can request resends
+
+
+def checksum(text: str) -> int:
+    'return the marlin/reprap checksum of a line of gcode (xor of all characters)'
+    result = 0
+    for byte in text.encode():
+        result ^= byte
+    return result
+
+
+def code_lines(lines: Iterable[str]):
+    'yield the code (without comments or blank lines) of each line of gcode. lines containing several lines are split'
+    for line in lines:
+        for sub_line in line.split('\n'):
+            code = sub_line.split(';', 1)[0].strip()
+            if code:
+                yield code
+
+
+async def open_fd(fd: int):
+    'return an asyncio (StreamReader, StreamWriter) pair for a file descriptor (e.g. of a serial device or pty)'
+    loop = asyncio.get_running_loop()
+    os.set_blocking(fd, False)
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, 'rb', buffering=0))
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, os.fdopen(os.dup(fd), 'wb', buffering=0))
+    return reader, asyncio.StreamWriter(transport, protocol, reader, loop)
+
+
+async def open_device(path: str, baudrate: int = None):
+    'open a serial device or pty in raw mode (with baudrate if supplied) and return an asyncio (StreamReader, StreamWriter) pair'
+    # termios and tty are posix-only, so they are imported here to keep this module importable on windows (where
+    # printers can still be reached over a socket)
+    import termios, tty
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+    tty.setraw(fd)
+    if baudrate != None:
+        attributes = termios.tcgetattr(fd)
+        attributes[4] = attributes[5] = getattr(termios, f'B{baudrate}')
+        termios.tcsetattr(fd, termios.TCSANOW, attributes)
+    return await open_fd(fd)
+
+
+async def open_printer(address: str, baudrate: int = 115200):
+    'connect to a printer at address: "host:port" for a socket or the path of a serial device/pty'
+    if ':' in address and not address.startswith('/'):
+        host, port = address.rsplit(':', 1)
+        return await asyncio.open_connection(host, int(port))
+    return await open_device(address, baudrate)
+
+
+class GcodeSender:
+    '''
+    Stream lines of gcode to a printer, pulling lines from an iterable (e.g. a generator) only as the printer is ready
+    for them, so printing starts before all gcode has been generated.
+
+    Up to 'window' lines are in flight (sent but not acknowledged with 'ok') at any time. With line_numbers=True, lines
+    are sent as 'N<number> <code>*<checksum>' and 'Resend: <number>' requests from the printer are handled. Sending can
+    be paused and resumed (lines already sent to the printer are still printed). progress() returns the number of lines
+    sent and acknowledged, and the position, estimated print time and filament use of the acknowledged lines.
+    '''
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, window: int = 4, line_numbers: bool = True, timeout: float = 60):
+        self.reader, self.writer = reader, writer
+        self.window = window
+        self.line_numbers = line_numbers
+        self.timeout = timeout
+        self.history = {}  # line number: code, for lines that may need to be resent
+        self.next_number = 1  # line number of the next line to send (lower than the last line sent after a resend request)
+        self.in_flight = []  # [line number, code, accepted] for lines sent but not yet acknowledged
+        self.sent = 0  # number of lines sent (including resends)
+        self.acknowledged = 0  # number of lines accepted by the printer
+        self.stats = GcodeStats()
+        self.resume_event = asyncio.Event()
+        self.resume_event.set()
+        self.ok_event = asyncio.Event()
+
+    def pause(self):
+        'stop sending new lines'
+        self.resume_event.clear()
+
+    def resume(self):
+        'continue sending lines'
+        self.resume_event.set()
+
+    @property
+    def paused(self) -> bool:
+        return not self.resume_event.is_set()
+
+    def progress(self) -> dict:
+        'return the progress of streaming. position, print time and filament are for lines acknowledged by the printer'
+        return {'lines_sent': self.sent, 'lines_acknowledged': self.acknowledged, 'paused': self.paused,
+                'position': dict(self.stats.position), 'print_time': self.stats.seconds, 'filament_mm': self.stats.filament_mm}
+
+    async def listen(self):
+        'read responses from the printer: "ok" acknowledges the oldest line in flight and "Resend: n" rejects it'
+        while True:
+            response = await self.reader.readline()
+            if not response:
+                raise Exception('connection to printer closed')
+            response = response.decode(errors='replace').strip()
+            if response.startswith('ok'):
+                if self.in_flight:
+                    number, code, accepted = self.in_flight.pop(0)
+                    if accepted:
+                        self.stats.update(code)
+                        self.acknowledged += 1
+                self.ok_event.set()
+            elif response.lower().startswith(('resend:', 'rs ')) and self.in_flight:
+                number = int(response.replace(':', ' ').split()[1])
+                self.in_flight[0][2] = False
+                # the printer rejects every line after a bad line (requesting the same line each time), so only
+                # rewind if the requested line has not already been resent
+                if all(entry[0] != number for entry in self.in_flight[1:]):
+                    self.next_number = number
+
+    async def wait_for_ok(self, listener: asyncio.Task):
+        'wait for the next acknowledgement from the printer'
+        self.ok_event.clear()
+        ok = asyncio.ensure_future(self.ok_event.wait())
+        done, _ = await asyncio.wait({ok, listener}, timeout=self.timeout, return_when=asyncio.FIRST_COMPLETED)
+        if listener in done:
+            ok.cancel()
+            listener.result()  # raises the exception from listen()
+        if not done:
+            ok.cancel()
+            raise Exception(f'no response from printer for {self.timeout} seconds')
+
+    async def ready(self, listener: asyncio.Task):
+        'wait until sending is not paused and fewer than "window" lines are in flight'
+        while True:
+            await self.resume_event.wait()
+            if len(self.in_flight) < self.window:
+                return
+            await self.wait_for_ok(listener)
+
+    async def write(self, number: int, code: str):
+        text = f'N{number} {code}' if self.line_numbers else code
+        if self.line_numbers:
+            text = f'{text}*{checksum(text)}'
+        # added to in_flight before writing, since the acknowledgement may arrive while waiting for drain()
+        self.in_flight.append([number, code, True])
+        self.sent += 1
+        self.writer.write((text + '\n').encode())
+        await self.writer.drain()
+
+    async def resend_next(self):
+        number = self.next_number
+        self.next_number += 1
+        await self.write(number, self.history[number])
+
+    async def send(self, code: str, listener: asyncio.Task):
+        'send a new line once the printer is ready, first resending any lines rejected by the printer'
+        await self.ready(listener)
+        while self.next_number in self.history:
+            await self.resend_next()
+            await self.ready(listener)
+        number = self.next_number
+        if self.line_numbers:
+            self.history[number] = code
+            # lines can only be rejected while in flight, so older lines do not need to be kept
+            self.history.pop(number - 2*self.window - 16, None)
+        self.next_number += 1
+        await self.write(number, code)
+
+    async def stream(self, lines: Iterable[str], progress_callback: Callable = None, progress_interval: int = 1000) -> dict:
+        '''
+        Send all lines (comments and blank lines are skipped), then wait for the printer to acknowledge them. Returns
+        the final progress. progress_callback(progress dict) is called every progress_interval lines if supplied.
+        '''
+        listener = asyncio.create_task(self.listen())
+        try:
+            if self.line_numbers:
+                await self.write(0, 'M110 N0')  # reset the line number of the printer
+            for i, code in enumerate(code_lines(lines)):
+                await self.send(code, listener)
+                if progress_callback != None and (i + 1) % progress_interval == 0:
+                    progress_callback(self.progress())
+            while self.in_flight or self.next_number in self.history:
+                if self.next_number in self.history and len(self.in_flight) < self.window:
+                    await self.resume_event.wait()
+                    await self.resend_next()
+                else:
+                    await self.wait_for_ok(listener)
+        finally:
+            listener.cancel()
+        if progress_callback != None:
+            progress_callback(self.progress())
+        return self.progress()
+
+
+class VirtualPrinter:
+    '''
+    Simulated printer for testing gcode streaming offline, using the marlin-style protocol of GcodeSender.
+
+    Received lines are checked (line number and checksum, if present) and added to a planner buffer of buffer_size
+    lines, and 'ok' is sent once a line has been added (so the sender is held back while the buffer is full). Lines are
+    'executed' from the buffer one at a time, taking the time the move would take (estimated from distance and
+    feedrate) multiplied by time_scale (0 for no delay). A fraction error_rate of lines are treated as corrupted (to
+    test resends). Executed lines are saved in the list 'executed' and the position is available in stats.position.
+    '''
+
+    def __init__(self, buffer_size: int = 16, time_scale: float = 0, error_rate: float = 0, seed: int = 0):
+        self.buffer_size = buffer_size
+        self.time_scale = time_scale
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.executed = []
+        self.stats = GcodeStats()
+        self.expected_number = 1
+        self.errors = 0
+
+    def check(self, line: str):
+        'return (code, None) for a valid line or (None, error message) if the line number or checksum is wrong'
+        if not line.startswith('N'):
+            return line, None
+        text, _, received_checksum = line.partition('*')
+        number_text, _, code = text.partition(' ')
+        number = int(number_text[1:])
+        if received_checksum == '' or int(received_checksum) != checksum(text) or self.random.random() < self.error_rate:
+            return None, f'Error:checksum mismatch, Last Line: {self.expected_number - 1}'
+        if code.startswith('M110'):
+            self.expected_number = number + 1
+            return code, None
+        if number != self.expected_number:
+            return None, f'Error:Line Number is not Last Line Number+1, Last Line: {self.expected_number - 1}'
+        self.expected_number += 1
+        return code, None
+
+    async def execute(self, buffer: asyncio.Queue):
+        while True:
+            code = await buffer.get()
+            seconds = self.stats.seconds
+            self.stats.update(code)
+            self.executed.append(code)
+            if self.time_scale > 0:
+                await asyncio.sleep((self.stats.seconds - seconds)*self.time_scale)
+            buffer.task_done()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        'communicate with a sender until the connection is closed'
+        buffer = asyncio.Queue(self.buffer_size)
+        executor = asyncio.create_task(self.execute(buffer))
+        writer.write(b'start\n')
+        try:
+            while line := await reader.readline():
+                code, error = self.check(line.decode(errors='replace').strip())
+                if error != None:
+                    self.errors += 1
+                    writer.write(f'{error}\nResend: {self.expected_number}\nok\n'.encode())
+                else:
+                    if code.split(' ', 1)[0] not in ('M110', ''):
+                        await buffer.put(code)
+                    writer.write(b'ok\n')
+                await writer.drain()
+            await buffer.join()
+        finally:
+            executor.cancel()
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 0) -> asyncio.AbstractServer:
+        'start a socket server for the virtual printer. the address is f"{host}:{server.sockets[0].getsockname()[1]}"'
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def serve_pty(self) -> str:
+        'start the virtual printer on a pseudo-terminal and return the path of the device for the sender to open'
+        import tty  # posix-only (see open_device)
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        self.slave = slave  # kept open so the pty stays available between connections
+        reader, writer = await open_fd(master)
+        self.task = asyncio.create_task(self.handle(reader, writer))
+        return os.ttyname(slave)
+
+
+async def stream_async(steps: list, address: str, gcode_controls: GcodeControls = None, window: int = 4, line_numbers: bool = True,
+                       baudrate: int = 115200, progress_callback: Callable = None, sender_callback: Callable = None) -> dict:
+    '''
+    Generate gcode from a fullcontrol design and stream it to a printer as it is generated (see stream()).
+    sender_callback(sender) is called once the GcodeSender is created, e.g. to keep a reference for pause()/resume().
+    '''
+    from fullcontrol.common import fix
+    from fullcontrol.gcode.steps2gcode import gcode_lines
+    if gcode_controls == None:
+        gcode_controls = GcodeControls()
+    steps = fix(steps, 'gcode', gcode_controls)
+    reader, writer = await open_printer(address, baudrate)
+    try:
+        sender = GcodeSender(reader, writer, window, line_numbers)
+        if sender_callback != None:
+            sender_callback(sender)
+        return await sender.stream(gcode_lines(steps, gcode_controls, show_tips=False), progress_callback)
+    finally:
+        writer.close()
+
+
+def stream(steps: list, address: str, gcode_controls: GcodeControls = None, window: int = 4, line_numbers: bool = True,
+           baudrate: int = 115200, progress_callback: Callable = None) -> dict:
+    '''
+    Generate gcode from a fullcontrol design and stream it to a printer in real time. Lines of gcode are generated only
+    as the printer is ready for them (ok-based flow control with up to 'window' lines in flight), so printing begins
+    before generation finishes.
+
+    Args:
+        steps (list): The fullcontrol design.
+        address (str): "host:port" for a socket connection, or the path of a serial device or pty (e.g. '/dev/ttyUSB0').
+        gcode_controls (GcodeControls, optional): Controls for gcode generation. Defaults to GcodeControls().
+        window (int, optional): Maximum number of lines sent but not yet acknowledged. Defaults to 4.
+        line_numbers (bool, optional): Whether to send line numbers and checksums (and handle resend requests). Defaults to True.
+        baudrate (int, optional): Baudrate for serial devices. Defaults to 115200.
+        progress_callback (Callable, optional): Called with a progress dictionary every 1000 lines and at the end.
+
+    Returns:
+        dict: The final progress (lines sent and acknowledged, position, estimated print time and filament use).
+
+    Use stream_async() in a running event loop (e.g. jupyter notebooks), where pause() and resume() of the sender are
+    available via sender_callback.
+    '''
+    return asyncio.run(stream_async(steps, address, gcode_controls, window, line_numbers, baudrate, progress_callback))
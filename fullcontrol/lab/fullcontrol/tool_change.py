@@ -0,0 +1,215 @@
+import re
+from copy import deepcopy
+from typing import Optional
+from fullcontrol.common import BaseModelPlus
+from fullcontrol import Point, Printer, Extruder, ExtrusionGeometry, StationaryExtrusion, ManualGcode, flatten
+
+# a multi-tool design is split into chunks of steps printed with one tool. a chunk ends at each tool change, at the
+# start of each region (each layer - i.e. wherever z changes - or only at barriers) and at each barrier: any step other
+# than Points, Printer/ExtrusionGeometry/Extruder/StationaryExtrusion steps and tool changes (e.g. GcodeComment, Fan,
+# Hotend or other ManualGcode), which stays in place and can be used to define regions. within each region, chunks
+# are grouped by tool (keeping their order within each tool) and the order of the tool groups is chosen to minimise
+# tool changes over the whole design: a dynamic programme over regions chooses the tool each region finishes with, so
+# the last tool of a region is carried into the next region where possible
+
+
+class ToolChange(BaseModelPlus):
+    """
+    Change to another tool of a multi-tool printer ('T' gcode), optionally purging material from the new tool.
+
+    If purge_point is set, the nozzle travels there (with the extruder off) to purge and the extruder is left off, so
+    the design should travel to its next path. Otherwise the new tool is purged where it is.
+    """
+    tool: Optional[int] = None
+    purge_volume: Optional[float] = None  # mm3
+    purge_speed: Optional[float] = None  # speed of E for purging (see StationaryExtrusion)
+    purge_point: Optional[Point] = None
+
+    def get_dummy_objects(self):
+        'create pseudo objects (for desktop 3D printing FullControl) for the tool change and purge'
+        dummy_objects = [ManualGcode(text=f'T{self.tool} ; change tool')]
+        if self.purge_volume:
+            if self.purge_point != None:
+                dummy_objects.extend([Extruder(on=False), self.purge_point])
+            dummy_objects.append(StationaryExtrusion(volume=self.purge_volume, speed=self.purge_speed or 300))
+        return dummy_objects
+
+    def gcode(self, state):
+        gcode = [dummy_object.gcode(state) for dummy_object in self.get_dummy_objects()]
+        gcode = [item for item in gcode if item is not None]
+        if len(gcode) > 0: return('\n'.join(gcode))
+
+    def visualize(self, state, plot_data, plot_controls):
+        [dummy_object.visualize(state, plot_data, plot_controls) for dummy_object in self.get_dummy_objects()]
+
+
+def tool_of(step) -> int:
+    'return the tool selected by a step (ToolChange or ManualGcode like "T1"), or None if it is not a tool change'
+    if isinstance(step, ToolChange):
+        return step.tool
+    if isinstance(step, ManualGcode) and step.text != None:
+        match = re.fullmatch(r'\s*T(\d+)\s*(;.*)?', step.text)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def tool_sequence(region_tools: list, first_tool: int) -> list:
+    '''
+    Return the order of tools for each region (region_tools is a list of the tools used in each region, in order of
+    first use) that minimises the number of tool changes, starting with first_tool. Within a region, each tool is used
+    once: the tool carried in from the previous region first (if it is used), then the others in order of first use,
+    with the tool the region finishes with chosen by a dynamic programme over regions.
+    '''
+    # changes[tool] = fewest tool changes to finish the regions so far with tool. choices[region][tool] = (previous
+    # tool, order of tools in the region) for that
+    changes, choices = {first_tool: 0}, []
+    for tools in region_tools:
+        if not tools:
+            choices.append(None)
+            continue
+        new_changes, choice = {}, {}
+        for entry, entry_changes in changes.items():
+            for last in tools:
+                if last == entry and len(tools) > 1:
+                    continue  # the entry tool is used first, so it can only be last if it's the only tool
+                middle = [tool for tool in tools if tool not in (entry, last)]
+                order = ([entry] if entry in tools and entry != last else []) + middle + [last]
+                total = entry_changes + len(order) - (order[0] == entry)
+                if last not in new_changes or total < new_changes[last]:
+                    new_changes[last], choice[last] = total, (entry, order)
+        changes = new_changes
+        choices.append(choice)
+    # trace back from the tool with the fewest changes at the end
+    sequences, tool = [], min(changes, key=changes.get)
+    for choice in reversed(choices):
+        if choice == None:
+            sequences.append([])
+            continue
+        tool, order = choice[tool]
+        sequences.append(order)
+    return sequences[::-1]
+
+
+def schedule_tools(steps: list, regions: str = 'layers', first_tool: int = 0, purge_volume: float = None,
+                   purge_speed: float = None, purge_point: Point = None, z_tolerance: float = 1e-6, report: bool = False) -> list:
+    '''
+    Reorder a multi-tool design to minimise tool changes. Tool changes in the design are ToolChange steps or
+    ManualGcode steps like fc.ManualGcode(text='T1'). The parts of the design printed with each tool are grouped within
+    each region, the tool groups are ordered so that the last tool of each region is carried into the next region where
+    possible, and ToolChange steps (with an optional purge) are added where the tool changes.
+
+    Args:
+        steps (list): The design.
+        regions (str, optional): 'layers' to reorder within each layer (regions end wherever z changes and at
+            barriers) or 'barriers' to reorder between barriers only - any step that isn't a Point, Printer,
+            ExtrusionGeometry, Extruder, StationaryExtrusion or tool change (e.g. fc.GcodeComment(text='region')).
+            Beware of collisions with parts printed at other z with 'barriers'. Defaults to 'layers'.
+        first_tool (int, optional): The tool selected before the design (e.g. by the printer's starting procedure).
+            Defaults to 0.
+        purge_volume (float, optional): Volume (mm3) to purge after each tool change. Defaults to None (no purge).
+        purge_speed (float, optional): Speed of purging (see ToolChange). Defaults to None.
+        purge_point (Point, optional): Where to purge (see ToolChange). Defaults to None (in place).
+        z_tolerance (float, optional): Tolerance for points to be considered in the same layer. Defaults to 1e-6.
+        report (bool, optional): Whether to print the number of tool changes before and after scheduling. Defaults to False.
+
+    Returns:
+        list: The reordered design. Each moved chunk of steps starts with a travel to the position it started from
+        and restores the print speeds, extrusion geometry and extruder on/off it started with.
+    '''
+    if regions not in ('layers', 'barriers'):
+        raise ValueError(f"regions must be 'layers' or 'barriers', not {regions!r}")
+    steps = flatten(steps)
+    # split the design into chunks: [region, tool, xyz at the start, state at the start, steps, whether it extrudes]
+    chunks, region = [], 0
+    printer, geometry = Printer(), ExtrusionGeometry()
+    tool, on, position, region_z = first_tool, None, [None, None, None], None
+    chunk, original_changes, region_ends = None, 0, set()
+
+    def add(step):
+        nonlocal chunk, position, on
+        if chunk == None:
+            chunk = [region, tool, list(position), (deepcopy(printer), deepcopy(geometry), on), [], False]
+            chunks.append(chunk)
+        chunk[4].append(step)
+        chunk[5] = chunk[5] or (isinstance(step, Point) and on == True) or isinstance(step, StationaryExtrusion)
+        if isinstance(step, Point):
+            position = [step.x if step.x != None else position[0], step.y if step.y != None else position[1],
+                        step.z if step.z != None else position[2]]
+        elif isinstance(step, Extruder) and step.on != None:
+            on = step.on
+        elif isinstance(step, Printer):
+            printer.update_from(step)
+        elif isinstance(step, ExtrusionGeometry):
+            geometry.update_from(step)
+
+    def new_region():
+        nonlocal chunk, region
+        chunk, region = None, region + 1
+
+    for step in steps:
+        new_tool = tool_of(step)
+        if new_tool != None:
+            original_changes += new_tool != tool
+            tool, chunk = new_tool, None
+        elif not isinstance(step, (Point, Printer, ExtrusionGeometry, Extruder, StationaryExtrusion)):
+            # barriers are a region of their own
+            new_region()
+            add(step)
+            new_region()
+        elif isinstance(step, Point) and regions == 'layers' and step.z != None and region_z != None and abs(step.z - region_z) > z_tolerance:
+            region_z = step.z
+            if on == False and chunk != None:
+                # a travel to a new layer is a chunk of its own at the end of the previous region, so chunks moved
+                # within the new layer start in it
+                chunk = None
+                add(step)
+                region_ends.add(len(chunks) - 1)
+                new_region()
+            else:
+                new_region()
+                add(step)
+        else:
+            if isinstance(step, Point) and region_z == None and step.z != None:
+                region_z = step.z
+            add(step)
+
+    # chunks that don't extrude (barriers and travel) don't need a tool - they stay after the previous extruding chunk
+    # of their region, or are printed first in their region if there isn't one. travel to the next layer is printed
+    # after all of its region, whichever tool finishes the region
+    region_tools, region_chunks, last_region, last_tool = [[] for _ in range(region + 1)], {}, None, None
+    for index, (chunk_region, chunk_tool, *_, extrudes) in enumerate(chunks):
+        if chunk_region != last_region:
+            last_region, last_tool = chunk_region, None
+        if extrudes:
+            last_tool = chunk_tool
+            if chunk_tool not in region_tools[chunk_region]:
+                region_tools[chunk_region].append(chunk_tool)
+        region_chunks.setdefault((chunk_region, 'end' if index in region_ends else last_tool), []).append(index)
+    sequences = tool_sequence(region_tools, first_tool)
+
+    new_steps, tool, previous, changes = [], first_tool, -1, 0
+    for region, order in enumerate(sequences):
+        region_order = [None] + order + ['end']
+        for index in [index for region_tool in region_order for index in region_chunks.get((region, region_tool), [])]:
+            chunk_tool, start, (chunk_printer, chunk_geometry, chunk_on), chunk_steps, extrudes = chunks[index][1:]
+            if extrudes and chunk_tool != tool:
+                new_steps.append(ToolChange(tool=chunk_tool, purge_volume=purge_volume, purge_speed=purge_speed, purge_point=purge_point))
+                tool, changes = chunk_tool, changes + 1
+            elif index == previous + 1:
+                # the chunk follows on from the same steps as in the original design
+                new_steps.extend(chunk_steps)
+                previous = index
+                continue
+            # travel to the start of the chunk and restore the state it started with
+            new_steps.append(Extruder(on=False))
+            if None not in start and index not in region_ends:
+                new_steps.append(Point(x=start[0], y=start[1], z=start[2]))
+            new_steps.extend([deepcopy(chunk_printer), deepcopy(chunk_geometry)])
+            if chunk_on != None:
+                new_steps.append(Extruder(on=chunk_on))
+            new_steps.extend(chunk_steps)
+            previous = index
+    if report:
+        print(f'schedule_tools: tool changes reduced from {original_changes} to {changes}')
+    return new_steps
@@ -25,17 +25,11 @@ def transform(steps: list, result_type: str, controls: Union[ModelControls, Gcod
             print("warning: no controls were supplied to fclab.transform(). it's advisable to supply fclab.ModelControls. the simulated extrusion width and height may be incorrect")
             geometry_model(steps, ModelControls())
     elif result_type == 'laser_cutter_gcode':
-        import re
+        from lab.fullcontrol.laser.steps2lasergcode import laser_gcode
+        from fullcontrol.common import fix
 
-        def remove_terms_from_gcode(gcode, term_characters):
-            pattern = r'[' + ''.join(term_characters) + r']\d*\.?\d+ ?'
-            return re.sub(pattern, '', gcode)
-        
         if controls is None: controls = GcodeControls()
 
-        # don't allow the gcode function to save gcode since we will modify it after generation
-        if controls.save_as == True:
-            raise Exception("please set GcodeControl.save_as = False for 'laser_cutter_gcode'")
         # force initialization data as first object in design
         if not isinstance(steps[0], Laser):
             raise Exception("first object in design must be an fclab.Laser() object")
@@ -45,11 +39,9 @@ def transform(steps: list, result_type: str, controls: Union[ModelControls, Gcod
                     raise Exception(f"first object in design (fclab.Laser) must have all attributes set - attribute '{attribute}' is missing")
             if steps[0].constant_power == None and steps[0].dynamic_power == None:
                 raise Exception("first object in design (fclab.Laser) must have either 'constant_power' or 'dynamic_power' set")
-        gcode = transform_original(steps, 'gcode', controls, show_tips)
-        gcode = remove_terms_from_gcode(gcode, ['Z', 'E'])
-        # remove relative extrusion gcode command
-        gcode = gcode.replace("M83 ; relative extrusion\n", "")
-        return gcode
+        # gcode is generated directly in laser format (XY moves, M3/M4 power commands, no Z or E)
+        steps = fix(steps, 'gcode', controls)
+        return laser_gcode(steps, controls, show_tips)
     else:
         raise ValueError(f"result_type '{result_type}' not recognized. Please use 'control_code', '3d_model', 'laser_cutter_gcode', or fc.transform()")
 
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+FullControl Benchmark Suite
+
+This script measures the performance of the whole FullControl pipeline for synthetic designs of different sizes:
+- spiral: a single continuous vase-mode spiral
+- lattice: layers of straight lines in alternating directions, with travel moves between lines
+- multiaxis: a five-axis (XYZBC) spiral with rotating B and C axes
+- cura: the spiral design, transformed with a Cura printer profile
+
+For each design and size, the following stages are measured:
+- construction: creating the list of steps
+- fix: fc.fix() (checks applied before transforming a design)
+- gcode: fc.transform(..., 'gcode')
+- visualize: fc.transform(..., 'plot') with raw_data=True (i.e. without rendering with plotly)
+- mesh: fclab.transform(..., '3d_model') (stl export to a temporary directory)
+The time to import a Cura printer profile (import_printer) is also measured, both when the profile is loaded (cold)
+and when it has already been cached (warm).
+
+Time (best of 'repeats' runs) and peak memory (measured separately with tracemalloc, since it slows execution) are
+recorded and compared against a baseline, with regressions flagged (the script exits with status 1 if there are any
+regressions). The script fails (status 2) if the baseline file is missing or has none of the results, rather than
+reporting no regressions.
+
+benchmark_baseline.json (next to this script) is the default baseline. It was recorded with the default options on
+python 3.11 on a linux x86_64 machine. Times depend on the machine, so CI should record a baseline on
+its own runner with --save-baseline (e.g. from the main branch) and compare against it with --baseline. Use
+--no-compare to run without a baseline (e.g. for other sizes).
+
+Examples:
+    python benchmark.py                                       # sizes 1e3, 1e4, 1e5, compared with benchmark_baseline.json
+    python benchmark.py --sizes 1e3 1e4 1e5 1e6 1e7 --designs spiral --no-compare
+    python benchmark.py --save-baseline baseline.json --no-compare
+    python benchmark.py --baseline baseline.json --tolerance 0.2
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from math import cos, sin, tau
+
+import fullcontrol as fc
+import lab.fullcontrol as fclab
+import lab.fullcontrol.fiveaxis as fc5
+from fullcontrol.gcode.import_printer import import_printer, printer_settings
+
+CURA_PRINTER = 'Cura/Creality Ender-3 / Ender-3 v2'
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+STAGES = ['construction', 'fix', 'gcode', 'visualize', 'mesh']
+
+
+def spiral_design(n):
+    """Continuous vase-mode spiral with n points (100 points per layer)"""
+    return [fc.Point(x=50+20*cos(tau*i/100), y=50+20*sin(tau*i/100), z=0.2+0.2*i/100) for i in range(n)]
+
+
+def lattice_design(n):
+    """Layers of straight lines (alternating x and y directions) with n points in total. Each line is 50 points long
+    and there is a travel move between lines"""
+    steps = []
+    points_per_line, lines_per_layer = 50, 20
+    for line in range(max(1, n // points_per_line)):
+        layer, position = divmod(line, lines_per_layer)
+        z = 0.2 + 0.2*layer
+        offset = 10 + 2*position
+        steps.append(fc.Extruder(on=False))
+        for i in range(points_per_line):
+            along = 10 + 40*i/(points_per_line-1)
+            steps.append(fc.Point(x=along, y=offset, z=z) if layer % 2 == 0 else fc.Point(x=offset, y=along, z=z))
+            if i == 0:
+                steps.append(fc.Extruder(on=True))
+    return steps
+
+
+def multiaxis_design(n):
+    """Five-axis spiral with n points, with the B axis oscillating and the C axis rotating once per layer"""
+    return [fc5.Point(x=20*cos(tau*i/100), y=20*sin(tau*i/100), z=0.2+0.2*i/100, b=15*sin(tau*i/1000), c=360*(i % 100)/100)
+            for i in range(n)]
+
+
+DESIGNS = {
+    'spiral': (spiral_design, fc),
+    'lattice': (lattice_design, fc),
+    'multiaxis': (multiaxis_design, fc5),
+    'cura': (spiral_design, fc),
+}
+
+
+def gcode_controls(design):
+    """GcodeControls for the design"""
+    if design == 'multiaxis':
+        return fc5.GcodeControls()
+    printer_name = CURA_PRINTER if design == 'cura' else 'generic'
+    return fc.GcodeControls(printer_name=printer_name, initialization_data={'extrusion_width': 0.5, 'extrusion_height': 0.2})
+
+
+def stage_function(design, stage, n, steps, folder):
+    """Return a function (with no arguments) that runs the stage for the design"""
+    make_design, module = DESIGNS[design]
+    if stage == 'construction':
+        return lambda: make_design(n)
+    if stage == 'fix':
+        return lambda: fc.fix(steps, 'gcode', gcode_controls(design))
+    if stage == 'gcode':
+        return lambda: module.transform(steps, 'gcode', gcode_controls(design), show_tips=False)
+    if stage == 'visualize':
+        return lambda: module.transform(steps, 'plot', module.PlotControls(raw_data=True), show_tips=False)
+    if stage == 'mesh':
+        controls = dict(stl_filename=os.path.join(folder, 'benchmark'), include_date=False, stl_type='binary')
+        return lambda: fclab.transform(steps, '3d_model', fclab.ModelControls(**controls))
+
+
+def measure(function, repeats, memory):
+    """Return the best time of 'repeats' runs of function and (if memory=True) its peak memory in MB. Output printed
+    by FullControl functions is hidden"""
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        peak_mb = None
+        if memory:
+            tracemalloc.start()
+            function()
+            peak_mb = tracemalloc.get_traced_memory()[1]/1e6
+            tracemalloc.stop()
+    return min(times), peak_mb
+
+
+def run_benchmarks(designs, sizes, stages, repeats, memory, max_plot_size):
+    """Run all benchmarks and return a dictionary of results: {'design/size/stage': {'time': s, 'peak_mb': MB}}"""
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        # printer profiles are cached after they are first loaded, so loading (cold) and cached (warm) imports are
+        # measured separately
+        import_functions = {'cold': lambda: (printer_settings.cache_clear(), import_printer(CURA_PRINTER, {})),
+                            'warm': lambda: import_printer(CURA_PRINTER, {})}
+        for cache, function in import_functions.items():
+            time_taken, peak_mb = measure(function, repeats, memory)
+            results[f'import_printer/{cache}'] = {'time': time_taken, 'peak_mb': peak_mb}
+            print_result(f'import_printer/{cache}', results[f'import_printer/{cache}'])
+        for design in designs:
+            for n in sizes:
+                steps = DESIGNS[design][0](n)
+                for stage in stages:
+                    if stage in ['visualize', 'mesh'] and n > max_plot_size:
+                        continue
+                    if stage == 'mesh' and design == 'multiaxis':
+                        continue  # 3d_model export is not available for multiaxis designs
+                    key = f'{design}/{n}/{stage}'
+                    time_taken, peak_mb = measure(stage_function(design, stage, n, steps, folder), repeats, memory)
+                    results[key] = {'time': time_taken, 'peak_mb': peak_mb}
+                    print_result(key, results[key])
+    return results
+
+
+def print_result(key, result, note=''):
+    """Print a single result"""
+    memory = f"{result['peak_mb']:>10.1f} MB" if result['peak_mb'] is not None else ''
+    print(f"{key:<32}{result['time']:>12.4f} s{memory}  {note}")
+
+
+def compare(results, baseline, tolerance, min_difference):
+    """Compare results against a baseline. A regression is flagged if the time or peak memory has increased by more than
+    'tolerance' (fraction) and by more than 'min_difference' seconds (for time). Returns a list of regression keys"""
+    regressions = []
+    print(f"\nComparison with baseline (tolerance {100*tolerance:.0f}%):")
+    for key, result in results.items():
+        if key not in baseline:
+            print_result(key, result, 'new - not in baseline')
+            continue
+        ref = baseline[key]
+        notes = [f"time {100*(result['time']/ref['time']-1):+.0f}%" if ref['time'] > 0 else '']
+        slower = result['time'] > ref['time']*(1+tolerance) and result['time'] - ref['time'] > min_difference
+        bigger = False
+        if result['peak_mb'] is not None and ref.get('peak_mb'):
+            notes.append(f"memory {100*(result['peak_mb']/ref['peak_mb']-1):+.0f}%")
+            bigger = result['peak_mb'] > ref['peak_mb']*(1+tolerance) and result['peak_mb'] - ref['peak_mb'] > 1
+        if slower or bigger:
+            regressions.append(key)
+            notes.append('REGRESSION')
+        print_result(key, result, ', '.join(notes))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FullControl benchmark suite')
+    parser.add_argument('--designs', nargs='+', default=list(DESIGNS), choices=list(DESIGNS))
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e3, 1e4, 1e5], help='number of points in each design')
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--repeats', type=int, default=3, help='number of timed runs (the best time is recorded)')
+    parser.add_argument('--no-memory', action='store_true', help='skip peak memory measurement (which repeats each stage with tracemalloc)')
+    parser.add_argument('--max-plot-size', type=float, default=1e5, help='largest design size for visualize and mesh stages')
+    parser.add_argument('--output', help='save results to this json file')
+    parser.add_argument('--baseline', default=BASELINE, help='compare results against this json file (default: benchmark_baseline.json)')
+    parser.add_argument('--no-compare', action='store_true', help='do not compare results against a baseline')
+    parser.add_argument('--save-baseline', help='save results as a baseline json file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='fractional increase in time or memory flagged as a regression')
+    parser.add_argument('--min-difference', type=float, default=0.01, help='time increases smaller than this (s) are not flagged')
+    args = parser.parse_args()
+    if not args.no_compare and not os.path.isfile(args.baseline):
+        # check before running, so a missing baseline doesn't pass as 'no regressions'
+        parser.error(f"baseline {args.baseline} not found - record one with --save-baseline, or use --no-compare")
+
+    print("FullControl Benchmark Suite")
+    print("=" * 50)
+    print(f"python {platform.python_version()} on {platform.platform()}")
+    print(f"{'':<32}{'time':>14}{'peak memory':>13}")
+    results = run_benchmarks(args.designs, [int(n) for n in args.sizes], args.stages, args.repeats, not args.no_memory, args.max_plot_size)
+
+    for filename in [args.output, args.save_baseline]:
+        if filename:
+            with open(filename, 'w') as f:
+                json.dump(results, f, indent=1)
+            print(f"\nresults saved to {filename}")
+
+    if not args.no_compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not any(key in baseline for key in results if not key.startswith('import_printer/')):
+            print(f"\nnone of the design results are in the baseline {args.baseline} - no comparison was possible")
+            raise SystemExit(2)
+        regressions = compare(results, baseline, args.tolerance, args.min_difference)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) found: {', '.join(regressions)}")
+            raise SystemExit(1)
+        print("\nno regressions found")
+
+
+if __name__ == "__main__":
+    main()
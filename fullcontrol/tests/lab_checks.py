@@ -0,0 +1,109 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import fullcontrol as fc
+
+
+# usage: run this script in the tests directory with 'python lab_checks.py'
+# quick regression checks for lab features. each check raises an AssertionError if it fails
+
+
+def check_gcode_reader_layers():
+    'a 5-layer design on prusa_i3 (whose start gcode primes at Z10) reads back as layers 0-4, for any chunk size'
+    from lab.fullcontrol.gcode_reader import parse_gcode
+    steps = []
+    for layer in range(5):
+        steps.extend(fc.rectangleXY(fc.Point(x=50, y=50, z=0.2 + 0.2*layer), 10, 10))
+    gcode = fc.transform(steps, 'gcode', fc.GcodeControls(printer_name='prusa_i3'), show_tips=False)
+    data = parse_gcode(gcode)
+    assert np.unique(data.layer).tolist() == [0, 1, 2, 3, 4], np.unique(data.layer)
+    assert np.array_equal(parse_gcode(gcode, chunk_mb=0.0005).layer, data.layer)
+
+
+def check_order_paths_multi_point_travel():
+    'paths whose travel has several Points are movable but not reversible'
+    from lab.fullcontrol.path_order import order_paths
+    P = fc.Point
+    steps = [fc.Extruder(on=False), P(x=0, y=0, z=0.2), P(x=1, y=0, z=0.2), fc.Extruder(on=True), P(x=2),
+             fc.Extruder(on=False), P(x=50, y=0, z=0.2), P(x=51), fc.Extruder(on=True), P(x=52),
+             fc.Extruder(on=False), P(x=3, y=0, z=0.2), fc.Extruder(on=True), P(x=4)]
+    assert [step.x for step in order_paths(steps) if isinstance(step, P)] == [0, 1, 2, 3, 4, 50, 51, 52]
+
+
+def check_offset_dumbbell_split():
+    'an inward offset of a dumbbell splits into two squares when the bar\'s offset edges lie exactly on the squares\''
+    from importlib import import_module
+    offset = import_module('lab.fullcontrol.geometry.offset_path')
+    dumbbell = np.array([[0, 0], [10, 0], [10, 4], [14, 4], [14, 0], [24, 0], [24, 10], [14, 10], [14, 6], [10, 6], [10, 10], [0, 10]], dtype=float)
+    for distance in (2.99, 3, 3.01):
+        loops = offset.offset_polygon(dumbbell, distance)[0]
+        assert len(loops) == 2, (distance, loops)
+        assert np.allclose(offset.polygon_areas(loops), (10 - 2*distance)**2), offset.polygon_areas(loops)
+    loops = offset.offset_polygon(dumbbell[::-1], -3)[0]  # clockwise
+    assert np.allclose(offset.polygon_areas(loops), -16), offset.polygon_areas(loops)
+
+
+
+def check_offset_collapse():
+    'a square collapses to a point at half its width, and larger inward offsets are empty'
+    from importlib import import_module
+    from lab.fullcontrol.geometry import offset_paths
+    offset = import_module('lab.fullcontrol.geometry.offset_path')
+    square = np.array([[0, 0], [10, 0], [10, 10], [0, 10]], dtype=float)
+    distances = [6, 1, 5, 3, 2, 4]
+    areas = [offset.polygon_areas(loops).sum() for loops in offset.offset_polygon(square, distances)]
+    assert np.allclose(areas, [0, 64, 0, 16, 36, 4]), areas
+    steps = offset_paths(fc.rectangleXY(fc.Point(x=0, y=0, z=0), 10, 10), 1, count=6)
+    assert len(steps) == 20 and (steps[-1].x, steps[-1].y) == (4, 4), steps[-5:]
+
+
+
+def check_fill_base_full_cache():
+    'solid layers with the same outline at different z-heights share cached convex geometry'
+    from importlib import import_module
+    from lab.fullcontrol.geometry import fill_base_full
+    convex = import_module('lab.fullcontrol.geometry.convex')
+    convex.convex_cache.clear()
+    steps = fc.helixZ(fc.Point(x=50, y=50, z=0.2), 10, 10, 0, 4, 0.2, 32*4)
+    filled = fill_base_full(steps, 32, 3, 0.5)
+    assert len(convex.convex_cache) == 1, len(convex.convex_cache)
+    layer_z = sorted({round(step.z, 9) for step in filled[33:] if isinstance(step, fc.Point) and step not in steps})
+    assert layer_z == [0.4, 0.6, 0.8], layer_z
+
+
+def check_schedule_tools_layer_order():
+    'with tools alternating along each layer, z never decreases between the reordered chunks of consecutive layers'
+    from lab.fullcontrol.tool_change import schedule_tools
+    P = fc.Point
+    steps = []
+    for layer in range(3):
+        z = 0.2 + 0.2*layer
+        for path, tool in enumerate([0, 1, 0, 1]):
+            steps += [fc.ManualGcode(text=f'T{tool}'), fc.Extruder(on=False), P(x=10*path, y=0, z=z), fc.Extruder(on=True), P(x=10*path + 5, y=0, z=z)]
+        steps += [fc.Extruder(on=False), P(x=0, y=0, z=z + 0.2)]
+    z = [step.z for step in schedule_tools(steps) if isinstance(step, P)]
+    assert all(z2 >= z1 for z1, z2 in zip(z, z[1:])), z
+    assert z[-1] == steps[-1].z, z
+
+
+def check_flow_limited_speeds_tolerance():
+    'flows at max_flow up to floating-point error, or above it, are clamped to pass check_limits\' tolerance'
+    from fullcontrol.gcode.limits import design_arrays, LIMIT_TOLERANCE
+    from fullcontrol.gcode.state import printer_initialization_data
+    from lab.fullcontrol.flow import flow_limited_speeds
+    controls = fc.GcodeControls(printer_name='generic')
+    controls.initialize()
+    initialization_data = printer_initialization_data(controls)
+    rng = np.random.default_rng(0)
+    for width, height, factor in zip(rng.uniform(0.2, 1, 60), rng.uniform(0.05, 0.4, 60), [1, 1 + 1e-12, 1 + 1e-15, 1.5]*15):
+        steps = [fc.ExtrusionGeometry(area_model='rectangle', width=width, height=height), fc.Printer(print_speed=8*60/(width*height)*factor)]
+        arrays = design_arrays(steps + fc.rectangleXY(fc.Point(x=10, y=10, z=0.2), 30, 20), initialization_data)
+        flow = flow_limited_speeds(arrays, max_flow=8)[1:]/60*arrays['area'][1:]
+        assert (flow[arrays['on'][1:]] <= 8*(1 + LIMIT_TOLERANCE)).all(), (width, height, factor, flow.max())
+
+
+if __name__ == '__main__':
+    checks = [function for name, function in list(globals().items()) if name.startswith('check_')]
+    for check in checks:
+        check()
+        print(f'passed: {check.__name__}')